@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Runner message codec benchmark.
+
+Encodes and decodes the messages of a synthetic test run (state changes and
+results of passing tests) with every codec, reports CPU time and frame sizes.
+
+    python benchmarks/bench_codec.py
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'pytui'))
+
+from codec import get_encoder, get_decoder, CODECS
+
+TEST_COUNT = 20000
+BATCH_SIZE = 200
+
+
+def run_messages(test_count):
+    for index in range(test_count):
+        test_id = 'tests/module_{}/test_feature.py::TestFeature::test_case_{}'.format(
+            index // 100, index)
+        for when in ('setup', 'call', 'teardown'):
+            yield 'set_test_state', {'test_id': test_id, 'state': when}
+            yield 'set_test_result', {
+                'test_id': test_id,
+                'output': '',
+                'result_state': 'ok',
+                'when': when,
+                'outcome': 'passed',
+            }
+
+
+def main():
+    messages = list(run_messages(TEST_COUNT))
+    print('{} messages'.format(len(messages)))
+    print('{:>8} {:>10} {:>10} {:>10}'.format('codec', 'encode s', 'decode s', 'MB'))
+    for name in CODECS:
+        encoder = get_encoder(name)
+        start = time.process_time()
+        frames = []
+        for offset in range(0, len(messages), BATCH_SIZE):
+            frames.append(encoder.join([
+                encoder.encode(method, params)
+                for method, params in messages[offset:offset + BATCH_SIZE]
+            ]))
+        encode_time = time.process_time() - start
+
+        decoder = get_decoder(name)
+        start = time.process_time()
+        for frame in frames:
+            decoder.decode(memoryview(frame))
+        decode_time = time.process_time() - start
+
+        print('{:>8} {:>10.3f} {:>10.3f} {:>10.2f}'.format(
+            name, encode_time, decode_time, sum(len(frame) for frame in frames) / 1e6))
+
+
+if __name__ == '__main__':
+    main()
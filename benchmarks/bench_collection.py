@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Collection ingestion benchmark.
+
+Feeds item_collected messages for synthetic node ids into the ui in batches,
+the way the runner sends them, and renders the screen after every batch.
+The former ingestion rebuilt the test list box for every collected item,
+it is measured up to LEGACY_MAX_TESTS tests.
+
+    python benchmarks/bench_collection.py
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'pytui'))
+
+from ui import TestRunnerUI
+from runner import PytestRunner
+
+TEST_COUNTS = [1000, 10000, 100000]
+# messages in a batch, the runner batches up to 64kB of messages
+BATCH_SIZE = 500
+SCREEN_SIZE = (160, 50)
+LEGACY_MAX_TESTS = 10000
+
+
+def node_ids(count):
+    return [
+        'tests/test_module_{}.py::TestClass::test_{}'.format(index // 100, index)
+        for index in range(count)
+    ]
+
+
+def batches(test_ids):
+    for start in range(0, len(test_ids), BATCH_SIZE):
+        yield [
+            ('item_collected', {'item_id': test_id})
+            for test_id in test_ids[start:start + BATCH_SIZE]
+        ]
+
+
+def create_ui():
+    return TestRunnerUI(PytestRunner, False, ['tests'])
+
+
+def close_ui(ui):
+    for channel in ui.channels:
+        channel.close()
+    ui.blobs.close()
+    shutil.rmtree(ui.blob_dir, ignore_errors=True)
+
+
+def batched_ingest(ui, test_ids):
+    channel = ui.channels[0]
+    for batch in batches(test_ids):
+        ui.handle_batch(batch, channel)
+        ui.w_main.render(SCREEN_SIZE, focus=True)
+
+
+def legacy_ingest(ui, test_ids):
+    channel = ui.channels[0]
+    for batch in batches(test_ids):
+        for method, params in batch:
+            ui.handle_message(method, params, channel)
+            ui.init_test_listbox()
+        ui.w_main.render(SCREEN_SIZE, focus=True)
+
+
+def measure(ingest, test_ids):
+    ui = create_ui()
+    try:
+        start = time.time()
+        ingest(ui, test_ids)
+        duration = time.time() - start
+        assert len(ui.w_test_listbox.body) == len(test_ids)
+    finally:
+        close_ui(ui)
+    return duration
+
+
+def main():
+    # the ui keeps its caches relative to cwd
+    work_dir = tempfile.mkdtemp(prefix='pytui-bench-')
+    os.chdir(work_dir)
+    try:
+        print('{:>8} {:>9} {:>10} {:>9}'.format('tests', 'legacy s', 'batched s', 'speedup'))
+        for count in TEST_COUNTS:
+            test_ids = node_ids(count)
+            batched = measure(batched_ingest, test_ids)
+            if count <= LEGACY_MAX_TESTS:
+                legacy = measure(legacy_ingest, test_ids)
+                print('{:>8} {:>9.3f} {:>10.3f} {:>8.0f}x'.format(
+                    count, legacy, batched, legacy / batched))
+            else:
+                print('{:>8} {:>9} {:>10.3f} {:>9}'.format(count, '-', batched, '-'))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
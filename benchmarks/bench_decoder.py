@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Frame decoder microbenchmark.
+
+Feeds multi-megabyte frames in random chunk sizes into transport.FrameDecoder
+and into the former bytes buffer decoder (split on newline, re-slice per frame).
+
+    python benchmarks/bench_decoder.py
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'pytui'))
+
+from transport import FrameDecoder, FRAME_HEADER
+
+PAYLOAD_SIZES = [1000000, 4000000, 16000000]
+MAX_CHUNK_SIZE = 65536
+
+
+def random_chunks(data, rnd):
+    offset = 0
+    while offset < len(data):
+        size = rnd.randint(1, MAX_CHUNK_SIZE)
+        yield data[offset:offset + size]
+        offset += size
+
+
+def legacy_decode(chunks):
+    receive_buffer = b''
+    frames = 0
+    for data in chunks:
+        receive_buffer += data
+        for chunk in receive_buffer.split(b'\n'):
+            if not chunk:
+                continue
+            if receive_buffer[len(chunk):len(chunk) + 1] != b'\n':
+                break
+            receive_buffer = receive_buffer[len(chunk) + 1:]
+            frames += 1
+    return frames
+
+
+def decoder_decode(chunks):
+    decoder = FrameDecoder()
+    frames = 0
+    for data in chunks:
+        frames += len(decoder.feed(data))
+    return frames
+
+
+def measure(decode, chunks):
+    start = time.time()
+    frames = decode(chunks)
+    return time.time() - start, frames
+
+
+def main():
+    rnd = random.Random(0)
+    print('{:>10} {:>8} {:>10} {:>11} {:>8}'.format(
+        'payload', 'chunks', 'legacy s', 'decoder s', 'speedup'))
+    for payload_size in PAYLOAD_SIZES:
+        payload = b'x' * payload_size
+        legacy_chunks = list(random_chunks((payload + b'\n') * 2, rnd))
+        framed = FRAME_HEADER.pack(payload_size) + payload
+        decoder_chunks = list(random_chunks(framed * 2, rnd))
+
+        legacy, legacy_frames = measure(legacy_decode, legacy_chunks)
+        decoder, decoder_frames = measure(decoder_decode, decoder_chunks)
+        assert legacy_frames == decoder_frames == 2
+        print('{:>10} {:>8} {:>10.3f} {:>11.4f} {:>7.0f}x'.format(
+            payload_size, len(decoder_chunks), legacy, decoder, legacy / decoder))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Runner -> UI transport throughput benchmark.
+
+Compares the length-prefixed transports with the former flow control scheme,
+where the writer kept at most PIPE_LIMIT bytes in flight, tracked in a shared
+multiprocessing.Value and released by the reader through a multiprocessing.Event.
+
+    python benchmarks/bench_transport.py
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import sys
+import time
+import select
+import multiprocessing
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'pytui'))
+
+from transport import TRANSPORTS, FrameDecoder
+
+PIPE_LIMIT = 4096
+MESSAGE_COUNT = 20000
+PAYLOAD_SIZES = [100, 4000, 100000]
+
+
+def legacy_writer(write_fd, pipe_size, pipe_semaphore, payload, count):
+    write_pipe = os.fdopen(write_fd, 'wb', 0)
+    data = payload + b'\n'
+    for _ in range(count):
+        for offset in range(0, len(data), PIPE_LIMIT):
+            chunk = data[offset:offset + PIPE_LIMIT]
+            while True:
+                with pipe_size.get_lock():
+                    if pipe_size.value + len(chunk) <= PIPE_LIMIT:
+                        break
+                    pipe_semaphore.clear()
+                pipe_semaphore.wait()
+
+            with pipe_size.get_lock():
+                pipe_size.value += len(chunk)
+                write_pipe.write(chunk)
+
+
+def legacy_reader(read_fd, pipe_size, pipe_semaphore, count):
+    received = 0
+    buffer = b''
+    while received < count:
+        select.select([read_fd], [], [])
+        data = os.read(read_fd, PIPE_LIMIT)
+        buffer += data
+        while b'\n' in buffer:
+            _frame, buffer = buffer.split(b'\n', 1)
+            received += 1
+
+        with pipe_size.get_lock():
+            pipe_size.value -= len(data)
+            pipe_semaphore.set()
+
+
+def bench_legacy(payload, count):
+    read_fd, write_fd = os.pipe()
+    pipe_size = multiprocessing.Value('i', 0)
+    pipe_semaphore = multiprocessing.Event()
+    process = multiprocessing.Process(
+        target=legacy_writer,
+        args=(write_fd, pipe_size, pipe_semaphore, payload, count)
+    )
+    start = time.time()
+    process.start()
+    legacy_reader(read_fd, pipe_size, pipe_semaphore, count)
+    elapsed = time.time() - start
+    process.join()
+    os.close(read_fd)
+    os.close(write_fd)
+    return elapsed
+
+
+def framed_writer(writer, payload, count):
+    for _ in range(count):
+        writer.send(payload)
+
+
+def bench_framed(transport_class, payload, count):
+    transport = transport_class()
+    process = multiprocessing.Process(
+        target=framed_writer,
+        args=(transport.get_writer(), payload, count)
+    )
+    start = time.time()
+    process.start()
+
+    received = 0
+    decoder = FrameDecoder()
+    while received < count:
+        select.select([transport.fileno()], [], [], transport.poll_interval)
+        received += len(decoder.feed(transport.read()))
+
+    elapsed = time.time() - start
+    process.join()
+    transport.close()
+    return elapsed
+
+
+def main():
+    print('{:>10} {:>8} {:>12}'.format('payload', 'count', 'legacy MB/s') + ''.join(
+        ' {:>12}'.format(name + ' MB/s') for name in TRANSPORTS))
+    for payload_size in PAYLOAD_SIZES:
+        count = max(100, MESSAGE_COUNT * 100 // payload_size)
+        payload = b'x' * payload_size
+        megabytes = payload_size * count / 1e6
+        results = [bench_legacy(payload, count)] + [
+            bench_framed(transport_class, payload, count)
+            for transport_class in TRANSPORTS.values()
+        ]
+        print('{:>10} {:>8}'.format(payload_size, count) + ''.join(
+            ' {:>12.1f}'.format(megabytes / elapsed) for elapsed in results))
+
+
+if __name__ == '__main__':
+    main()
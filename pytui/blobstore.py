@@ -0,0 +1,69 @@
+from __future__ import absolute_import
+from __future__ import unicode_literals
+from builtins import object
+
+import os
+import mmap
+
+from logging_tools import get_logger
+
+
+logger = get_logger('blobstore')
+
+
+class BlobWriter(object):
+    """
+    Append-only file of a runner process in the session blob directory.
+    Only a (name, offset, length) handle of the stored text is sent to the ui.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.name = 'output-{}.blob'.format(os.getpid())
+        self._file = None
+
+    def write(self, text):
+        """ Store the text, return its handle or None for an empty text. """
+        if not text:
+            return None
+
+        if self._file is None:
+            self._file = open(os.path.join(self.directory, self.name), 'ab', 0)
+
+        data = text.encode('utf-8')
+        self._file.seek(0, os.SEEK_END)
+        offset = self._file.tell()
+        self._file.write(data)
+        return [self.name, offset, len(data)]
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class BlobReader(object):
+    """
+    Lazy reader of the session blob files, memory maps them on the first access.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self._maps = {}
+
+    def read(self, handle):
+        name, offset, length = handle
+        blob = self._maps.get(name)
+        if blob is None or len(blob) < offset + length:
+            # not mapped yet, or the file has grown since
+            if blob is not None:
+                blob.close()
+            with open(os.path.join(self.directory, name), 'rb') as blob_file:
+                blob = mmap.mmap(blob_file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[name] = blob
+            logger.debug('mapped blob %s, size %s', name, len(blob))
+
+        return blob[offset:offset + length].decode('utf-8', 'replace')
+
+    def close(self):
+        for blob in self._maps.values():
+            blob.close()
+        self._maps = {}
@@ -0,0 +1,336 @@
+"""
+Codecs of the messages sent from the runner to the ui.
+
+Each codec provides a stateful encoder (one per runner session) and decoder.
+The encoder turns a message into a record, records are joined into a frame payload.
+The decoder turns a frame payload (a memoryview of the received data) back into
+a list of (method, params) tuples.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+from builtins import object
+
+import json
+import struct
+from collections import OrderedDict
+
+
+class JsonEncoder(object):
+    def encode(self, method, params):
+        return json.dumps({
+            'method': method,
+            'params': params
+        }).encode('utf-8')
+
+    def join(self, records):
+        return b'[' + b','.join(records) + b']'
+
+
+class JsonDecoder(object):
+    def decode(self, frame):
+        batch = json.loads(frame.tobytes().decode('utf-8'))
+        assert isinstance(batch, list)
+        return [(message['method'], message['params']) for message in batch]
+
+
+# Field types of the binary codec. Fixed size fields and sizes of the variable
+# sized fields are packed together at the start of the record, data of the variable
+# sized fields follow.
+ID = 'I'         # string sent only once per session, then referenced by its index
+INT = 'i'
+BOOL = 'b'       # optional bool, -1 stands for None
+FLOAT = 'd'      # optional float, nan stands for None
+STR = 'str'      # unicode string
+JSON = 'json'    # any json serializable value
+BLOB = 'IQI'     # blob store handle (name ID, offset, length) or None
+
+FIXED_TYPES = (ID, INT, BOOL, FLOAT, BLOB)
+NONE_SIZE = 0xffffffff
+NAN = float('nan')
+# decoded bools by the sent value, -1 indexes None
+BOOL_VALUES = (False, True, None)
+# index 0 of the string table stands for None
+NONE_INDEX = 0
+SIZE_TYPE = 'I'
+SIZE = struct.Struct('>' + SIZE_TYPE)
+
+TAG_RESET = 0
+TAG_STRING = 1
+TAG_GENERIC = 255
+TAG_RESET_BYTE = struct.pack('>B', TAG_RESET)
+TAG_STRING_BYTE = struct.pack('>B', TAG_STRING)
+TAG_GENERIC_BYTE = struct.pack('>B', TAG_GENERIC)
+
+# method tag, method name, fields
+MESSAGES = [
+    (2, 'item_collected', [
+        ('item_id', ID),
+    ]),
+    (3, 'set_test_state', [
+        ('test_id', ID),
+        ('state', ID),
+    ]),
+    (4, 'set_test_result', [
+        ('test_id', ID),
+        ('result_state', ID),
+        ('when', ID),
+        ('outcome', ID),
+        ('last_failed_exempt', BOOL),
+        ('duration', FLOAT),
+        ('output', STR),
+        ('output_blob', BLOB),
+    ]),
+    (5, 'set_exception_info', [
+        ('test_id', ID),
+        ('result_state', ID),
+        ('when', ID),
+        ('exc_type', STR),
+        ('exc_value', STR),
+        ('formatted_traceback', STR),
+        ('traceback_blob', BLOB),
+    ]),
+    (6, 'set_pytest_error', [
+        ('exitcode', INT),
+        ('description', STR),
+    ]),
+    (7, 'init_finished', []),
+    (8, 'run_finished', []),
+    (9, 'set_test_fixtures', [
+        ('test_id', ID),
+        ('fixtures', JSON),
+    ]),
+    (10, 'set_fixture_duration', [
+        ('fixture', ID),
+        ('duration', FLOAT),
+    ]),
+    (11, 'recollect_finished', [
+        ('files', JSON),
+    ]),
+]
+
+
+class MessageSchema(object):
+    """
+    Record layout of the message. The head holds the tag, the fixed size fields
+    and the sizes of the variable sized fields (NONE_SIZE for None), their data follow.
+    """
+    def __init__(self, tag, method, fields):
+        self.tag = tag
+        self.tag_byte = struct.pack('>B', tag)
+        self.method = method
+        self.fixed_fields = [(name, type_) for name, type_ in fields if type_ in FIXED_TYPES]
+        self.variable_fields = [
+            (name, type_) for name, type_ in fields if type_ not in FIXED_TYPES
+        ]
+        self.head = struct.Struct(
+            '>B' + ''.join(type_ for _name, type_ in self.fixed_fields) +
+            SIZE_TYPE * len(self.variable_fields)
+        )
+        self.field_names = set(name for name, _type in fields)
+
+        # fields with their index in the head, strings of the ids are looked up,
+        # other fixed fields are converted by their type, sizes precede variable data
+        self.id_fields = []
+        self.value_fields = []
+        index = 1
+        for name, type_ in self.fixed_fields:
+            if type_ == ID:
+                self.id_fields.append((name, index))
+            else:
+                self.value_fields.append((name, type_, index))
+            index += 3 if type_ == BLOB else 1
+        self.size_fields = []
+        for name, type_ in self.variable_fields:
+            self.size_fields.append((name, type_, index))
+            index += 1
+
+    def read(self, frame, offset, strings, append):
+        """ Read the record at the offset of the frame, append the message, return next offset. """
+        values = self.head.unpack_from(frame, offset)
+        offset += self.head.size
+        params = {}
+        for name, index in self.id_fields:
+            params[name] = strings[values[index]]
+
+        for name, type_, index in self.value_fields:
+            value = values[index]
+            if type_ == BOOL:
+                value = BOOL_VALUES[value]
+            elif type_ == FLOAT:
+                if value != value:
+                    value = None
+            elif type_ == BLOB:
+                if value == NONE_INDEX:
+                    value = None
+                else:
+                    value = [strings[value], values[index + 1], values[index + 2]]
+            params[name] = value
+
+        for name, type_, index in self.size_fields:
+            size = values[index]
+            if size == NONE_SIZE:
+                params[name] = None
+                continue
+            value = frame[offset:offset + size].decode('utf-8')
+            offset += size
+            params[name] = json.loads(value) if type_ == JSON else value
+
+        append((self.method, params))
+        return offset
+
+
+SCHEMAS = OrderedDict(
+    (method, MessageSchema(tag, method, fields)) for tag, method, fields in MESSAGES
+)
+READERS = dict((schema.tag_byte, schema.read) for schema in SCHEMAS.values())
+
+
+def encode_variable(value, type_):
+    if value is None:
+        return None
+    if type_ == JSON:
+        value = json.dumps(value)
+    return value.encode('utf-8')
+
+
+def pack_variable(value, type_):
+    data = encode_variable(value, type_)
+    if data is None:
+        return SIZE.pack(NONE_SIZE)
+    return SIZE.pack(len(data)) + data
+
+
+def unpack_variable(frame, offset, type_):
+    (size,) = SIZE.unpack_from(frame, offset)
+    offset += SIZE.size
+    if size == NONE_SIZE:
+        return None, offset
+
+    value = frame[offset:offset + size].decode('utf-8')
+    if type_ == JSON:
+        value = json.loads(value)
+    return value, offset + size
+
+
+class BinaryEncoder(object):
+    """
+    Compact binary encoder. Methods are sent as integer tags, strings of the ID
+    fields are sent once per session and then referenced by their index.
+    """
+    def __init__(self):
+        self._strings = {None: NONE_INDEX}
+        self._started = False
+
+    def _intern(self, value, records):
+        index = self._strings.get(value)
+        if index is None:
+            index = len(self._strings)
+            self._strings[value] = index
+            records.append(TAG_STRING_BYTE + pack_variable(value, STR))
+        return index
+
+    def encode(self, method, params):
+        records = []
+        if not self._started:
+            # new session, the decoder has to forget strings of the previous one
+            records.append(TAG_RESET_BYTE)
+            self._started = True
+
+        schema = SCHEMAS.get(method)
+        if schema is None or not schema.field_names.issuperset(params):
+            records.append(
+                TAG_GENERIC_BYTE +
+                pack_variable(method, STR) +
+                pack_variable(params, JSON)
+            )
+            return b''.join(records)
+
+        head_values = []
+        for name, type_ in schema.fixed_fields:
+            value = params.get(name)
+            if type_ == ID:
+                value = self._intern(value, records)
+            elif type_ == BOOL:
+                value = -1 if value is None else int(value)
+            elif type_ == FLOAT:
+                value = NAN if value is None else value
+            elif type_ == BLOB:
+                if value is None:
+                    head_values.extend((NONE_INDEX, 0, 0))
+                else:
+                    head_values.extend((self._intern(value[0], records), value[1], value[2]))
+                continue
+            head_values.append(value)
+
+        variable_data = []
+        for name, type_ in schema.variable_fields:
+            data = encode_variable(params.get(name), type_)
+            if data is None:
+                head_values.append(NONE_SIZE)
+            else:
+                head_values.append(len(data))
+                variable_data.append(data)
+
+        records.append(schema.head.pack(schema.tag, *head_values))
+        records.extend(variable_data)
+        return b''.join(records)
+
+    def join(self, records):
+        return b''.join(records)
+
+
+class BinaryDecoder(object):
+    def __init__(self):
+        self._strings = [None]
+
+    def decode(self, frame):
+        # single copy of the frame, slicing bytes is cheaper than slicing memoryview,
+        # tags are compared as one byte slices, indexing gives str on python 2
+        frame = frame.tobytes()
+        strings = self._strings
+        readers = READERS
+        unpack_size = SIZE.unpack_from
+        messages = []
+        append = messages.append
+        offset = 0
+        frame_size = len(frame)
+        while offset < frame_size:
+            tag = frame[offset:offset + 1]
+            read = readers.get(tag)
+            if read is not None:
+                offset = read(frame, offset, strings, append)
+            elif tag == TAG_STRING_BYTE:
+                # a string record precedes first message referencing the string
+                (size,) = unpack_size(frame, offset + 1)
+                offset += 1 + SIZE.size
+                if size == NONE_SIZE:
+                    strings.append(None)
+                else:
+                    strings.append(frame[offset:offset + size].decode('utf-8'))
+                    offset += size
+            elif tag == TAG_RESET_BYTE:
+                del strings[1:]
+                offset += 1
+            elif tag == TAG_GENERIC_BYTE:
+                method, offset = unpack_variable(frame, offset + 1, STR)
+                params, offset = unpack_variable(frame, offset, JSON)
+                append((method, params))
+            else:
+                raise ValueError('Unknown record tag {!r}'.format(tag))
+
+        return messages
+
+
+CODECS = OrderedDict([
+    ('binary', (BinaryEncoder, BinaryDecoder)),
+    ('json', (JsonEncoder, JsonDecoder)),
+])
+DEFAULT_CODEC = 'binary'
+
+
+def get_encoder(name):
+    return CODECS[name][0]()
+
+
+def get_decoder(name):
+    return CODECS[name][1]()
@@ -0,0 +1,294 @@
+"""
+Persistent cache of the collected tests.
+
+The ui shows the cached tests right after the start. The runner collection
+skips the files which have not changed since they were cached and reports
+their tests from the cache, only the changed files are imported and collected.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+from builtins import object
+
+import os
+import json
+import fcntl
+import hashlib
+from collections import OrderedDict
+
+import pytest
+
+from logging_tools import get_logger
+from common import is_in_directory
+from import_graph import get_imported_names
+from settings import CACHE_DIR, VERSION
+
+
+logger = get_logger('collection_cache')
+# changes of these files (in rootdir) may change the collection of any test file
+CONFIG_FILES = ('pytest.ini', 'tox.ini', 'setup.cfg', 'pyproject.toml')
+# serializes the saves of the caches in the cache directory
+LOCK_FILE = 'collection.lock'
+
+
+def get_cache_path(pytest_args):
+    """ Return path of the cache of the collection with the pytest args. """
+    key = hashlib.sha1('\0'.join(pytest_args).encode('utf-8')).hexdigest()
+    return os.path.join(CACHE_DIR, 'collection-{}.json'.format(key[:16]))
+
+
+def get_stamp(path):
+    """ Return modification time (ns) and size of the file, None if it doesn't exist. """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    mtime_ns = getattr(stat, 'st_mtime_ns', None) or int(stat.st_mtime * 1e9)
+    return [mtime_ns, stat.st_size]
+
+
+def get_hash(path):
+    try:
+        with open(path, 'rb') as hashed_file:
+            return hashlib.sha1(hashed_file.read()).hexdigest()
+    except (IOError, OSError):
+        return None
+
+
+class CollectionCache(object):
+    """
+    Collected test ids by test file (relative to rootdir), with the stamps
+    and content hashes of the files, and stamps of the conftest and config files.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.rootdir = None
+        self.files = OrderedDict()
+        self.config_files = {}
+        # stamps of the test directories and the files failed to collect,
+        # they don't invalidate the cache, but may hold new tests
+        self.watched = {}
+        # project modules imported by the project modules, by path, with their stamps
+        self.imports = {}
+        self._failed_files = []
+        self.valid = False
+
+    def get_version(self):
+        return '{} {}'.format(VERSION, pytest.__version__)
+
+    def load(self):
+        """ Load the cache, return list of the cached test ids. """
+        try:
+            with open(self.path) as cache_file:
+                data = json.load(cache_file, object_pairs_hook=OrderedDict)
+        except (IOError, OSError, ValueError):
+            logger.info('No collection cache in %s', self.path)
+            return []
+
+        if data.get('version') != self.get_version():
+            logger.info('Collection cache of other version %s', data.get('version'))
+            return []
+
+        self.rootdir = data['rootdir']
+        self.files = data['files']
+        self.config_files = data['config_files']
+        self.watched = data.get('watched', {})
+        self.imports = data.get('imports', {})
+        return self.get_test_ids()
+
+    def get_test_ids(self):
+        return [test_id for entry in self.files.values() for test_id in entry['tests']]
+
+    def validate(self, rootdir):
+        """
+            Check the cache is usable for the collection in rootdir,
+            no conftest or config file has changed since it was written.
+        """
+        self.valid = (
+            self.rootdir == rootdir and
+            all(get_stamp(path) == stamp for path, stamp in self.config_files.items())
+        )
+        logger.info('Collection cache valid: %s', self.valid)
+        return self.valid
+
+    def get_fresh(self, path):
+        """ Return the cache entry of the test file, None when it has changed. """
+        if not self.valid:
+            return None
+
+        entry = self.files.get(os.path.relpath(path, self.rootdir))
+        if entry is None:
+            return None
+
+        stamp = get_stamp(path)
+        if stamp == entry['stamp']:
+            return entry
+        if stamp is not None and stamp[1] == entry['stamp'][1] and get_hash(path) == entry['hash']:
+            # touched only
+            entry['stamp'] = stamp
+            return entry
+        return None
+
+    def has_changed(self):
+        """ Return True when a cached file, conftest or watched path has changed. """
+        if self.rootdir is None:
+            return False
+
+        return any(
+            get_stamp(os.path.join(self.rootdir, relpath)) != entry['stamp']
+            for relpath, entry in self.files.items()
+        ) or any(
+            get_stamp(path) != stamp
+            for stamps in (self.config_files, self.watched)
+            for path, stamp in stamps.items()
+        )
+
+    def get_directories(self, rootdir, files):
+        """ Return the directories of the files and their parents up to rootdir. """
+        directories = set()
+        for relpath in files:
+            directory = os.path.dirname(os.path.join(rootdir, relpath))
+            while is_in_directory(directory, rootdir) and directory not in directories:
+                directories.add(directory)
+                if directory == rootdir:
+                    break
+                directory = os.path.dirname(directory)
+        return directories
+
+    def get_config_files(self, rootdir, directories):
+        """ Return stamps of the config files and conftests of the directories. """
+        paths = set(os.path.join(rootdir, name) for name in CONFIG_FILES)
+        paths.update(os.path.join(directory, 'conftest.py') for directory in directories)
+        return dict((path, get_stamp(path)) for path in paths)
+
+    def update(self, rootdir, collected, fresh_files, file_order, failed_files=(),
+               other_files=(), durations=None):
+        """
+            Replace the cache content with the entries of the fresh files and the tests
+            collected by pytest (list of (test_id, fixtures) tuples). Files are kept
+            in the order of the collection. Entries of the files collected by other
+            runners are taken from the cache file on save.
+        """
+        durations = durations or {}
+        collected_files = OrderedDict()
+        for test_id, fixtures in collected:
+            relpath = test_id.split('::', 1)[0]
+            entry = collected_files.get(relpath)
+            if entry is None:
+                path = os.path.join(rootdir, relpath)
+                entry = collected_files[relpath] = {
+                    'stamp': get_stamp(path),
+                    'hash': get_hash(path),
+                    'tests': [],
+                    'fixtures': {},
+                    'duration': durations.get(relpath),
+                }
+            entry['tests'].append(test_id)
+            if fixtures:
+                entry['fixtures'][test_id] = fixtures
+
+        files = OrderedDict()
+        for relpath in file_order:
+            if relpath in other_files:
+                files[relpath] = None
+            elif relpath in fresh_files:
+                files[relpath] = self.files[relpath]
+            elif relpath in collected_files:
+                files[relpath] = collected_files.pop(relpath)
+        files.update(collected_files)
+
+        self.rootdir = rootdir
+        self.files = files
+        self._failed_files = list(failed_files)
+
+    def update_imports(self, modules):
+        """
+            Record the project modules imported by the modules (paths by module name),
+            only the modules changed since the last update are parsed. Modules not
+            imported now keep their entries, unless they are gone.
+        """
+        rootdir = os.path.realpath(self.rootdir)
+        paths = dict(
+            (name, os.path.relpath(path, rootdir)) for name, path in modules.items()
+        )
+        imports = {}
+        for name, path in modules.items():
+            relpath = paths[name]
+            stamp = get_stamp(path)
+            entry = self.imports.get(relpath)
+            if entry is None or entry['stamp'] != stamp:
+                entry = {
+                    'stamp': stamp,
+                    'imports': sorted(set(
+                        paths[imported] for imported in get_imported_names(path, name)
+                        if imported in paths and imported != name
+                    )),
+                }
+            imports[relpath] = entry
+
+        for relpath, entry in self.imports.items():
+            if relpath not in imports and os.path.exists(os.path.join(self.rootdir, relpath)):
+                imports[relpath] = entry
+        self.imports = imports
+
+    def get_import_graph(self):
+        """ Return paths of the imported modules by the module path. """
+        return dict((path, entry['imports']) for path, entry in self.imports.items())
+
+    def update_stamps(self):
+        """ Update stamps of the config files and watched paths of the cached files. """
+        directories = self.get_directories(self.rootdir,
+                                           list(self.files) + self._failed_files)
+        self.config_files = self.get_config_files(self.rootdir, directories)
+        self.watched.update(
+            (path, get_stamp(path))
+            for path in list(directories) + [
+                os.path.join(self.rootdir, relpath) for relpath in self._failed_files
+            ]
+        )
+
+    def merge_saved(self):
+        """
+            Fill the entries of the files collected by other runners from the cache file,
+            drop those it doesn't contain.
+        """
+        saved = CollectionCache(self.path)
+        saved.load()
+        if saved.rootdir != self.rootdir:
+            saved.files = {}
+        else:
+            self.watched = saved.watched
+            saved.imports.update(self.imports)
+            self.imports = saved.imports
+
+        self.files = OrderedDict(
+            (relpath, saved.files[relpath] if entry is None else entry)
+            for relpath, entry in self.files.items()
+            if entry is not None or relpath in saved.files
+        )
+
+    def save(self):
+        """ Write the cache atomically, runners collecting in parallel save one by one. """
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        # the lock is shared by all the caches in the directory and never removed,
+        # removing it would let two runners lock different files
+        with open(os.path.join(directory, LOCK_FILE), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            self.watched = {}
+            if any(entry is None for entry in self.files.values()):
+                self.merge_saved()
+            self.update_stamps()
+
+            temp_path = '{}.{}'.format(self.path, os.getpid())
+            with open(temp_path, 'w') as cache_file:
+                json.dump({
+                    'version': self.get_version(),
+                    'rootdir': self.rootdir,
+                    'files': self.files,
+                    'config_files': self.config_files,
+                    'watched': self.watched,
+                    'imports': self.imports,
+                }, cache_file)
+            os.rename(temp_path, self.path)
@@ -1,10 +1,15 @@
 from __future__ import unicode_literals
 from builtins import object
 
+import os
 import re
+import signal
 from logging_tools import get_logger
 
 logger = get_logger('ui')
+PYTUI_DIR = os.path.dirname(os.path.realpath(__file__))
+# sent to a runner process to stop its test run after the current test
+CANCEL_SIGNAL = signal.SIGUSR1
 
 
 def get_fuzzy_regex(fuzzy_str):
@@ -22,6 +27,21 @@ def get_filter_regex_str(filter_value):
     )
 
 
+def is_in_directory(filename, directory):
+    return filename == directory or filename.startswith(directory + os.sep)
+
+
+def is_project_file(filename, project_dir):
+    """ Return True for a file of the project, not of the installed packages or pytui. """
+    parts = filename.split(os.sep)
+    return (
+        is_in_directory(filename, project_dir) and
+        not is_in_directory(filename, PYTUI_DIR) and
+        'site-packages' not in parts and
+        'dist-packages' not in parts
+    )
+
+
 def get_filter_regex(filter_value):
     if not filter_value:
         return None
@@ -41,6 +61,7 @@ class PytestExitcodes(object):
 
     # Own exitcodes
     CRASHED = 100
+    RUNNER_FAILED = 101
 
     text = {
         ALL_COLLECTED: "All tests were collected and passed successfully",
@@ -50,4 +71,5 @@ class PytestExitcodes(object):
         USAGE_ERROR: "pytest command line usage error",
         NO_TESTS_COLLECTED: "No tests were collected",
         CRASHED: "Pytest crashed",
+        RUNNER_FAILED: "Runner failed to start the command",
     }
@@ -0,0 +1,401 @@
+"""
+Lines of the project files run by every test.
+
+The runner traces the lines run by each test and records them into a sqlite
+database, together with the line hashes of the traced file versions. The ui
+compares the recorded versions with the current files and finds the tests
+which ran the changed lines.
+
+Lines run at import time are not attributed to any test. The versions of all
+the project modules imported by the tests are recorded too, a change of lines
+not run by any test affects the tests which ran some line of the file and the
+tests of the test files importing it (by the import graph of the collection),
+which ran with the previous version.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+from builtins import object
+
+import os
+import sys
+import json
+import zlib
+import sqlite3
+import hashlib
+import difflib
+import threading
+from contextlib import contextmanager
+
+from logging_tools import get_logger
+from common import is_project_file
+from settings import CACHE_DIR, VERSION
+
+
+logger = get_logger('coverage_map')
+# seconds to wait for the database locked by other runner
+DATABASE_TIMEOUT = 30
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS sources (
+        digest TEXT PRIMARY KEY,
+        line_hashes TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS coverage (
+        test_id TEXT NOT NULL,
+        path TEXT NOT NULL,
+        digest TEXT NOT NULL,
+        lines TEXT NOT NULL,
+        PRIMARY KEY (test_id, path)
+    );
+    CREATE TABLE IF NOT EXISTS modules (
+        key TEXT PRIMARY KEY,
+        files TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS tests (
+        test_id TEXT PRIMARY KEY,
+        modules TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS coverage_source ON coverage (path, digest);
+    CREATE INDEX IF NOT EXISTS coverage_digest ON coverage (digest);
+'''
+
+
+def get_coverage_path(pytest_args):
+    """ Return path of the coverage database of the tests run with the pytest args. """
+    key = hashlib.sha1('\0'.join(pytest_args).encode('utf-8')).hexdigest()
+    return os.path.join(CACHE_DIR, 'coverage-{}.sqlite'.format(key[:16]))
+
+
+def get_source(path):
+    """ Return content hash and hashes of the lines of the file, None if it doesn't exist. """
+    try:
+        with open(path, 'rb') as source_file:
+            content = source_file.read()
+    except (IOError, OSError):
+        return None
+    return (
+        hashlib.sha1(content).hexdigest(),
+        [zlib.crc32(line) for line in content.splitlines()]
+    )
+
+
+def get_changed_lines(old_hashes, new_hashes):
+    """
+        Return sets of the changed lines (numbered in the old version) by the change,
+        lines added between two old lines change both of them.
+    """
+    matcher = difflib.SequenceMatcher(None, old_hashes, new_hashes, autojunk=False)
+    return [
+        set(range(start + 1, end + 1)) if start != end else set([start, start + 1])
+        for tag, start, end, _new_start, _new_end in matcher.get_opcodes()
+        if tag != 'equal'
+    ]
+
+
+def merge_lines(lines, other):
+    for relpath, file_lines in other.items():
+        lines.setdefault(relpath, set()).update(file_lines)
+
+
+class LineTracer(object):
+    """
+    Records the lines of the project files run between start and stop,
+    by sys.monitoring (python 3.12+) or by sys.settrace. The settrace tracing
+    replaces other tracers (coverage, debuggers) while the lines are recorded.
+    """
+    def __init__(self, rootdir):
+        self.rootdir = os.path.realpath(rootdir)
+        # recorded lines by relative path of the file
+        self.lines = None
+        self._outer_lines = []
+        # relative path by code file name, None for the files out of the project
+        self._relpaths = {}
+        self._monitoring = None
+        self._previous_trace = None
+
+    def get_relpath(self, filename):
+        try:
+            return self._relpaths[filename]
+        except KeyError:
+            relpath = None
+            if filename.endswith('.py'):
+                path = os.path.realpath(filename)
+                if is_project_file(path, self.rootdir):
+                    relpath = os.path.relpath(path, self.rootdir)
+            self._relpaths[filename] = relpath
+            return relpath
+
+    def add_line(self, filename, line):
+        relpath = self.get_relpath(filename)
+        if relpath is not None and self.lines is not None:
+            self.lines.setdefault(relpath, set()).add(line)
+
+    def use_monitoring(self):
+        monitoring = getattr(sys, 'monitoring', None)
+        if monitoring is None:
+            return None
+        if self._monitoring is None:
+            try:
+                monitoring.use_tool_id(monitoring.COVERAGE_ID, 'pytui')
+            except ValueError:
+                logger.info('Monitoring tool id used by other tool, tracing lines by settrace')
+                self._monitoring = False
+                return None
+            monitoring.register_callback(monitoring.COVERAGE_ID, monitoring.events.PY_START,
+                                         self._monitor_start)
+            monitoring.register_callback(monitoring.COVERAGE_ID, monitoring.events.LINE,
+                                         self._monitor_line)
+            self._monitoring = True
+        return monitoring if self._monitoring else None
+
+    def _monitor_start(self, code, offset):
+        self.add_line(code.co_filename, code.co_firstlineno)
+        # recorded once until the events are restarted
+        return sys.monitoring.DISABLE
+
+    def _monitor_line(self, code, line):
+        self.add_line(code.co_filename, line)
+        return sys.monitoring.DISABLE
+
+    def _trace(self, frame, event, arg):
+        """ Global trace function, traces lines of the project frames. """
+        code = frame.f_code
+        if self.get_relpath(code.co_filename) is None:
+            return None
+        self.add_line(code.co_filename, code.co_firstlineno)
+        return self._trace_lines
+
+    def _trace_lines(self, frame, event, arg):
+        if event == 'line':
+            self.add_line(frame.f_code.co_filename, frame.f_lineno)
+        return self._trace_lines
+
+    def start(self):
+        self.lines = {}
+        monitoring = self.use_monitoring()
+        if monitoring is not None:
+            monitoring.restart_events()
+            monitoring.set_events(monitoring.COVERAGE_ID,
+                                  monitoring.events.PY_START | monitoring.events.LINE)
+        else:
+            self._previous_trace = sys.gettrace()
+            threading.settrace(self._trace)
+            sys.settrace(self._trace)
+
+    def stop(self):
+        """ Stop the recording, return the recorded lines. """
+        monitoring = self.use_monitoring()
+        if monitoring is not None:
+            monitoring.set_events(monitoring.COVERAGE_ID, 0)
+        else:
+            sys.settrace(self._previous_trace)
+            threading.settrace(None)
+            self._previous_trace = None
+
+        lines = self.lines
+        self.lines = None
+        return lines
+
+    def push(self):
+        """ Record the following lines separately, until pop. """
+        self._outer_lines.append(self.lines)
+        self.lines = {}
+        monitoring = self.use_monitoring()
+        if monitoring is not None:
+            # lines already recorded by the outer recording run again
+            monitoring.restart_events()
+
+    def pop(self):
+        """ Return the lines recorded since push, they are added to the outer recording. """
+        lines = self.lines
+        self.lines = self._outer_lines.pop()
+        merge_lines(self.lines, lines)
+        return lines
+
+    def close(self):
+        if self._monitoring:
+            monitoring = sys.monitoring
+            monitoring.set_events(monitoring.COVERAGE_ID, 0)
+            monitoring.register_callback(monitoring.COVERAGE_ID, monitoring.events.PY_START,
+                                         None)
+            monitoring.register_callback(monitoring.COVERAGE_ID, monitoring.events.LINE, None)
+            monitoring.free_tool_id(monitoring.COVERAGE_ID)
+        self._monitoring = None
+
+
+class CoverageMap(object):
+    """
+    Lines run by the tests, by the test id and the relative path of the file,
+    recorded with the content hash of the file version they ran in.
+    """
+    def __init__(self, path):
+        self.path = path
+
+    @contextmanager
+    def connect(self, write=False):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        connection = sqlite3.connect(self.path, timeout=DATABASE_TIMEOUT,
+                                     isolation_level=None)
+        try:
+            connection.executescript(SCHEMA)
+            if write:
+                # runners record their tests in parallel
+                connection.execute('BEGIN IMMEDIATE')
+            yield connection
+            if write:
+                connection.execute('COMMIT')
+        finally:
+            connection.close()
+
+    def get_meta(self, connection, key):
+        row = connection.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def get_rootdir(self, connection):
+        """ Return rootdir of the recorded tests, None if it is of other pytui version. """
+        if self.get_meta(connection, 'version') != VERSION:
+            return None
+        return self.get_meta(connection, 'rootdir')
+
+    def record(self, rootdir, coverage, modules=()):
+        """
+            Replace the recorded lines of the tests, coverage holds lines by test and file.
+            Modules are paths of the project modules imported by the tests.
+        """
+        rootdir = os.path.realpath(rootdir)
+        sources = {}
+        with self.connect(write=True) as connection:
+            if self.get_rootdir(connection) != rootdir:
+                logger.info('Coverage map of other rootdir or version, cleared')
+                connection.execute('DELETE FROM coverage')
+                connection.execute('DELETE FROM sources')
+                connection.execute('DELETE FROM modules')
+                connection.execute('DELETE FROM tests')
+                connection.executemany('INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                                       [('version', VERSION), ('rootdir', rootdir)])
+
+            for test_id, files in coverage.items():
+                connection.execute('DELETE FROM coverage WHERE test_id = ?', (test_id,))
+                for relpath, lines in files.items():
+                    if relpath not in sources:
+                        sources[relpath] = get_source(os.path.join(rootdir, relpath))
+                        if sources[relpath] is not None:
+                            digest, line_hashes = sources[relpath]
+                            connection.execute('INSERT OR IGNORE INTO sources VALUES (?, ?)',
+                                               (digest, json.dumps(line_hashes)))
+                    if sources[relpath] is None:
+                        continue
+                    connection.execute(
+                        'INSERT INTO coverage VALUES (?, ?, ?, ?)',
+                        (test_id, relpath, sources[relpath][0], json.dumps(sorted(lines)))
+                    )
+
+            # versions of the imported modules, shared by the tests of the session
+            files = {}
+            for path in modules:
+                relpath = os.path.relpath(os.path.realpath(path), rootdir)
+                if relpath not in sources:
+                    sources[relpath] = get_source(os.path.join(rootdir, relpath))
+                if sources[relpath] is not None:
+                    files[relpath] = sources[relpath][0]
+            files = json.dumps(files, sort_keys=True)
+            key = hashlib.sha1(files.encode('utf-8')).hexdigest()
+            connection.execute('INSERT OR IGNORE INTO modules VALUES (?, ?)', (key, files))
+            connection.executemany('INSERT OR REPLACE INTO tests VALUES (?, ?)',
+                                   [(test_id, key) for test_id in coverage])
+
+            connection.execute(
+                'DELETE FROM sources WHERE digest NOT IN (SELECT digest FROM coverage)'
+            )
+            connection.execute('DELETE FROM modules WHERE key NOT IN (SELECT modules FROM tests)')
+        logger.info('Coverage of %s tests recorded', len(coverage))
+
+    def get_impacted(self, test_ids, import_graph=None):
+        """
+            Return the tests which ran lines changed since they ran, and the tests
+            with no recorded lines. Lines changed, but run by no test, affect the tests
+            which imported the previous version of the file, only those of the test
+            files importing it with the import graph.
+        """
+        with self.connect() as connection:
+            rootdir = self.get_rootdir(connection)
+            if rootdir is None:
+                return list(test_ids)
+
+            recorded = set(row[0] for row in connection.execute(
+                'SELECT DISTINCT test_id FROM coverage'
+            ))
+            impacted = set()
+            current = {}
+
+            def is_current(relpath, digest):
+                if relpath not in current:
+                    current[relpath] = get_source(os.path.join(rootdir, relpath))
+                return current[relpath] is not None and current[relpath][0] == digest
+
+            # changed file versions, lines of which were changed but not run by any test
+            unattributed = set()
+            covered = connection.execute('SELECT DISTINCT path, digest FROM coverage').fetchall()
+            for relpath, digest in covered:
+                if is_current(relpath, digest):
+                    continue
+
+                tests = [
+                    (test_id, set(json.loads(lines)))
+                    for test_id, lines in connection.execute(
+                        'SELECT test_id, lines FROM coverage WHERE path = ? AND digest = ?',
+                        (relpath, digest)
+                    )
+                ]
+                source = current[relpath]
+                if source is None:
+                    # removed file
+                    impacted.update(test_id for test_id, _lines in tests)
+                    unattributed.add((relpath, digest))
+                    continue
+
+                (old_hashes,) = connection.execute(
+                    'SELECT line_hashes FROM sources WHERE digest = ?', (digest,)
+                ).fetchone()
+                for changed_lines in get_changed_lines(json.loads(old_hashes), source[1]):
+                    hit = [test_id for test_id, lines in tests if lines & changed_lines]
+                    if not hit:
+                        unattributed.add((relpath, digest))
+                    impacted.update(hit or (test_id for test_id, _lines in tests))
+
+            # changed files no test ran a line of, only imported
+            covered = set(covered)
+            modules = {}
+            for key, files in connection.execute('SELECT key, files FROM modules'):
+                modules[key] = json.loads(files)
+                unattributed.update(
+                    (relpath, digest) for relpath, digest in modules[key].items()
+                    if (relpath, digest) not in covered and not is_current(relpath, digest)
+                )
+
+            if unattributed:
+                affected = {}
+                if import_graph is not None:
+                    affected = dict(
+                        (relpath, import_graph.get_affected([relpath]))
+                        for relpath, _digest in unattributed
+                    )
+                for test_id, key in connection.execute('SELECT test_id, modules FROM tests'):
+                    files = modules.get(key, {})
+                    test_file = test_id.split('::', 1)[0]
+                    if any(
+                        files.get(relpath) == digest and
+                        (import_graph is None or test_file in affected[relpath])
+                        for relpath, digest in unattributed
+                    ):
+                        impacted.add(test_id)
+
+        return [
+            test_id for test_id in test_ids
+            if test_id in impacted or test_id not in recorded
+        ]
@@ -0,0 +1,48 @@
+"""
+Files changed in the git working tree since a revision.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import os
+import subprocess
+
+from logging_tools import get_logger
+
+
+logger = get_logger('git_changes')
+
+
+class GitError(Exception):
+    pass
+
+
+def run_git(args, cwd):
+    """ Return output of the git command, raise GitError when it fails. """
+    try:
+        process = subprocess.Popen(['git'] + args, cwd=cwd,
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except OSError as e:
+        raise GitError('Failed to run git: {}'.format(e))
+
+    output, error = process.communicate()
+    if process.returncode != 0:
+        raise GitError(error.decode('utf-8', 'replace').strip() or
+                       'git {} failed with exitcode {}'.format(' '.join(args),
+                                                               process.returncode))
+    return output.decode('utf-8', 'replace')
+
+
+def get_changed_files(rev, cwd):
+    """
+        Return absolute paths of the files changed since the revision, in the working
+        tree or in the index, including the removed and the untracked files.
+    """
+    toplevel = run_git(['rev-parse', '--show-toplevel'], cwd).strip()
+    # renamed files are reported as removed and added, both paths matter
+    names = run_git(['diff', '--name-only', '--no-renames', '-z', rev, '--'],
+                    toplevel).split('\0')
+    names += run_git(['ls-files', '--others', '--exclude-standard', '-z'], toplevel).split('\0')
+    paths = sorted(set(os.path.join(toplevel, name) for name in names if name))
+    logger.info('%s files changed since %s', len(paths), rev)
+    return paths
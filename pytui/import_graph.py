@@ -0,0 +1,96 @@
+"""
+Import graph of the project modules.
+
+The runner parses the project modules imported by the collection and records
+the project modules each of them imports, the graph is kept in the collection
+cache. The ui uses it to find the test files affected by a change of a module.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+from builtins import object
+
+import os
+import ast
+import sys
+
+from logging_tools import get_logger
+from common import is_project_file
+
+
+logger = get_logger('import_graph')
+
+
+def get_project_modules(rootdir):
+    """ Return paths of the imported project modules by the module name. """
+    rootdir = os.path.realpath(rootdir)
+    modules = {}
+    for name, module in list(sys.modules.items()):
+        filename = getattr(module, '__file__', None)
+        if not filename or not filename.endswith('.py'):
+            continue
+        filename = os.path.realpath(filename)
+        if is_project_file(filename, rootdir):
+            modules[name] = filename
+    return modules
+
+
+def get_parent_names(name):
+    """ Return the name and names of the parent packages, importing the module imports them. """
+    parts = name.split('.')
+    return ['.'.join(parts[:index]) for index in range(1, len(parts) + 1)]
+
+
+def get_imported_names(path, module_name):
+    """ Return names of the modules (possibly) imported by the module source. """
+    try:
+        with open(path, 'rb') as source_file:
+            tree = ast.parse(source_file.read(), path)
+    except (IOError, OSError, SyntaxError, ValueError):
+        logger.debug('Failed to parse %s', path)
+        return set()
+
+    package = module_name
+    if os.path.basename(path) != '__init__.py':
+        package = module_name.rpartition('.')[0]
+
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                names.update(get_parent_names(alias.name))
+        elif isinstance(node, ast.ImportFrom):
+            base = node.module or ''
+            if node.level:
+                parent = package
+                for _level in range(node.level - 1):
+                    parent = parent.rpartition('.')[0]
+                base = '.'.join(part for part in (parent, base) if part)
+            if not base:
+                continue
+            names.update(get_parent_names(base))
+            # the imported names may be submodules
+            names.update('{}.{}'.format(base, alias.name) for alias in node.names)
+    return names
+
+
+class ImportGraph(object):
+    """
+    Importers of the project modules, built from the imports recorded
+    by the runner (module path -> paths of the imported modules).
+    """
+    def __init__(self, imports):
+        self.importers = {}
+        for path, imported_paths in imports.items():
+            for imported_path in imported_paths:
+                self.importers.setdefault(imported_path, set()).add(path)
+
+    def get_affected(self, paths):
+        """ Return the paths and paths of all the modules importing them, even indirectly. """
+        affected = set(paths)
+        pending = list(paths)
+        while pending:
+            for importer in self.importers.get(pending.pop(), ()):
+                if importer not in affected:
+                    affected.add(importer)
+                    pending.append(importer)
+        return affected
@@ -4,25 +4,221 @@ from builtins import str
 from builtins import filter
 from builtins import object
 
+import os
+import time
+import zlib
+
+import pytest
+from _pytest.python import Class, Module
+
 import logging_tools
 from common import get_filter_regex
+from import_graph import get_project_modules
+from coverage_map import LineTracer, merge_lines
+
+try:
+    from _pytest.python import Package
+except ImportError:
+    # pytest < 3.7
+    Package = None
 
 
 logger = logging_tools.get_logger('runner.plugin')
+PYTEST_VERSION = tuple(int(part) for part in pytest.__version__.split('.')[:2])
+# fixtures of these scopes are shared by groups of tests, nodes bounding the groups
+SCOPE_NODES = {
+    'class': Class,
+    'module': Module,
+    'package': Package,
+}
+
+
+def get_rootdir(config):
+    return str(getattr(config, 'rootpath', config.rootdir))
+
+
+def make_file_node(node_class, path, parent):
+    if PYTEST_VERSION >= (7, 0):
+        import pathlib
+        return node_class.from_parent(parent, path=pathlib.Path(path))
+
+    import py
+    if PYTEST_VERSION >= (5, 4):
+        return node_class.from_parent(parent, fspath=py.path.local(path))
+    return node_class(py.path.local(path), parent)
+
+
+def get_file_shard(relpath, count):
+    """ Return shard of a test file unknown to the ui, the same in all the runners. """
+    return zlib.crc32(relpath.encode('utf-8')) % count
+
+
+class SkippedFile(pytest.File):
+    """
+    Test file not imported by this runner, its tests come from the collection
+    cache or are collected by another runner. It keeps the place of the file
+    in the collection order.
+    """
+    def collect(self):
+        return []
+
+
+def get_fixture_key(argname, node):
+    """ Return key of a fixture instance, shared by the tests under the scope node. """
+    return '{}@{}'.format(argname, node.nodeid)
+
+
+def get_fixture_keys(item):
+    """ Return keys of the class, module and package scoped fixtures used by the item. """
+    fixture_info = getattr(item, '_fixtureinfo', None)
+    if fixture_info is None:
+        return []
+
+    keys = []
+    for argname in fixture_info.names_closure:
+        fixturedefs = fixture_info.name2fixturedefs.get(argname)
+        if not fixturedefs:
+            continue
+        node_class = SCOPE_NODES.get(fixturedefs[-1].scope)
+        node = item.getparent(node_class) if node_class else None
+        if node is not None:
+            keys.append(get_fixture_key(argname, node))
+    return keys
 
 
 class PytestPlugin(object):
-    def __init__(self, runner, filter_value=None, config=None, select_tests=None):
+    def __init__(self, runner, filter_value=None, config=None, select_tests=None,
+                 collect_files=None, collection_cache=None, report_cached=True,
+                 collect_shard=None, track_imports=False, coverage_map=None):
         self.runner = runner
         self.filter_regex = get_filter_regex(filter_value)
         self.select_tests = select_tests
+        # files (relative to rootdir) to collect instead of the paths in pytest args
+        self.collect_files = collect_files
+        # unchanged files are not collected, their tests are reported from the cache
+        self.collection_cache = collection_cache
+        # report tests of the cached files, the ui may already know them
+        self.report_cached = report_cached
+        # (index, count, shards of the known files) when the runners split the collection
+        self.collect_shard = collect_shard
+        # record the import graph of the project modules into the collection cache
+        self.track_imports = track_imports
+        # lines run by the tests are recorded into the coverage map
+        self.coverage_map = coverage_map
+        self.tracer = None
+        self.rootdir = None
+        self.cached_files = set()
+        self.other_files = set()
+        # files whose tests were collected or are gone, failed files excluded
+        self.collected_files = []
+        self._file_order = []
+        self._failed_files = []
+        self._collected = []
+        # import and collection time of the collected files
+        self._durations = {}
+        # lines run by the tests and by the setup of their shared fixtures
+        self._coverage = {}
+        self._fixture_lines = {}
         logger.debug('plugin init %s %s', runner, filter_value)
 
+    def pytest_configure(self, config):
+        self.rootdir = get_rootdir(config)
+        if self.coverage_map is not None:
+            self.tracer = LineTracer(self.rootdir)
+        if self.collection_cache is not None:
+            self.collection_cache.validate(self.rootdir)
+
+        if not self.collect_files:
+            return
+
+        rootdir = get_rootdir(config)
+        paths = [os.path.join(rootdir, path) for path in self.collect_files]
+        # files removed since the last collection would make a usage error
+        paths = [path for path in paths if os.path.exists(path)]
+        if paths:
+            config.args[:] = paths
+            logger.debug('collection narrowed to %s', paths)
+
+    def pytest_sessionstart(self, session):
+        self.runner.session = session
+
+    def pytest_sessionfinish(self, session):
+        self.runner.session = None
+        if self.tracer is not None:
+            self.tracer.close()
+            if self._coverage:
+                self.coverage_map.record(self.rootdir, self._coverage,
+                                         get_project_modules(self.rootdir).values())
+
+    @pytest.hookimpl(hookwrapper=True)
     def pytest_runtest_protocol(self, item, nextitem):
         logger.debug('pytest_runtest_protocol %s %s', item.nodeid, nextitem)
+        if self.tracer is None:
+            yield
+            return
+
+        self.tracer.start()
+        yield
+        lines = self.tracer.stop()
+        # shared fixtures are set up by the first of their tests only
+        for key in get_fixture_keys(item):
+            merge_lines(lines, self._fixture_lines.get(key, {}))
+        self._coverage[self.runner.get_test_id(item)] = lines
 
     def pytest_collectreport(self, report):
         logger.debug('pytest_collectreport %s', report)
+        if self.collection_cache is not None and '::' not in report.nodeid:
+            self._file_order.append(report.nodeid)
+            if report.failed:
+                self._failed_files.append(report.nodeid)
+
+    def is_other_shard(self, relpath):
+        if self.collect_shard is None or os.path.basename(relpath) == '__init__.py':
+            return False
+
+        index, count, shards = self.collect_shard
+        shard = shards.get(relpath)
+        if shard is None:
+            shard = get_file_shard(relpath, count)
+        return shard != index
+
+    def make_module(self, path, parent):
+        """
+            Skip the test files of the other runners and the unchanged files,
+            report tests of the unchanged files from the collection cache.
+        """
+        relpath = os.path.relpath(path, self.rootdir)
+        if self.is_other_shard(relpath):
+            self.other_files.add(relpath)
+            return make_file_node(SkippedFile, path, parent)
+
+        entry = None
+        if self.collection_cache is not None:
+            entry = self.collection_cache.get_fresh(path)
+        if entry is None:
+            return None
+
+        logger.debug('collection cache hit %s', relpath)
+        self.cached_files.add(relpath)
+        if self.report_cached:
+            self.runner.tests_cached(entry['tests'], entry['fixtures'])
+        return make_file_node(SkippedFile, path, parent)
+
+    if PYTEST_VERSION >= (7, 0):
+        @pytest.hookimpl(tryfirst=True)
+        def pytest_pycollect_makemodule(self, module_path, parent):
+            return self.make_module(str(module_path), parent)
+    else:
+        @pytest.hookimpl(tryfirst=True)
+        def pytest_pycollect_makemodule(self, path, parent):
+            return self.make_module(str(path), parent)
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_make_collect_report(self, collector):
+        started = time.time()
+        yield
+        if isinstance(collector, Module):
+            self._durations[collector.nodeid] = time.time() - started
 
     def pytest_report_teststatus(self, report):
         logger.debug('pytest_report_teststatus %s', report)
@@ -93,11 +289,54 @@ class PytestPlugin(object):
                 )
             )
 
+        if config.option.collectonly:
+            for item in items:
+                test_id = self.runner.get_test_id(item)
+                fixtures = get_fixture_keys(item)
+                if fixtures:
+                    self.runner.set_test_fixtures(test_id, fixtures)
+                self._collected.append((test_id, fixtures))
+
         if self.filter_regex or self.select_tests:
             items[:] = list(filter(is_filtered, items))
 
         logger.debug('pytest_collection_modifyitems filtered  %s', [i.nodeid for i in items])
 
+    def pytest_collection_finish(self, session):
+        if self.collection_cache is None:
+            return
+
+        files = set(self.collection_cache.files)
+        files.update(test_id.split('::', 1)[0] for test_id, _fixtures in self._collected)
+        self.collected_files = sorted(
+            files - self.cached_files - self.other_files - set(self._failed_files)
+        )
+
+        self.collection_cache.update(self.rootdir, self._collected, self.cached_files,
+                                     self._file_order, self._failed_files, self.other_files,
+                                     self._durations)
+        if self.track_imports:
+            self.collection_cache.update_imports(get_project_modules(self.rootdir))
+        self.collection_cache.save()
+        logger.info('collection cache saved, cached files: %s, collected tests: %s',
+                    len(self.cached_files), len(self._collected))
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_fixture_setup(self, fixturedef, request):
+        shared = fixturedef.scope in SCOPE_NODES and request.node is not None
+        traced = shared and self.tracer is not None and self.tracer.lines is not None
+        if traced:
+            self.tracer.push()
+        started = time.time()
+        yield
+        if traced:
+            lines = self.tracer.pop()
+        if shared:
+            key = get_fixture_key(fixturedef.argname, request.node)
+            self.runner.set_fixture_duration(key, time.time() - started)
+            if traced:
+                self._fixture_lines[key] = lines
+
     def pytest_exception_interact(self, node, call, report):
         logger.debug('pytest_exception_interact %s %s %s', node.nodeid, call, report)
         self.runner.set_exception_info(node.nodeid, call.excinfo, call.when, False, None)
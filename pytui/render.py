@@ -0,0 +1,104 @@
+"""
+Main loop drawing the screen at a limited frame rate.
+
+Urwid draws the screen whenever its loop goes idle, after every batch of
+runner messages. The widgets changed by the messages are only invalidated,
+the screen is drawn at most fps times per second, a skipped frame is drawn
+by an alarm at the end of the frame interval. Input is drawn immediately.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import time
+
+import urwid
+
+from logging_tools import get_logger
+
+
+logger = get_logger('ui', 'render')
+DEFAULT_FPS = 30
+# frame statistics are logged this often (seconds)
+STATS_INTERVAL = 5.0
+
+
+class FrameStats(object):
+    """ Counts of the drawn and skipped frames and the draw durations. """
+    def __init__(self):
+        self.reset(time.time())
+
+    def reset(self, now):
+        self.started = now
+        self.frames = 0
+        self.skipped = 0
+        self.draw_time = 0.0
+        self.max_draw_time = 0.0
+
+    def add_frame(self, duration):
+        self.frames += 1
+        self.draw_time += duration
+        self.max_draw_time = max(self.max_draw_time, duration)
+
+    def log(self, now):
+        elapsed = now - self.started
+        if self.frames:
+            logger.debug(
+                'Frames: %s in %.1fs (%.1f fps), skipped %s, draw %.1fms avg, %.1fms max',
+                self.frames, elapsed, self.frames / elapsed, self.skipped,
+                self.draw_time / self.frames * 1000, self.max_draw_time * 1000
+            )
+        self.reset(now)
+
+
+class RenderLoop(urwid.MainLoop):
+    """
+    Urwid main loop drawing the screen at most fps times per second,
+    the screen is drawn immediately after the input.
+    """
+    def __init__(self, *args, **kwargs):
+        fps = kwargs.pop('fps', DEFAULT_FPS)
+        super(RenderLoop, self).__init__(*args, **kwargs)
+        self.frame_interval = 1.0 / fps
+        self.stats = FrameStats()
+        self._last_draw = 0.0
+        self._draw_alarm = None
+        self._input = False
+
+    def process_input(self, keys):
+        self._input = True
+        return super(RenderLoop, self).process_input(keys)
+
+    def entering_idle(self):
+        if not self.screen.started:
+            return
+
+        now = time.time()
+        if self._input or now - self._last_draw >= self.frame_interval:
+            self.draw_screen()
+        else:
+            self.stats.skipped += 1
+            if self._draw_alarm is None:
+                self._draw_alarm = self.set_alarm_at(self._last_draw + self.frame_interval,
+                                                     self._draw_skipped)
+
+    def _draw_skipped(self, main_loop, user_data=None):
+        # the screen is drawn when the loop goes idle after the alarm
+        self._draw_alarm = None
+
+    def draw_screen(self):
+        started = time.time()
+        super(RenderLoop, self).draw_screen()
+        now = time.time()
+
+        self._input = False
+        self._last_draw = now
+        if self._draw_alarm is not None:
+            self.remove_alarm(self._draw_alarm)
+            self._draw_alarm = None
+
+        self.stats.add_frame(now - started)
+        if now - self.stats.started >= STATS_INTERVAL:
+            self.stats.log(now)
+
+    def log_stats(self):
+        self.stats.log(time.time())
@@ -3,28 +3,30 @@
 
 from __future__ import absolute_import
 from __future__ import unicode_literals
-from builtins import bytes
 from builtins import str
 from future import standard_library
 standard_library.install_aliases()
-from builtins import range
 from builtins import object
 
-import os
 import sys
-import json
+import time
+import signal
+import threading
 import traceback
 from collections import OrderedDict
 
 
-from tblib import Traceback
 import pytest
 from _pytest.runner import Skipped
 
 import logging_tools
 from logging_tools import get_logger, LogWriter
 from plugin import PytestPlugin
-from common import PytestExitcodes
+from common import PytestExitcodes, CANCEL_SIGNAL
+from codec import get_encoder, DEFAULT_CODEC
+from blobstore import BlobWriter
+from collection_cache import CollectionCache, get_cache_path
+from coverage_map import CoverageMap, get_coverage_path
 
 log_name = 'runner'
 logger = get_logger(log_name)
@@ -33,71 +35,120 @@ stdout_logger = get_logger(log_name, 'stdout')
 stdout_logger_writer = LogWriter(stdout_logger)
 stderr_logger = get_logger(log_name, 'stderr')
 stderr_logger_writer = LogWriter(stderr_logger)
-PIPE_LIMIT = 4096
-
-
-def get_chunks(string):
-    for offset in range(0, len(string), PIPE_LIMIT):
-        yield string[offset:offset + PIPE_LIMIT]
+# flush the pending message batch when it grows over this size (bytes) ...
+BATCH_SIZE_LIMIT = 65536
+# ... or when its oldest message is waiting longer than this (seconds)
+BATCH_INTERVAL = 0.005
+CAPTURED_OUTPUT_SECTIONS = ('Captured stdout', 'Captured stderr')
 
 
 class Runner(object):
-    def __init__(self, write_pipe=None, pipe_size=None, pipe_semaphore=None):
+    # runner running the tests in this process
+    running = None
+
+    def __init__(self, writer=None, codec=DEFAULT_CODEC, blob_dir=None):
         self.tests = OrderedDict()
+        # pytest session in progress
+        self.session = None
         logger.debug('%s Init', self.__class__.__name__)
-        self.write_pipe = os.fdopen(write_pipe, 'wb', 0)
-        self.pipe_size = pipe_size
-        self.pipe_semaphore = pipe_semaphore
+        self.writer = writer
+        self.codec = codec
+        self.encoder = get_encoder(codec)
+        # without the blob store, the output is sent to the ui directly
+        self.blobs = BlobWriter(blob_dir) if blob_dir else None
+        # number of report sections already sent, by test id
+        self._sent_sections = {}
+
+        # messages are collected into batches, one batch is sent as a single frame
+        self._batch = []
+        self._batch_size = 0
+        self._batch_started = None
+        self._batch_lock = threading.RLock()
+        self._batch_pending = threading.Event()
+        self._flush_thread = threading.Thread(target=self._flush_periodically,
+                                              name='pytui-flush')
+        self._flush_thread.daemon = True
+        self._flush_thread.start()
 
     def pipe_send(self, method, **kwargs):
-        data = bytes(b'%s\n' % json.dumps({
-            'method': method,
-            'params': kwargs
-        }).encode('utf-8'))
-
-        data_size = len(data)
-        pipe_logger.debug('pipe write, data size: %s, pipe size: %s',
-                          data_size, self.pipe_size.value)
-        pipe_logger.debug('data: %s', data)
+        with self._batch_lock:
+            # the encoder is stateful, the strings are defined before their references
+            message = self.encoder.encode(method, kwargs)
+            if not self._batch:
+                self._batch_started = time.time()
+                self._batch_pending.set()
+            self._batch.append(message)
+            self._batch_size += len(message)
+
+            if (
+                self._batch_size >= BATCH_SIZE_LIMIT or
+                time.time() - self._batch_started >= BATCH_INTERVAL
+            ):
+                self._flush()
+
+    def new_session(self):
+        """
+            Start a new encoder session, the ui forgets the strings sent before.
+            Needed when other runners have started their sessions on the same pipe.
+        """
+        with self._batch_lock:
+            self._flush()
+            self.encoder = get_encoder(self.codec)
+
+    def flush(self):
+        """ Send all pending messages to the pipe. """
+        with self._batch_lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._batch:
+            return
+
+        data = self.encoder.join(self._batch)
+        message_count = len(self._batch)
+        self._batch = []
+        self._batch_size = 0
 
-        for chunk in get_chunks(data):
-            self.pipe_send_chunk(chunk)
+        pipe_logger.debug('pipe write, messages: %s, data size: %s',
+                          message_count, len(data))
+        pipe_logger.debug('data: %s', data)
+        self.writer.send(data)
 
-    def pipe_send_chunk(self, chunk):
-        chunk_size = len(chunk)
-        # wait for pipe to empty
-        # pipe_logger.debug('pipe_send_chunk')
+    def _flush_periodically(self):
+        """ Flush thread main loop, sends batches which stopped growing. """
         while True:
-            # pipe_logger.debug('pipe check cycle')
-            with self.pipe_size.get_lock():
-                pipe_writable = self.pipe_size.value + chunk_size <= PIPE_LIMIT
-                if pipe_writable:
-                    pipe_logger.debug('pipe writable')
-                    break
-
-                pipe_logger.debug('no space in pipe: %d', self.pipe_size.value)
-                pipe_logger.debug('  waiting for reader')
-                self.pipe_semaphore.clear()
-            self.pipe_semaphore.wait()
-            pipe_logger.debug('  reader finished')
-
-        with self.pipe_size.get_lock():
-            self.pipe_size.value += chunk_size
-            self.write_pipe.write(chunk)
-            pipe_logger.debug('writing to pipe: %s', chunk)
+            self._batch_pending.wait()
+            time.sleep(BATCH_INTERVAL)
+            with self._batch_lock:
+                self._batch_pending.clear()
+                self._flush()
 
     def set_test_result(self, test_id, report):
-        output = \
-            getattr(report, 'capstdout', '') + \
-            getattr(report, 'capstderr', '')
+        # report sections are cumulative, send only those added in this phase
+        sections = getattr(report, 'sections', [])
+        sent_count = self._sent_sections.pop(test_id, 0)
+        if report.when != 'teardown':
+            self._sent_sections[test_id] = len(sections)
+
+        output = ''.join(
+            content
+            for title, content in sections[sent_count:]
+            if title.startswith(CAPTURED_OUTPUT_SECTIONS)
+        )
+        output_blob = None
+        if self.blobs:
+            output_blob = self.blobs.write(output)
+            output = ''
 
         self.pipe_send(
             'set_test_result',
             test_id=test_id,
             output=output,
+            output_blob=output_blob,
             result_state=self.result_state(report),
             when=report.when,
-            outcome=report.outcome
+            outcome=report.outcome,
+            duration=getattr(report, 'duration', None)
         )
 
     def set_test_state(self, test_id, state):
@@ -124,26 +175,52 @@ class Runner(object):
                 if xfail_strict:
                     logger.debug('LF EXEMPT %s', test_id)
             return
+        exc_value = traceback.format_exception_only(excinfo.type, excinfo.value)[-1]
+        formatted_traceback = None
         if wasxfail:
             result = 'xfail'
-            extracted_traceback = Traceback(excinfo.tb).to_dict()
+            formatted_traceback = self.format_traceback(excinfo, exc_value)
         elif excinfo.type is Skipped:
             result = 'skipped'
-            extracted_traceback = None
         else:
             result = 'failed'
-            extracted_traceback = Traceback(excinfo.tb).to_dict()
+            formatted_traceback = self.format_traceback(excinfo, exc_value)
+
+        traceback_blob = None
+        if self.blobs:
+            traceback_blob = self.blobs.write(formatted_traceback)
+            formatted_traceback = None
 
         self.pipe_send(
             'set_exception_info',
             test_id=test_id,
             exc_type=repr(excinfo.type),
-            exc_value=traceback.format_exception_only(excinfo.type, excinfo.value)[-1],
-            extracted_traceback=extracted_traceback,
+            exc_value=exc_value,
+            formatted_traceback=formatted_traceback,
+            traceback_blob=traceback_blob,
             result_state=result,
             when=when
         )
 
+    def format_traceback(self, excinfo, exc_value):
+        return ''.join(
+            traceback.format_list(traceback.extract_tb(excinfo.tb)) + [exc_value]
+        )
+
+    def set_test_fixtures(self, test_id, fixtures):
+        self.pipe_send(
+            'set_test_fixtures',
+            test_id=test_id,
+            fixtures=fixtures
+        )
+
+    def set_fixture_duration(self, fixture, duration):
+        self.pipe_send(
+            'set_fixture_duration',
+            fixture=fixture,
+            duration=duration
+        )
+
     def set_pytest_error(self, exitcode, description=None):
         self.pipe_send(
             'set_pytest_error',
@@ -154,6 +231,14 @@ class Runner(object):
     def get_test_id(self, test):
         raise NotImplementedError()
 
+    @staticmethod
+    def cancel_running(signum=None, frame=None):
+        """ Stop the running tests after the current test, handler of the cancel signal. """
+        runner = Runner.running
+        if runner is not None and runner.session is not None:
+            logger.info('Test run cancelled')
+            runner.session.shouldstop = 'Test run cancelled'
+
 
 class PytestRunner(Runner):
     _test_fail_states = ['failed', 'error', None, '']
@@ -162,25 +247,45 @@ class PytestRunner(Runner):
         return test.nodeid  # .replace('/', '.')
 
     @classmethod
-    def process_init_tests(cls, write_pipe, pipe_size, pipe_semaphore, debug, pytest_args):
-        """ Class method as separate process entrypoint. """
+    def configure_process(cls, debug):
+        """ Set up logging, output redirection and the cancel signal of a runner process. """
         logging_tools.configure('pytui-runner.log', debug)
+        signal.signal(CANCEL_SIGNAL, cls.cancel_running)
 
         sys.stdout = stdout_logger_writer
         sys.stderr = stderr_logger_writer
 
-        runner = cls(write_pipe=write_pipe, pipe_size=pipe_size, pipe_semaphore=pipe_semaphore)
-        exitcode, description = runner.init_tests(pytest_args)
+    @classmethod
+    def process_init_tests(cls, writer, debug, pytest_args, codec=DEFAULT_CODEC,
+                           blob_dir=None, use_cache=False, collect_shard=None,
+                           track_imports=False):
+        """ Class method as separate process entrypoint. """
+        cls.configure_process(debug)
+
+        runner = cls(writer=writer, codec=codec, blob_dir=blob_dir)
+        return runner.init_tests_command(pytest_args, use_cache, collect_shard, track_imports)
+
+    def init_tests_command(self, pytest_args, use_cache=False, collect_shard=None,
+                           track_imports=False):
+        """ Collect the tests and report the end of the collection to ui. """
+        exitcode, description = self.init_tests(pytest_args, use_cache, collect_shard,
+                                                track_imports)
 
         if exitcode != PytestExitcodes.ALL_COLLECTED:
             logger.warning('pytest failed with exitcode %d', exitcode)
-            runner.set_pytest_error(exitcode, description)
+            self.set_pytest_error(exitcode, description)
 
         logger.info('Init finished')
-        runner.pipe_send('init_finished')
+        self.pipe_send('init_finished')
+        self.flush()
         return exitcode
 
-    def init_tests(self, pytest_args):
+    def init_tests(self, pytest_args, use_cache=False, collect_shard=None, track_imports=False):
+        """
+            Collect the tests. With collect_shard (index, count, shards of the files)
+            only files of the shard are collected, other runners collect the rest.
+            With track_imports, the import graph is recorded into the collection cache.
+        """
         logger.debug('Running pytest --collect-only')
 
         args = [
@@ -188,36 +293,111 @@ class PytestRunner(Runner):
             '--collect-only',
         ] + pytest_args
 
+        # without the cache loaded, all the files are collected and the cache rewritten
+        collection_cache = CollectionCache(get_cache_path(pytest_args))
+        if use_cache:
+            collection_cache.load()
+        plugin = PytestPlugin(runner=self, collection_cache=collection_cache,
+                              collect_shard=collect_shard, track_imports=track_imports)
+
         try:
-            exitcode = pytest.main(args,
-                                   plugins=[PytestPlugin(runner=self)])
+            exitcode = pytest.main(args, plugins=[plugin])
         except Exception as e:
             return PytestExitcodes.CRASHED, traceback.format_exc(e)
 
+        if (
+            exitcode == PytestExitcodes.NO_TESTS_COLLECTED and
+            (plugin.cached_files or plugin.other_files)
+        ):
+            # all the tests came from the cache or other runners
+            exitcode = PytestExitcodes.ALL_COLLECTED
+
         return exitcode, None
 
     @classmethod
-    def process_run_tests(cls, failed_only, filtered, write_pipe,
-                          pipe_size, pipe_semaphore, filter_value, debug,
-                          pytest_args, select_tests):
+    def process_recollect_tests(cls, writer, debug, pytest_args, codec=DEFAULT_CODEC,
+                                blob_dir=None, track_imports=False):
+        """ Class method as separate process entrypoint. """
+        cls.configure_process(debug)
+
+        runner = cls(writer=writer, codec=codec, blob_dir=blob_dir)
+        return runner.recollect_tests_command(pytest_args, track_imports)
+
+    def recollect_tests_command(self, pytest_args, track_imports=False):
+        """
+            Collect the files changed since the last collection, report their tests
+            and the list of the files to ui.
+        """
+        exitcode, description, files = self.recollect_tests(pytest_args, track_imports)
+
+        if exitcode != PytestExitcodes.ALL_COLLECTED:
+            logger.warning('pytest failed with exitcode %d', exitcode)
+            self.set_pytest_error(exitcode, description)
+
+        logger.info('Recollect finished, files: %s', files)
+        self.pipe_send('recollect_finished', files=files)
+        self.flush()
+        return exitcode
+
+    def recollect_tests(self, pytest_args, track_imports=False):
+        logger.debug('Running pytest --collect-only of the changed files')
+
+        args = [
+            '-vv',
+            '--collect-only',
+        ] + pytest_args
+
+        collection_cache = CollectionCache(get_cache_path(pytest_args))
+        collection_cache.load()
+        plugin = PytestPlugin(runner=self, collection_cache=collection_cache,
+                              report_cached=False, track_imports=track_imports)
+
+        try:
+            exitcode = pytest.main(args, plugins=[plugin])
+        except Exception as e:
+            return PytestExitcodes.CRASHED, traceback.format_exc(e), []
+
+        if exitcode == PytestExitcodes.NO_TESTS_COLLECTED and plugin.cached_files:
+            exitcode = PytestExitcodes.ALL_COLLECTED
+
+        return exitcode, None, plugin.collected_files
+
+    def warm_up_command(self, pytest_args):
+        """ Import the test modules by a collection, without reporting it to ui. """
+        logger.info('Warming up')
+        try:
+            pytest.main(['--collect-only', '-q'] + pytest_args)
+        except Exception:
+            logger.exception('Failed to warm up')
+
+    @classmethod
+    def process_run_tests(cls, failed_only, filtered, writer, filter_value, debug,
+                          pytest_args, select_tests, codec=DEFAULT_CODEC, blob_dir=None,
+                          collect_files=None, record_coverage=False):
         """ Class method as a separate process entrypoint """
-        logging_tools.configure('pytui-runner.log', debug)
-        logger = get_logger(log_name)
+        cls.configure_process(debug)
+
+        runner = cls(writer=writer, codec=codec, blob_dir=blob_dir)
+        return runner.run_tests_command(failed_only, filtered, filter_value,
+                                        pytest_args, select_tests, collect_files,
+                                        record_coverage)
+
+    def run_tests_command(self, failed_only, filtered, filter_value, pytest_args,
+                          select_tests, collect_files=None, record_coverage=False):
+        """ Run the tests and report the end of the run to ui. """
         logger.info(
-            'Test run started (failed_only: %s, filtered: %s, pytest args: %s, select_tests: %s)',
-            failed_only, filtered, ' '.join(pytest_args), select_tests
+            'Test run started (failed_only: %s, filtered: %s, pytest args: %s, select_tests: %s, '
+            'collect_files: %s)',
+            failed_only, filtered, ' '.join(pytest_args), select_tests, collect_files
         )
 
-        sys.stdout = stdout_logger_writer
-        sys.stderr = stderr_logger_writer
-
-        runner = cls(write_pipe=write_pipe, pipe_size=pipe_size,
-                     pipe_semaphore=pipe_semaphore)
         try:
-            exitcode, description = runner.run_tests(failed_only,
-                                                     filter_value,
-                                                     pytest_args,
-                                                     select_tests)
+            exitcode, description = self.run_tests(failed_only,
+                                                   filter_value,
+                                                   pytest_args,
+                                                   select_tests,
+                                                   collect_files,
+                                                   record_coverage)
         except Exception as exc:
             exitcode = PytestExitcodes.CRASHED
             description = str(exc)
@@ -228,10 +408,11 @@ class PytestRunner(Runner):
                         PytestExitcodes.NO_TESTS_COLLECTED,
                         PytestExitcodes.CRASHED):
             logger.warning('pytest failed with exitcode %d', exitcode)
-            runner.set_pytest_error(exitcode, description)
+            self.set_pytest_error(exitcode, description)
 
         logger.info('Test run finished')
-        runner.pipe_send('run_finished')
+        self.pipe_send('run_finished')
+        self.flush()
 
         return exitcode
 
@@ -239,7 +420,19 @@ class PytestRunner(Runner):
         # self.tests[self.get_test_id(item)] = item
         self.pipe_send('item_collected', item_id=self.get_test_id(item))
 
-    def run_tests(self, failed_only, filter_value, pytest_args, select_tests=None):
+    def tests_cached(self, test_ids, fixtures):
+        """ Report tests of a file skipped by the collection, found in the cache. """
+        for test_id in test_ids:
+            self.pipe_send('item_collected', item_id=test_id)
+            if test_id in fixtures:
+                self.set_test_fixtures(test_id, fixtures[test_id])
+
+    def run_tests(self, failed_only, filter_value, pytest_args, select_tests=None,
+                  collect_files=None, record_coverage=False):
+        """
+            Run the tests, with record_coverage the lines run by every test
+            are recorded into the coverage map.
+        """
         args = [
             '-vv',
         ]
@@ -247,6 +440,11 @@ class PytestRunner(Runner):
             args.append('--lf')
         args += pytest_args
 
+        coverage_map = None
+        if record_coverage:
+            coverage_map = CoverageMap(get_coverage_path(pytest_args))
+
+        Runner.running = self
         try:
             exitcode = pytest.main(
                 args,
@@ -254,12 +452,16 @@ class PytestRunner(Runner):
                     PytestPlugin(
                         runner=self,
                         filter_value=filter_value,
-                        select_tests=select_tests
+                        select_tests=select_tests,
+                        collect_files=collect_files,
+                        coverage_map=coverage_map
                     )
                 ]
             )
         except Exception as e:
             return PytestExitcodes.CRASHED, traceback.format_exc(e)
+        finally:
+            Runner.running = None
 
         return exitcode, None
 
@@ -0,0 +1,163 @@
+"""
+Duration-aware scheduling of test runs.
+
+Durations of the tests are recorded by the ui and persisted between sessions.
+They are used to split the tests among the workers and to estimate the time
+remaining to the end of a run.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import unicode_literals
+from builtins import object
+
+import os
+import json
+import heapq
+
+from logging_tools import get_logger
+
+
+logger = get_logger('scheduler')
+
+
+class Durations(object):
+    """
+    Recorded durations (sum of all the phases) of the tests, by test id.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._durations = {}
+        self._changed = False
+
+    def __len__(self):
+        return len(self._durations)
+
+    def get(self, test_id, default=None):
+        return self._durations.get(test_id, default)
+
+    def set(self, test_id, duration):
+        self._durations[test_id] = duration
+        self._changed = True
+
+    def load(self):
+        try:
+            with open(self.path) as durations_file:
+                durations = json.load(durations_file)
+        except (IOError, OSError, ValueError):
+            logger.info('No recorded durations in %s', self.path)
+            return
+
+        if isinstance(durations, dict):
+            self._durations = durations
+
+    def save(self):
+        """ Write the durations, if they have changed, replacing the file atomically. """
+        if not self._changed:
+            return
+
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        temp_path = '{}.{}'.format(self.path, os.getpid())
+        with open(temp_path, 'w') as durations_file:
+            json.dump(self._durations, durations_file)
+        os.rename(temp_path, self.path)
+        self._changed = False
+
+    def get_default(self, test_ids):
+        """ Return the duration assumed for tests never run, mean of the known ones. """
+        known = [self._durations[test_id] for test_id in test_ids if test_id in self._durations]
+        if not known:
+            return None
+        return sum(known) / len(known)
+
+
+def split_tests(test_ids, count):
+    """
+        Split the tests into count contiguous chunks of about the same size,
+        tests of a module mostly stay together and share its fixtures.
+    """
+    size, rest = divmod(len(test_ids), count)
+    chunks = []
+    start = 0
+    for index in range(count):
+        end = start + size + (1 if index < rest else 0)
+        chunks.append(test_ids[start:end])
+        start = end
+    return chunks
+
+
+def group_tests(test_ids, test_durations, count, fixtures, fixture_durations):
+    """
+        Return list of (duration, test indexes) units, tests of a unit should run
+        in the same worker.
+
+        Tests sharing an instance of a fixture with a recorded setup cost are
+        merged into a unit, the most expensive fixtures first. Units are never
+        merged over the fair share of a single worker, a unit that large would
+        cost more in the wall-clock time than the repeated fixture setup.
+    """
+    parent = list(range(len(test_ids)))
+    weights = list(test_durations)
+
+    def find(index):
+        while parent[index] != index:
+            parent[index] = parent[parent[index]]
+            index = parent[index]
+        return index
+
+    fixture_tests = {}
+    for index, test_id in enumerate(test_ids):
+        for fixture in fixtures.get(test_id, ()):
+            fixture_tests.setdefault(fixture, []).append(index)
+
+    costs = [
+        (fixture_durations.get(fixture), fixture)
+        for fixture, indexes in fixture_tests.items()
+        if len(indexes) > 1 and fixture_durations.get(fixture)
+    ]
+    limit = sum(test_durations) / count
+    for _cost, fixture in sorted(costs, reverse=True):
+        roots = set(find(index) for index in fixture_tests[fixture])
+        if len(roots) < 2 or sum(weights[root] for root in roots) > limit:
+            continue
+        root = roots.pop()
+        for other in roots:
+            parent[other] = root
+            weights[root] += weights[other]
+
+    units = {}
+    for index in range(len(test_ids)):
+        units.setdefault(find(index), []).append(index)
+    return [(weights[root], indexes) for root, indexes in units.items()]
+
+
+def schedule(test_ids, durations, count, fixtures=None, fixture_durations=None):
+    """
+        Split the tests into count shards of about the same total duration.
+
+        Longest processing time first: the units of tests (see group_tests) sorted
+        by duration (longest first) are assigned one by one to the least loaded shard.
+        Tests keep their original order within the shard. Without any recorded
+        durations the tests are split into contiguous chunks.
+    """
+    default = durations.get_default(test_ids)
+    if default is None or count == 1:
+        return split_tests(test_ids, count)
+
+    test_durations = [durations.get(test_id, default) for test_id in test_ids]
+    if fixtures and fixture_durations is not None:
+        units = group_tests(test_ids, test_durations, count, fixtures, fixture_durations)
+    else:
+        units = [(duration, [index]) for index, duration in enumerate(test_durations)]
+
+    # sort by the first test on ties, to keep the order stable
+    units.sort(key=lambda unit: (-unit[0], unit[1][0]))
+    loads = [(0.0, shard) for shard in range(count)]
+    shards = [[] for _shard in range(count)]
+    for duration, indexes in units:
+        load, shard = heapq.heappop(loads)
+        shards[shard].extend(indexes)
+        heapq.heappush(loads, (load + duration, shard))
+
+    return [[test_ids[index] for index in sorted(shard)] for shard in shards]
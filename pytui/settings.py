@@ -4,4 +4,7 @@ DEBUG_MODULES = [
     # 'pytui',
 ]
 
+# recorded test durations and other data kept between sessions, relative to cwd
+CACHE_DIR = '.pytui_cache'
+
 VERSION = '0.5'
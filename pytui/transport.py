@@ -0,0 +1,291 @@
+from __future__ import absolute_import
+from __future__ import unicode_literals
+from builtins import object
+
+import os
+import time
+import errno
+import fcntl
+import struct
+from collections import OrderedDict
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    # python < 3.8
+    shared_memory = None
+
+from logging_tools import get_logger
+
+
+logger = get_logger('transport')
+
+# frame header, holds the length of the frame payload
+FRAME_HEADER = struct.Struct('>I')
+# size of single read from the pipe
+READ_SIZE = 65536
+# maximum amount of data read from the pipe in a single ui wakeup
+READ_LIMIT = 1024 * 1024
+
+# shared memory ring buffer layout, head and tail are kept on separate cache lines
+RING_COUNTER = struct.Struct('Q')
+RING_HEAD_OFFSET = 0
+RING_TAIL_OFFSET = 64
+RING_DATA_OFFSET = 128
+RING_CAPACITY = 4 * 1024 * 1024
+# writer waiting for free space in the ring sleeps for this long (seconds) ...
+RING_WAIT = 0.0005
+# ... and repeats the reader wakeup when waiting longer than this (seconds)
+RING_WAKEUP_REPEAT = 0.05
+# reader polls the ring in this interval, in case a wakeup was missed (seconds)
+RING_POLL_INTERVAL = 0.1
+
+
+def set_nonblocking(fd):
+    flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+    fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+
+def read_available(fd, limit=READ_LIMIT):
+    """ Return data available in the non-blocking fd (up to limit), never block. """
+    chunks = []
+    size = 0
+    while size < limit:
+        try:
+            data = os.read(fd, READ_SIZE)
+        except OSError as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                break
+            raise
+
+        if not data:
+            break
+
+        chunks.append(data)
+        size += len(data)
+
+    return b''.join(chunks)
+
+
+class FrameDecoder(object):
+    """
+    Incremental decoder of length-prefixed frames.
+
+    Received data are appended to a bytearray, a read offset points to the first
+    byte of the first incomplete frame. Complete frames are returned as memoryviews
+    into the buffer, so they are valid only until the next call of feed().
+    """
+    # drop the consumed part of the buffer when it grows over this size
+    COMPACT_SIZE = 65536
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._offset = 0
+        self._frames = []
+
+    def __len__(self):
+        """ Return number of bytes waiting for completion of a frame. """
+        return len(self._buffer) - self._offset
+
+    def _release(self):
+        for frame in self._frames:
+            frame.release()
+        self._frames = []
+
+        if self._offset and (
+            self._offset == len(self._buffer) or self._offset >= self.COMPACT_SIZE
+        ):
+            del self._buffer[:self._offset]
+            self._offset = 0
+
+    def feed(self, data):
+        """ Append received data, return list of all frames completed by them. """
+        self._release()
+        self._buffer += data
+
+        buffer_size = len(self._buffer)
+        offset = self._offset
+        view = memoryview(self._buffer)
+        while buffer_size - offset >= FRAME_HEADER.size:
+            (frame_size,) = FRAME_HEADER.unpack_from(self._buffer, offset)
+            frame_end = offset + FRAME_HEADER.size + frame_size
+            if frame_end > buffer_size:
+                break
+
+            self._frames.append(view[offset + FRAME_HEADER.size:frame_end])
+            offset = frame_end
+
+        view.release()
+        self._offset = offset
+        return list(self._frames)
+
+
+class FrameWriter(object):
+    """
+    Runner end of the transport. Writes length-prefixed frames into the pipe.
+    The pipe is blocking, so the writer waits while the pipe is full
+    (the kernel takes care of the backpressure).
+    """
+    def __init__(self, write_fd):
+        self.write_fd = write_fd
+
+    def send(self, payload):
+        data = memoryview(FRAME_HEADER.pack(len(payload)) + payload)
+        while data:
+            written = os.write(self.write_fd, data)
+            data = data[written:]
+
+
+class PipeTransport(object):
+    """
+    UI end of the transport. Owns the pipe, reads from its non-blocking end.
+    """
+    poll_interval = None
+
+    def __init__(self):
+        self.read_fd, self.write_fd = os.pipe()
+        set_nonblocking(self.read_fd)
+
+    def fileno(self):
+        return self.read_fd
+
+    def get_writer(self):
+        return FrameWriter(self.write_fd)
+
+    def read(self):
+        """ Return all the data available in the pipe (up to READ_LIMIT), never block. """
+        data = read_available(self.read_fd)
+        logger.debug('read %s bytes from pipe', len(data))
+        return data
+
+    def close(self):
+        os.close(self.read_fd)
+        os.close(self.write_fd)
+
+
+class RingWriter(object):
+    """
+    Runner end of the shared memory transport, the single producer of the ring.
+    Writes length-prefixed frames into the ring, waits while the ring is full.
+    The reader is woken up through the pipe only when the ring was empty.
+
+    Relies on the fork start method, the shared memory block is inherited
+    from the ui process.
+    """
+    def __init__(self, shm, capacity, wakeup_fd):
+        self.shm = shm
+        self.capacity = capacity
+        self.wakeup_fd = wakeup_fd
+
+    def wakeup(self):
+        os.write(self.wakeup_fd, b'\0')
+
+    def send(self, payload):
+        data = memoryview(FRAME_HEADER.pack(len(payload)) + payload)
+        buf = self.shm.buf
+        capacity = self.capacity
+        wait_started = None
+        while data:
+            (head,) = RING_COUNTER.unpack_from(buf, RING_HEAD_OFFSET)
+            (tail,) = RING_COUNTER.unpack_from(buf, RING_TAIL_OFFSET)
+            free = capacity - (head - tail)
+            if not free:
+                now = time.time()
+                if wait_started is None or now - wait_started > RING_WAKEUP_REPEAT:
+                    # the reader should be draining the ring already, make sure it is awake
+                    self.wakeup()
+                    wait_started = now
+                time.sleep(RING_WAIT)
+                continue
+
+            size = min(free, len(data))
+            position = head % capacity
+            first_part = min(size, capacity - position)
+            start = RING_DATA_OFFSET + position
+            buf[start:start + first_part] = data[:first_part]
+            if size > first_part:
+                buf[RING_DATA_OFFSET:RING_DATA_OFFSET + size - first_part] = \
+                    data[first_part:size]
+            data = data[size:]
+            wait_started = None
+
+            RING_COUNTER.pack_into(buf, RING_HEAD_OFFSET, head + size)
+            (tail,) = RING_COUNTER.unpack_from(buf, RING_TAIL_OFFSET)
+            if tail == head:
+                # ring was empty, the reader may be sleeping
+                self.wakeup()
+
+
+class SharedMemoryTransport(object):
+    """
+    UI end of the shared memory transport, a single producer / single consumer
+    ring buffer. Head and tail are monotonic byte counters, the producer moves
+    the head, the consumer moves the tail. The wakeup pipe is watched by the ui
+    main loop as the pipe of PipeTransport.
+    """
+    poll_interval = RING_POLL_INTERVAL
+
+    def __init__(self, capacity=RING_CAPACITY):
+        self.capacity = capacity
+        self.shm = shared_memory.SharedMemory(create=True, size=RING_DATA_OFFSET + capacity)
+        RING_COUNTER.pack_into(self.shm.buf, RING_HEAD_OFFSET, 0)
+        RING_COUNTER.pack_into(self.shm.buf, RING_TAIL_OFFSET, 0)
+        self.wakeup_read_fd, self.wakeup_write_fd = os.pipe()
+        set_nonblocking(self.wakeup_read_fd)
+
+    def fileno(self):
+        return self.wakeup_read_fd
+
+    def get_writer(self):
+        return RingWriter(self.shm, self.capacity, self.wakeup_write_fd)
+
+    def read(self):
+        """ Return all the data available in the ring (up to READ_LIMIT), never block. """
+        read_available(self.wakeup_read_fd, limit=1)
+
+        buf = self.shm.buf
+        capacity = self.capacity
+        chunks = []
+        size = 0
+        while size < READ_LIMIT:
+            (head,) = RING_COUNTER.unpack_from(buf, RING_HEAD_OFFSET)
+            (tail,) = RING_COUNTER.unpack_from(buf, RING_TAIL_OFFSET)
+            if head == tail:
+                break
+
+            available = min(head - tail, READ_LIMIT - size)
+            position = tail % capacity
+            first_part = min(available, capacity - position)
+            start = RING_DATA_OFFSET + position
+            chunks.append(bytes(buf[start:start + first_part]))
+            if available > first_part:
+                chunks.append(bytes(
+                    buf[RING_DATA_OFFSET:RING_DATA_OFFSET + available - first_part]
+                ))
+            size += available
+            # release the space to the writer, then check the head again
+            RING_COUNTER.pack_into(buf, RING_TAIL_OFFSET, tail + available)
+        else:
+            # read limit reached, make sure the main loop comes back for the rest
+            os.write(self.wakeup_write_fd, b'\0')
+
+        logger.debug('read %s bytes from ring', size)
+        return b''.join(chunks)
+
+    def close(self):
+        os.close(self.wakeup_read_fd)
+        os.close(self.wakeup_write_fd)
+        self.shm.close()
+        self.shm.unlink()
+
+
+TRANSPORTS = OrderedDict([
+    ('pipe', PipeTransport),
+])
+if shared_memory is not None:
+    TRANSPORTS['shm'] = SharedMemoryTransport
+DEFAULT_TRANSPORT = 'pipe'
+
+
+def get_transport(name):
+    return TRANSPORTS[name]()
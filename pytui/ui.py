@@ -11,23 +11,46 @@ import warnings
 warnings.filterwarnings("ignore")
 import os
 import sys
-import json
 import urwid
 import click
-import traceback
-import multiprocessing
-from collections import OrderedDict
-
-from tblib import Traceback
+import shutil
+import signal
+import tempfile
+from functools import partial
+from collections import OrderedDict, Counter
 
 sys.path.insert(0, os.path.dirname(__file__))
 
 import logging_tools
 from logging_tools import get_logger, DEBUG_B
-from common import get_filter_regex, PytestExitcodes
+from common import get_filter_regex, PytestExitcodes, CANCEL_SIGNAL
 from runner import PytestRunner
+from transport import get_transport, FrameDecoder, TRANSPORTS, DEFAULT_TRANSPORT
+from codec import get_decoder, CODECS, DEFAULT_CODEC
+from blobstore import BlobReader
+from worker import get_runner, WorkerError, RUNNERS, DEFAULT_RUNNER
+from scheduler import Durations, schedule
+from collection_cache import CollectionCache, get_cache_path, CONFIG_FILES
+from import_graph import ImportGraph
+from coverage_map import CoverageMap, get_coverage_path
+from git_changes import GitError, get_changed_files
+from watcher import get_watcher
+from render import RenderLoop, DEFAULT_FPS
+from settings import CACHE_DIR
 
 logger = get_logger('ui')
+# how often are the test files checked for changes with --auto-collect (seconds)
+AUTO_COLLECT_INTERVAL = 1.0
+# --watch waits for the end of a burst of changes this long (seconds)
+WATCH_DEBOUNCE = 0.2
+# number of the test lines kept by the list walker, more than fit on a screen
+LINE_CACHE_SIZE = 256
+# messages reporting the end of the runner commands, by the command
+COMMAND_FINISHED = {
+    'init_tests': ('init_finished', {}),
+    'recollect_tests': ('recollect_finished', {'files': []}),
+    'run_tests': ('run_finished', {}),
+}
 
 
 class TestStatus:
@@ -55,14 +78,20 @@ class TestLine(urwid.Widget):
 
     def render(self, size, focus=False):
         result_state_str = self.test_data.get('result_state', '..')
+        runstate = self.test_data.get('runstate')
+        state_str = result_state_str
+        if runstate and self.test_data.get('worker') is not None:
+            # test is running in one of multiple workers
+            state_str = '{}:{}'.format(self.test_data['worker'], runstate)
+            result_state_str = runstate
         (maxcol,) = size
         title_width = maxcol - 11
-        main_attr = (self.test_data.get('runstate'), title_width)
+        main_attr = (runstate, title_width)
         state_attr = (result_state_str, 10)
         return urwid.TextCanvas(
             [('{} {:^10}'.format(
                 self.test_data['id'][:title_width].ljust(title_width),
-                result_state_str[:10].upper()
+                state_str[:10].upper()
             )).encode('utf-8')],
             maxcol=maxcol,
             attr=[[main_attr, (None, 1), state_attr]]
@@ -75,6 +104,128 @@ class TestLine(urwid.Widget):
         return key
 
 
+def invalidate_line(line):
+    line.original_widget._invalidate()
+    line._invalidate()
+
+
+class TestListWalker(urwid.ListWalker):
+    """
+    Walks the ids of the shown tests, lines of the tests are created when the list
+    box asks for them, only the recently used lines are kept.
+    """
+    def __init__(self, test_ids, make_line):
+        self.test_ids = test_ids
+        self.make_line = make_line
+        self.focus = 0
+        self._lines = OrderedDict()
+        # positions by test id, built on the first lookup
+        self._positions = None
+        # first and after last position shown, set by the list box when rendered
+        self.visible_range = (0, 0)
+        # ids of the cached lines changed out of the view, redrawn when shown
+        self._stale = set()
+
+    def __len__(self):
+        return len(self.test_ids)
+
+    def get_line(self, test_id):
+        line = self._lines.pop(test_id, None)
+        if line is None:
+            line = self.make_line(test_id)
+        elif test_id in self._stale:
+            self._stale.discard(test_id)
+            invalidate_line(line)
+        self._lines[test_id] = line
+        if len(self._lines) > LINE_CACHE_SIZE:
+            dropped_id, _line = self._lines.popitem(last=False)
+            self._stale.discard(dropped_id)
+        return line
+
+    def is_visible(self, position):
+        first, last = self.visible_range
+        return first <= position < last
+
+    def invalidate(self, test_id):
+        """
+            Redraw line of the test in the next frame, if it is shown. Lines out of
+            the view are only marked, they are redrawn when they are shown again.
+        """
+        line = self._lines.get(test_id)
+        if line is None:
+            return
+        position = self.get_position(test_id)
+        if position is not None and self.is_visible(position):
+            invalidate_line(line)
+        else:
+            self._stale.add(test_id)
+
+    def get_position(self, test_id):
+        if self._positions is None:
+            self._positions = dict(
+                (test_id, position) for position, test_id in enumerate(self.test_ids)
+            )
+        return self._positions.get(test_id)
+
+    def extend(self, test_ids):
+        if self._positions is not None:
+            self._positions.update(
+                (test_id, position) for position, test_id in enumerate(test_ids, len(self))
+            )
+        self.test_ids.extend(test_ids)
+        self._modified()
+
+    def set_test_ids(self, test_ids, focus_id=None):
+        """ Replace the shown tests, keep the focus on the test, if it is still shown. """
+        self.test_ids = test_ids
+        self._positions = None
+        position = self.get_position(focus_id) if focus_id is not None else None
+        self.focus = position or 0
+        self._modified()
+
+    def _get(self, position):
+        if 0 <= position < len(self.test_ids):
+            return self.get_line(self.test_ids[position]), position
+        return None, None
+
+    def get_focus(self):
+        return self._get(self.focus)
+
+    def set_focus(self, position):
+        if not 0 <= position < len(self.test_ids):
+            raise IndexError(position)
+        self.focus = position
+        self._modified()
+
+    def get_next(self, position):
+        return self._get(position + 1)
+
+    def get_prev(self, position):
+        return self._get(position - 1)
+
+    def positions(self, reverse=False):
+        if reverse:
+            return range(len(self.test_ids) - 1, -1, -1)
+        return range(len(self.test_ids))
+
+
+class TestListBox(urwid.ListBox):
+    """ List box of the tests, records the positions it shows into the walker. """
+    def calculate_visible(self, size, focus=False):
+        visible = super(TestListBox, self).calculate_visible(size, focus)
+        middle, top, bottom = visible
+        if middle is None:
+            self.body.visible_range = (0, 0)
+        else:
+            focus_position = middle[2]
+            # the filled lines are ordered from the focus outwards
+            fill_above, fill_below = top[1], bottom[1]
+            first = fill_above[-1][1] if fill_above else focus_position
+            last = fill_below[-1][1] if fill_below else focus_position
+            self.body.visible_range = (first, last + 1)
+        return visible
+
+
 class StatusLine(urwid.Widget):
     _sizing = frozenset(['flow'])
 
@@ -88,10 +239,13 @@ class StatusLine(urwid.Widget):
     def render(self, size, focus=False):
         (maxcol,) = size
         stats = self.stats_callback()
+        text = 'Total: {} Filtered: {} Failed: {}'.format(
+            stats['total'], stats['filtered'], stats['failed']
+        )
+        if stats.get('eta') is not None:
+            text += ' ETA: {:.1f}s'.format(stats['eta'])
         return urwid.TextCanvas(
-            ['Total: {} Filtered: {} Failed: {}'
-             .format(stats['total'], stats['filtered'], stats['failed'])
-             .encode('utf-8')],
+            [text.encode('utf-8')],
             maxcol=maxcol
         )
 
@@ -139,8 +293,29 @@ class Store(object):
         self.ui = ui
         self.filter_regex = None
         self.filter_value = None
+        # tests not matching the filter and counts of the matching tests by result state,
+        # the status line reads them on every redraw
+        self._filtered_out = set()
+        self._filtered_counts = Counter()
+        # tests added to the end of the list, the ui shows them after the received batch
+        self._added = []
         self._show_failed_only = False
         self._show_collected = True
+        self.durations = Durations(os.path.join(CACHE_DIR, 'durations.json'))
+        self.durations.load()
+        # setup durations of class, module and package scoped fixture instances
+        self.fixture_durations = Durations(os.path.join(CACHE_DIR, 'fixtures.json'))
+        self.fixture_durations.load()
+        # tests reported by the running collection, None when not collecting
+        self._collection = None
+        self._collection_failed = False
+        # tests (and their fixtures) reported by the running recollection of changed files
+        self._recollection = None
+        # tests of the current run by the worker running them
+        self.run_shards = {}
+        # estimated durations of the tests left in the run by worker, and of the tests
+        self._run_remaining = {}
+        self._run_estimates = {}
 
     @property
     def current_test_list(self):
@@ -154,33 +329,220 @@ class Store(object):
         )
 
     def get_test_stats(self):
+        """ Return counts of the tests for the status line, read from the counters. """
+        failed = self.get_failed_test_count()
+        filtered = failed
+        if not self._show_failed_only:
+            filtered = sum(self._filtered_counts.values())
+            if not self._show_collected:
+                filtered -= self._filtered_counts['']
         return {
             'total': len(self.test_data),
-            'filtered': len(self.current_test_list),
-            'failed': self.get_failed_test_count()
+            'filtered': filtered,
+            'failed': failed,
+            'eta': self.get_eta(),
         }
 
+    def _count_test(self, test_id, test_data, delta):
+        """ Add (delta 1) or remove (delta -1) the test from the counters. """
+        if test_id not in self._filtered_out:
+            self._filtered_counts[test_data.get('result_state', '')] += delta
+
+    def _add_test(self, test_id, test_data):
+        self.test_data[test_id] = test_data
+        if not self.is_test_filtered(test_id):
+            self._filtered_out.add(test_id)
+        self._count_test(test_id, test_data, 1)
+
+    def _set_result_state(self, test_id, test_data, result_state):
+        self._count_test(test_id, test_data, -1)
+        test_data['result_state'] = result_state
+        self._count_test(test_id, test_data, 1)
+        if result_state:
+            self._run_test_finished(test_id)
+
+    def _recount(self):
+        """ Count the tests again, after the test list or the filter has changed. """
+        self._filtered_out = set(
+            test_id for test_id in self.test_data if not self.is_test_filtered(test_id)
+        )
+        self._filtered_counts = Counter(
+            test_data.get('result_state', '')
+            for test_id, test_data in self.test_data.items()
+            if test_id not in self._filtered_out
+        )
+
+    def start_run(self, shards):
+        """ Remember the tests of the run, shards are lists of test ids by worker. """
+        self.run_shards = shards
+        default = self.durations.get_default(
+            [test_id for shard in shards.values() for test_id in shard]
+        )
+        self._run_remaining = {}
+        self._run_estimates = {}
+        if default is None:
+            return
+
+        for worker, shard in shards.items():
+            self._run_remaining[worker] = 0
+            for test_id in shard:
+                if not self.test_data.get(test_id, {}).get('result_state'):
+                    duration = self.durations.get(test_id, default)
+                    self._run_estimates[test_id] = (worker, duration)
+                    self._run_remaining[worker] += duration
+
+    def _run_test_finished(self, test_id):
+        estimate = self._run_estimates.pop(test_id, None)
+        if estimate is not None:
+            worker, duration = estimate
+            self._run_remaining[worker] = max(self._run_remaining[worker] - duration, 0)
+
+    def finish_run(self, worker):
+        self.run_shards.pop(worker, None)
+        self._run_remaining.pop(worker, None)
+        self.durations.save()
+        self.fixture_durations.save()
+
+    def get_test_files(self, test_ids):
+        """ Return paths of the files containing the tests, relative to rootdir. """
+        return list(OrderedDict(
+            (test_id.split('::', 1)[0], None) for test_id in test_ids
+        ))
+
+    def get_test_fixtures(self):
+        """ Return keys of the shared fixtures by test id. """
+        return dict(
+            (test_id, test_data['fixtures'])
+            for test_id, test_data in self.test_data.items()
+            if test_data.get('fixtures')
+        )
+
+    def get_eta(self):
+        """
+            Return estimated time to the end of the run (seconds), the run ends
+            with its slowest worker. None when unknown.
+        """
+        if not self.run_shards or not self._run_remaining:
+            return None
+
+        return max(self._run_remaining.values())
+
     def item_collected(self, item_id):
+        if self._recollection is not None:
+            # merged into the list at the end of the recollection
+            self._recollection.setdefault(item_id, None)
+            return
+
+        if self._collection is not None:
+            self._collection.add(item_id)
+
         if item_id in self.test_data:
             logger.debug('Ignoring collect for %s', item_id)
             return
 
-        self.test_data[item_id] = {
+        self._add_test(item_id, {
             'id': item_id
-        }
+        })
+        self._added.append(item_id)
+
+    def items_cached(self, item_ids):
+        """ Add tests from the collection cache, before the collection confirms them. """
+        for item_id in item_ids:
+            if item_id not in self.test_data:
+                self._add_test(item_id, {'id': item_id})
         self.ui.init_test_listbox()
 
-    def get_test_position(self, test_id):
-        return self.test_data[test_id]['position']
+    def pop_added(self):
+        """ Return the tests added to the end of the list since the last call. """
+        added, self._added = self._added, []
+        return added
 
-    def get_failed_test_count(self):
-        return len(
-            [
-                test_id
-                for test_id, test in list(self.current_test_list.items())
-                if self.is_test_failed(test)
-            ]
+    def start_collection(self):
+        self._collection = set()
+        self._collection_failed = False
+
+    def finish_collection(self, test_order=()):
+        """
+            Remove the cached tests, which were not confirmed by the collection.
+            Sort the tests by the collection order, runners collecting in parallel
+            report them interleaved and tests new in a cached file are added to
+            the end. Return True if the list has changed.
+        """
+        collected, self._collection = self._collection, None
+        if collected is None or self._collection_failed:
+            return False
+
+        positions = dict((test_id, index) for index, test_id in enumerate(test_order))
+        test_ids = sorted(
+            (test_id for test_id in self.test_data if test_id in collected),
+            key=lambda test_id: positions.get(test_id, len(positions))
         )
+        if test_ids == list(self.test_data):
+            return False
+
+        removed = len(self.test_data) - len(test_ids)
+        if removed:
+            logger.info('Removed %s tests no longer collected', removed)
+        self.test_data = OrderedDict(
+            (test_id, self.test_data[test_id]) for test_id in test_ids
+        )
+        self._recount()
+        return True
+
+    def start_recollection(self):
+        self._recollection = OrderedDict()
+
+    def finish_recollection(self, files):
+        """
+            Replace the tests of the recollected files by the tests reported,
+            return lists of the added and removed test ids. Tests of the other
+            files and the results of the tests kept are left untouched.
+        """
+        recollection, self._recollection = self._recollection, None
+        if recollection is None or not files:
+            return [], []
+
+        files = set(files)
+        file_tests = OrderedDict()
+        for test_id, fixtures in recollection.items():
+            file_tests.setdefault(test_id.split('::', 1)[0], []).append((test_id, fixtures))
+
+        def merged_tests(tests):
+            for test_id, fixtures in tests:
+                test_data = self.test_data.get(test_id) or {'id': test_id}
+                if fixtures is not None:
+                    test_data['fixtures'] = fixtures
+                else:
+                    test_data.pop('fixtures', None)
+                yield test_id, test_data
+
+        test_data = OrderedDict()
+        for test_id, data in self.test_data.items():
+            path = test_id.split('::', 1)[0]
+            if path not in files:
+                test_data[test_id] = data
+            else:
+                # tests of the file replaced at the position of its first test
+                test_data.update(merged_tests(file_tests.pop(path, [])))
+        # new files go last
+        for tests in file_tests.values():
+            test_data.update(merged_tests(tests))
+
+        added = [test_id for test_id in test_data if test_id not in self.test_data]
+        removed = [test_id for test_id in self.test_data if test_id not in test_data]
+        self.test_data = test_data
+        self._recount()
+        logger.info('Recollected %s files, added %s tests, removed %s tests',
+                    len(files), len(added), len(removed))
+        return added, removed
+
+    def get_failed_test_count(self):
+        """ Return count of the failed tests matching the filter. """
+        counts = self._filtered_counts
+        failed = sum(counts[state] for state in self.ui.runner_class._test_fail_states)
+        if not self._show_collected:
+            failed -= counts['']
+        return failed
 
     def _get_tests(
         self,
@@ -220,46 +582,58 @@ class Store(object):
         outcome,
         exc_type=None,
         exc_value=None,
-        extracted_traceback=None,
-        last_failed_exempt=None
+        formatted_traceback=None,
+        last_failed_exempt=None,
+        output_blob=None,
+        traceback_blob=None,
+        duration=None
     ):
         """
             Set test result in internal dictionary. Updates UI.
 
             Args:
                 test_id: An unique string test identifier.
+                output: Output captured in this phase (setup, call, teardown) only.
+                output_blob: Handle of the phase output in the session blob store.
+                formatted_traceback: Traceback formatted by the runner.
+                traceback_blob: Handle of the formatted traceback in the session blob store.
+                duration: Duration of the phase (seconds).
         """
-        update_listbox = False
+        added = False
 
         if test_id not in self.test_data:
-            self.test_data[test_id] = {
+            self._add_test(test_id, {
                 'id': test_id
-            }
-            update_listbox = True
-
-        if extracted_traceback:
-            py_traceback = Traceback.from_dict(extracted_traceback).as_traceback()
-            extracted_traceback = traceback.extract_tb(py_traceback)
-            output += ''.join(
-                traceback.format_list(extracted_traceback) + [exc_value]
-            )
+            })
+            added = True
 
         test_data = self.test_data[test_id]
+        if output_blob or output:
+            # runner sends output of each phase separately, keep all of them
+            test_data.setdefault('output_parts', []).append(output_blob or output)
+            test_data['output_cache'] = None
+
         test_data['exc_type'] = exc_type
         test_data['exc_value'] = exc_value
-        test_data['exc_tb'] = extracted_traceback
+        test_data['exc_tb'] = traceback_blob or formatted_traceback
         if when == 'call' and last_failed_exempt is not None:
             test_data['last_failed_exempt'] = last_failed_exempt
+        if duration is not None:
+            test_data.setdefault('durations', {})[when] = duration
+            if when == 'teardown':
+                self.durations.set(test_id, sum(test_data['durations'].values()))
 
         # Ignore success, except for the 'call' step
         # ignore successive failure, take only the first
         if (
             (outcome != 'passed' or when == 'call') and not test_data.get('result_state')
         ):
-            test_data['result_state'] = result_state
-            test_data['output'] = output
-            if update_listbox:
-                self.ui.init_test_listbox()
+            self._set_result_state(test_id, test_data, result_state)
+            test_data['output'] = exc_value or ''
+            test_data['output_traceback'] = test_data['exc_tb']
+            test_data['output_cache'] = None
+            if added:
+                self._added.append(test_id)
             else:
                 self.ui.update_test_result(test_data)
 
@@ -267,9 +641,19 @@ class Store(object):
             test_data['runstate'] = None
             self.ui.update_test_line(test_data)
 
-    def set_test_state(self, test_id, state):
+    def set_test_fixtures(self, test_id, fixtures):
+        if self._recollection is not None:
+            self._recollection[test_id] = fixtures
+        elif test_id in self.test_data:
+            self.test_data[test_id]['fixtures'] = fixtures
+
+    def set_fixture_duration(self, fixture, duration):
+        self.fixture_durations.set(fixture, duration)
+
+    def set_test_state(self, test_id, state, worker=None):
         test_data = self.test_data[test_id]
         test_data['runstate'] = state
+        test_data['worker'] = worker
 
         self.ui.update_test_line(test_data)
         self.ui.set_listbox_focus(test_data)
@@ -279,18 +663,21 @@ class Store(object):
         test_id,
         exc_type,
         exc_value,
-        extracted_traceback,
         result_state,
-        when
+        when,
+        formatted_traceback=None,
+        traceback_blob=None
     ):
         self.set_test_result(
-            test_id, result_state, exc_value, when, result_state,
-            exc_type, exc_value, extracted_traceback
+            test_id, result_state, '', when, result_state,
+            exc_type, exc_value, formatted_traceback,
+            traceback_blob=traceback_blob
         )
 
     def set_filter(self, filter_value):
         self.filter_value = filter_value
         self.filter_regex = get_filter_regex(filter_value)
+        self._recount()
 
     def invalidate_test_results(self, tests):
         for test_id, test in list(tests.items()):
@@ -301,10 +688,30 @@ class Store(object):
         test_data.update({
             'result': None,
             'output': '',
-            'result_state': ''
+            'output_parts': [],
+            'output_traceback': None,
+            'output_cache': None,
+            'durations': {},
         })
-        test_data['widget'].test_data['result_state'] = ''
-        test_data['widget']._invalidate()
+        self._set_result_state(test_id, test_data, '')
+        self.ui.invalidate_test_line(test_id)
+
+    def get_test_output(self, test_id):
+        """
+            Return test output, captured parts and traceback are read from the blob store
+            on the first access and cached.
+        """
+        test_data = self.test_data[test_id]
+        if test_data.get('output_cache') is None:
+            parts = test_data.get('output_parts', []) + [
+                test_data.get('output', ''),
+                test_data.get('output_traceback') or '',
+            ]
+            test_data['output_cache'] = ''.join(
+                self.ui.blobs.read(part) if isinstance(part, list) else part
+                for part in parts
+            )
+        return test_data['output_cache']
 
     def is_test_failed(self, test_data):
         failed = (
@@ -316,6 +723,17 @@ class Store(object):
     def is_test_filtered(self, test_id):
         return not self.filter_regex or self.filter_regex.findall(test_id)
 
+    def is_test_shown(self, test_id):
+        """ Return True if the test belongs to current_test_list. """
+        test_data = self.test_data[test_id]
+        return (
+            test_id not in self._filtered_out
+        ) and (
+            not self._show_failed_only or self.is_test_failed(test_data)
+        ) and (
+            self._show_collected or test_data.get('result_state', '') != ''
+        )
+
     def get_failed_sibling(self, position, direction):
         """
             position is the position in ui listbox, and should be
@@ -358,6 +776,8 @@ class Store(object):
         self.ui.init_test_listbox()
 
     def set_pytest_error(self, exitcode, description=None):
+        if self._collection is not None:
+            self._collection_failed = True
         self.show_collected = False
         output = PytestExitcodes.text.get(exitcode, 'Unknown error')
         if description is not None:
@@ -373,6 +793,39 @@ class Store(object):
         )
 
 
+class RunnerChannel(object):
+    """
+    Runner with its own transport, messages of each runner are decoded separately.
+    """
+    def __init__(self, index, runner_class, debug, codec, transport, runner, blob_dir,
+                 track_imports=False, record_coverage=False):
+        self.index = index
+        self.transport = get_transport(transport)
+        self.decoder = FrameDecoder()
+        self.message_decoder = get_decoder(codec)
+        self.runner = get_runner(runner, runner_class, self.transport, debug, codec, blob_dir,
+                                 track_imports=track_imports, record_coverage=record_coverage)
+
+    def receive(self):
+        """ Return list of message batches received since the last call. """
+        # the queued command has started, when its runner sends data
+        self.runner.receive_reply()
+        data = self.transport.read()
+        logger.log(DEBUG_B, 'new data on pipe %s, data size: %s', self.index, len(data))
+
+        batches = []
+        for frame in self.decoder.feed(data):
+            try:
+                batches.append(self.message_decoder.decode(frame))
+            except Exception:
+                logger.exception('Failed to parse runner input: "%s"', frame.tobytes())
+        return batches
+
+    def close(self):
+        self.runner.terminate()
+        self.transport.close()
+
+
 class TestRunnerUI(object):
     palette = [
         ('reversed',    '',           'dark green'),                                  # noqa: E241
@@ -396,7 +849,10 @@ class TestRunnerUI(object):
         ('teardown',    'white',      'dark blue',             '', '',     ''),       # noqa: E241
     ]
 
-    def __init__(self, runner_class, debug, pytest_args):
+    def __init__(self, runner_class, debug, pytest_args, codec=DEFAULT_CODEC,
+                 transport=DEFAULT_TRANSPORT, runner=DEFAULT_RUNNER, workers=1,
+                 auto_collect=False, watch=False, coverage=False, changed_since=None,
+                 fps=DEFAULT_FPS, follow=True):
         logger.info('Runner UI init')
         urwid.set_encoding("UTF-8")
 
@@ -404,17 +860,44 @@ class TestRunnerUI(object):
         self.debug = debug
         self.store = Store(self)
         self.pytest_args = pytest_args
+        self.codec = codec
 
         self.main_loop = None
+        # maximum screen redraws per second
+        self.fps = fps
+        # scroll the list to the running tests
+        self.follow = follow
         self.w_main = None
         self._first_failed_focused = False
 
         # process comm
-        self.child_pipe = None
-        self.pipe_size = multiprocessing.Value('i', 0)
-        self.pipe_semaphore = multiprocessing.Event()
-        self.receive_buffer = b''
-        self.runner_process = None
+        self.blob_dir = tempfile.mkdtemp(prefix='pytui-')
+        self.blobs = BlobReader(self.blob_dir)
+        self.channels = [
+            # the import graph is always recorded, the tests affected by changes can be
+            # run by the key without --watch or --changed-since
+            RunnerChannel(index, runner_class, debug, codec, transport, runner, self.blob_dir,
+                          track_imports=True, record_coverage=coverage)
+            for index in range(1, workers + 1)
+        ]
+        # runners started later inherit the ignored cancel signal, until they handle it
+        signal.signal(CANCEL_SIGNAL, signal.SIG_IGN)
+        self.collection_cache = CollectionCache(get_cache_path(pytest_args))
+        self.auto_collect = auto_collect
+        # indexes of the runners collecting the tests
+        self.collecting = set()
+
+        # watch mode, changed paths waiting for the debounce and for the runners
+        self.watch = watch
+        self.watcher = None
+        self.watch_changes = set()
+        self._watch_alarm = None
+        # changed paths of the running recollection, their tests run after it
+        self.watch_paths = None
+        # lines run by the tests are recorded, to run the tests impacted by changes
+        self.coverage = coverage
+        # git revision, tests of the files changed since it run after the collection
+        self.changed_since = changed_since
 
         self.init_main_screen()
 
@@ -438,26 +921,201 @@ class TestRunnerUI(object):
         )
 
     def init_test_listbox(self):
-        self.w_test_listbox = self.test_listbox(list(self.store.current_test_list.keys()))
+        # the added tests are in the rebuilt list already
+        self.store.pop_added()
+        self.w_test_listbox = self.test_listbox(list(self.store.current_test_list))
         if self.w_main:
             self.w_status_line.original_widget._invalidate()
             self.w_main.original_widget.widget_list[4] = self.w_test_listbox
             self.w_main.original_widget._invalidate()
 
+    def is_running(self):
+        return any(channel.runner.is_running() for channel in self.channels)
+
     def init_test_data(self):
-        if self.runner_process and self.runner_process.is_alive():
+        if self.is_running():
+            logger.info('Tests are already running')
+            return
+
+        self.store.items_cached(self.collection_cache.load())
+        self.store.start_collection()
+        self.collecting = set(channel.index for channel in self.channels)
+        if len(self.channels) == 1:
+            self.runner_command(self.channels[0], 'init_tests', self.pytest_args)
+            return
+
+        # each runner imports and collects its share of the test files
+        shards = self.get_collection_shards()
+        for shard_index, channel in enumerate(self.channels):
+            self.runner_command(channel, 'init_tests', self.pytest_args,
+                                (shard_index, len(self.channels), shards))
+
+    def get_collection_shards(self):
+        """
+            Return shard index by the cached test file, the files are split by their
+            recorded import and collection time. Unchanged files cost nothing, their
+            tests are reported from the cache. New files are assigned by the runners.
+        """
+        cache = self.collection_cache
+        files = list(cache.files)
+        if not files:
+            return {}
+
+        cache.validate(cache.rootdir)
+        durations = Durations(None)
+        for relpath, entry in cache.files.items():
+            if cache.get_fresh(os.path.join(cache.rootdir, relpath)) is not None:
+                durations.set(relpath, 0)
+            elif entry.get('duration') is not None:
+                durations.set(relpath, entry['duration'])
+
+        return dict(
+            (relpath, shard_index)
+            for shard_index, shard in enumerate(schedule(files, durations, len(self.channels)))
+            for relpath in shard
+        )
+
+    def recollect_tests(self):
+        """ Collect the test files changed since the last collection. """
+        if self.is_running():
+            logger.info('Tests are already running')
+            return
+
+        self.store.start_recollection()
+        self.runner_command(self.channels[0], 'recollect_tests', self.pytest_args)
+
+    def check_changes(self, main_loop, user_data=None):
+        """ Recollect the tests when the test files have changed, periodically. """
+        if not self.is_running() and self.collection_cache.has_changed():
+            logger.info('Test files changed, recollecting')
+            self.recollect_tests()
+        main_loop.set_alarm_in(AUTO_COLLECT_INTERVAL, self.check_changes)
+
+    def start_watch(self):
+        """ Start watching the rootdir of the collected tests. """
+        if self.watcher is not None:
+            return
+
+        root = os.path.realpath(self.collection_cache.rootdir or os.getcwd())
+        self.watcher = get_watcher(root)
+        logger.info('Watching %s (%s)', root, self.watcher.__class__.__name__)
+        if self.watcher.fileno() is not None:
+            self.main_loop.watch_file(self.watcher.fileno(), self.watch_changed)
+        else:
+            self.main_loop.set_alarm_in(self.watcher.poll_interval, self.poll_watcher)
+
+    def poll_watcher(self, main_loop, user_data=None):
+        self.watch_changed()
+        main_loop.set_alarm_in(self.watcher.poll_interval, self.poll_watcher)
+
+    def watch_changed(self):
+        """ Collect the changed paths, process them when the burst of changes ends. """
+        paths = self.watcher.read()
+        if not paths:
+            return
+
+        logger.debug('Changed paths %s', paths)
+        self.watch_changes.update(paths)
+        if self._watch_alarm is not None:
+            self.main_loop.remove_alarm(self._watch_alarm)
+        self._watch_alarm = self.main_loop.set_alarm_in(WATCH_DEBOUNCE,
+                                                        self.process_watch_changes)
+
+    def process_watch_changes(self, main_loop=None, user_data=None):
+        """
+            Recollect the changed files and run the affected tests after that.
+            A run in progress is stale, it is cancelled and the changes wait
+            for its end, like they wait for the end of a collection.
+        """
+        self._watch_alarm = None
+        if not self.watch_changes:
+            return
+
+        if self.store.run_shards:
+            logger.info('Cancelling the stale test run')
+            for channel in self.channels:
+                channel.runner.cancel()
+            return
+        if self.is_running():
+            return
+
+        self.watch_paths, self.watch_changes = self.watch_changes, set()
+        self.recollect_tests()
+
+    def resume_watch(self):
+        """ Process the changes which came while the runners were busy. """
+        if self.watch_changes and self._watch_alarm is None:
+            self.process_watch_changes()
+
+    def get_affected_tests(self, paths):
+        """
+            Return ids of the tests affected by the changed paths, tests of the changed
+            test files and of the test files importing the changed modules. Changes of
+            conftests affect all the tests in their directory.
+        """
+        root = os.path.realpath(self.collection_cache.rootdir or os.getcwd())
+        changed = [os.path.relpath(path, root) for path in paths]
+        graph = ImportGraph(self.collection_cache.get_import_graph())
+        affected_files = graph.get_affected(changed)
+
+        directories = []
+        for path in changed:
+            name = os.path.basename(path)
+            if name == 'conftest.py' or name in CONFIG_FILES:
+                directories.append(os.path.dirname(path))
+            elif path == '.':
+                # the whole tree has changed
+                directories.append('')
+
+        return [
+            test_id for test_id in self.store.test_data
+            if test_id.split('::', 1)[0] in affected_files or any(
+                not directory or test_id.startswith(directory + '/')
+                for directory in directories
+            )
+        ]
+
+    def run_affected_tests(self, paths):
+        test_ids = self.get_affected_tests(paths)
+        logger.info('Running %s tests affected by %s', len(test_ids), ', '.join(paths))
+        if test_ids:
+            self.run_tests(False, select_tests=test_ids)
+
+    def run_changed_tests(self):
+        """ Run the tests affected by the files changed since the git revision. """
+        if self.is_running():
+            logger.info('Tests are already running')
+            return
+
+        rev = self.changed_since or 'HEAD'
+        try:
+            paths = get_changed_files(rev, os.getcwd())
+        except GitError as e:
+            logger.warning('Failed to get the files changed since %s: %s', rev, e)
+            self.show_startup_error('Files changed since {}'.format(rev), str(e))
+            return
+
+        test_ids = self.get_affected_tests(paths)
+        logger.info('Running %s tests affected by the changes since %s', len(test_ids), rev)
+        if test_ids:
+            self.run_tests(False, select_tests=test_ids)
+
+    def run_impacted_tests(self):
+        """ Run the tests which ran the lines changed since their last run. """
+        if not self.coverage:
+            logger.info('Coverage is not recorded, impacted tests are unknown')
+            return
+        if self.is_running():
             logger.info('Tests are already running')
             return
 
-        self.runner_process = multiprocessing.Process(
-            target=self.runner_class.process_init_tests,
-            name='pytui-runner',
-            args=(self.child_pipe, self.pipe_size, self.pipe_semaphore, self.debug),
-            kwargs={
-                'pytest_args': self.pytest_args
-            }
+        coverage_map = CoverageMap(get_coverage_path(self.pytest_args))
+        test_ids = coverage_map.get_impacted(
+            list(self.store.test_data), ImportGraph(self.collection_cache.get_import_graph())
         )
-        self.runner_process.start()
+        logger.info('Running %s impacted tests', len(test_ids))
+        if test_ids:
+            self.run_selected_tests(failed_only=False, filtered=True, select_tests=test_ids)
 
     def on_filter_change(self, filter_widget, filter_value):
         self.store.set_filter(filter_value)
@@ -467,65 +1125,98 @@ class TestRunnerUI(object):
         # self.main_loop.widget._invalidate()
         # self.main_loop.draw_screen()
 
-    def received_output(self, data):
+    def received_output(self, channel):
         """
-            Parse data received by client and execute encoded action
+            Parse data received by client and execute encoded actions.
+            Each frame on the pipe holds a batch of messages.
         """
-        logger.log(DEBUG_B, 'new data on pipe, data size: %s, pipe_size: %s',
-                   len(data), self.pipe_size.value)
-        self.receive_buffer += data
-        for chunk in self.receive_buffer.split(b'\n'):
-            if not chunk:
-                continue
-            try:
-                payload = json.loads(chunk.decode('utf-8'))
-                assert 'method' in payload
-                assert 'params' in payload
-            except Exception:
-                logger.debug('Failed to parse runner input: "%s"', chunk)
-                # release the write end if waiting for read
-                logger.log(DEBUG_B, 'pipe_size decrease to correct value')
-                with self.pipe_size.get_lock():
-                    self.pipe_size.value -= len(data)
-                    self.pipe_semaphore.set()
-                    logger.log(DEBUG_B, 'released semaphore')
-                return
-
-            # correct buffer
-            self.receive_buffer = self.receive_buffer[len(chunk) + 1:]
-            logger.debug('handling method %s', payload['method'])
-            try:
-                if payload['method'] == 'item_collected':
-                    self.store.item_collected(**payload['params'])
-                elif payload['method'] == 'set_test_result':
-                    self.store.set_test_result(**payload['params'])
-                elif payload['method'] == 'set_exception_info':
-                    self.store.set_exception_info(**payload['params'])
-                elif payload['method'] == 'set_test_state':
-                    self.store.set_test_state(**payload['params'])
-                elif payload['method'] == 'set_pytest_error':
-                    self.store.set_pytest_error(**payload['params'])
-                elif payload['method'] in ['init_finished', 'run_finished']:
-                    self.main_loop.screen.clear()
+        for batch in channel.receive():
+            self.handle_batch(batch, channel)
 
-            except:
-                logger.exception('Error in handler "%s"', payload['method'])
+    def handle_batch(self, batch, channel):
+        """ Execute the messages of a batch, the list is extended once per batch. """
+        logger.debug('handling batch of %s messages', len(batch))
+        for method, params in batch:
+            self.handle_message(method, params, channel)
+        self.show_added_tests()
 
-        # self.w_main._invalidate()
-        # release the write end if waiting for read
-        logger.log(DEBUG_B, 'pipe_size decrease to correct value')
-        with self.pipe_size.get_lock():
-            self.pipe_size.value -= len(data)
-            self.pipe_semaphore.set()
-            logger.log(DEBUG_B, 'released semaphore')
+    def poll_transport(self, main_loop, channel):
+        """
+            Check the transport for data periodically, in case a wakeup was missed
+        """
+        self.received_output(channel)
+        main_loop.set_alarm_in(channel.transport.poll_interval, self.poll_transport, channel)
+
+    def handle_message(self, method, params, channel):
+        """
+            Execute single action received from the runner
+        """
+        logger.debug('handling method %s', method)
+        try:
+            if method == 'item_collected':
+                self.store.item_collected(**params)
+            elif method == 'set_test_result':
+                self.store.set_test_result(**params)
+            elif method == 'set_exception_info':
+                self.store.set_exception_info(**params)
+            elif method == 'set_test_state':
+                worker = channel.index if len(self.channels) > 1 else None
+                self.store.set_test_state(worker=worker, **params)
+            elif method == 'set_pytest_error':
+                self.store.set_pytest_error(**params)
+            elif method == 'set_test_fixtures':
+                self.store.set_test_fixtures(**params)
+            elif method == 'set_fixture_duration':
+                self.store.set_fixture_duration(**params)
+            elif method == 'init_finished':
+                channel.runner.command_finished()
+                self.collecting.discard(channel.index)
+                if not self.collecting:
+                    # stamps and order of the collected tests, saved by the runners
+                    test_order = self.collection_cache.load()
+                    if self.store.finish_collection(test_order):
+                        self.update_test_listbox()
+                    self.main_loop.screen.clear()
+                    if self.watch:
+                        self.start_watch()
+                        self.resume_watch()
+                    if self.changed_since is not None and not self.is_running():
+                        self.run_changed_tests()
+            elif method == 'recollect_finished':
+                channel.runner.command_finished()
+                added, removed = self.store.finish_recollection(**params)
+                self.collection_cache.load()
+                if added or removed:
+                    self.update_test_listbox()
+                if self.watch_paths is not None:
+                    self.run_affected_tests(self.watch_paths)
+                    self.watch_paths = None
+                self.resume_watch()
+            elif method == 'run_finished':
+                channel.runner.command_finished()
+                self.store.finish_run(channel.index)
+                self.main_loop.screen.clear()
+                self.resume_watch()
+
+        except:
+            logger.exception('Error in handler "%s"', method)
 
     def run(self):
-        self.main_loop = urwid.MainLoop(
+        self.main_loop = RenderLoop(
             self.w_main,
             palette=self.palette,
-            unhandled_input=self.unhandled_keypress
+            unhandled_input=self.unhandled_keypress,
+            fps=self.fps
         )
-        self.child_pipe = self.main_loop.watch_pipe(self.received_output)
+        for channel in self.channels:
+            self.main_loop.watch_file(channel.transport.fileno(),
+                                      partial(self.received_output, channel))
+            if channel.transport.poll_interval:
+                self.main_loop.set_alarm_in(channel.transport.poll_interval,
+                                            self.poll_transport, channel)
+
+        if self.auto_collect:
+            self.main_loop.set_alarm_in(AUTO_COLLECT_INTERVAL, self.check_changes)
 
         self.init_test_data()
         logger.debug('Running main urwid loop')
@@ -545,7 +1236,7 @@ class TestRunnerUI(object):
             filtered
             filter_value
         """
-        if self.runner_process and self.runner_process.is_alive():
+        if self.is_running():
             logger.info('Tests are already running')
             return
 
@@ -566,56 +1257,75 @@ class TestRunnerUI(object):
         )
         self.store.invalidate_test_results(tests)
 
-        self.runner_process = multiprocessing.Process(
-            target=self.runner_class.process_run_tests,
-            name='pytui-runner',
-            args=(failed_only, filtered, self.child_pipe, self.pipe_size,
-                  self.pipe_semaphore, self.store.filter_value, self.debug),
-            kwargs={
-                'pytest_args': self.pytest_args,
-                'select_tests': select_tests
-            }
-        )
-        self.runner_process.start()
+        test_ids = list(tests)
+        if len(self.channels) == 1 or not test_ids:
+            # collect only files of the tests, unless the whole tree is going to run
+            collect_files = None
+            if test_ids and len(test_ids) < len(self.store.test_data):
+                collect_files = self.store.get_test_files(test_ids)
+
+            self.store.start_run({self.channels[0].index: test_ids})
+            self.runner_command(self.channels[0], 'run_tests', failed_only, filtered,
+                                self.store.filter_value, self.pytest_args, select_tests,
+                                collect_files)
+        else:
+            # the selection is already resolved, each worker runs its share of the tests
+            shards = schedule(test_ids, self.store.durations, len(self.channels),
+                              self.store.get_test_fixtures(), self.store.fixture_durations)
+            self.store.start_run(dict(
+                (channel.index, shard) for channel, shard in zip(self.channels, shards) if shard
+            ))
+            for channel, shard in zip(self.channels, shards):
+                if shard:
+                    self.runner_command(channel, 'run_tests', False, filtered,
+                                        self.store.filter_value, self.pytest_args, shard,
+                                        self.store.get_test_files(shard))
 
         # self.w_test_listbox._invalidate()
         # self.w_main._invalidate()
         # self.main_loop.draw_screen()
 
+    def runner_command(self, channel, command, *args):
+        """
+            Start the command of the runner. A command the runner fails to start
+            is reported as failed and finished, the way the runner does it.
+        """
+        try:
+            getattr(channel.runner, command)(*args)
+        except WorkerError as e:
+            logger.error('Runner %s failed: %s', channel.index, e)
+            self.handle_message('set_pytest_error', {
+                'exitcode': PytestExitcodes.RUNNER_FAILED,
+                'description': str(e),
+            }, channel)
+            method, params = COMMAND_FINISHED[command]
+            self.handle_message(method, dict(params), channel)
+
     def run_selected_tests(self, failed_only, filtered, select_tests=None):
         self.run_tests(failed_only, filtered, select_tests)
 
     def update_test_result(self, test_data):
         display_result_state = test_data.get('result_state', '')
-        if display_result_state in ['failed', 'error'] and not self._first_failed_focused:
-            try:
-                self.w_test_listbox.set_focus(test_data.get('position', 0))
-                self._first_failed_focused = True
-            except IndexError:
-                pass
-
-        if test_data.get('widget'):
-            test_data['widget']._invalidate()
-            test_data['lw_widget']._invalidate()
-            # self.w_test_listbox._invalidate()
-            self.w_status_line.original_widget._invalidate()
-        else:
-            logger.warning('Test "%s" has no ui widget', test_data['id'])
+        position = self.w_test_listbox.body.get_position(test_data['id'])
+        if (
+            display_result_state in ['failed', 'error'] and
+            not self._first_failed_focused and
+            position is not None
+        ):
+            self.w_test_listbox.set_focus(position)
+            self._first_failed_focused = True
 
-        self.main_loop.draw_screen()
+        self.invalidate_test_line(test_data['id'])
+        self.w_status_line.original_widget._invalidate()
 
     def update_test_line(self, test_data):
-        if test_data.get('widget'):
-            test_data['widget']._invalidate()
-            test_data['lw_widget']._invalidate()
-            self.main_loop.draw_screen()
+        self.invalidate_test_line(test_data['id'])
+
+    def invalidate_test_line(self, test_id):
+        self.w_test_listbox.body.invalidate(test_id)
 
     def show_test_detail(self, widget, test_id):
-        test_data = self.store.test_data[test_id]
-        output = test_data.get('output', '')
-        # if 'exc_info' in test_data:
-        #     output += '\n' + '-'*20 + '\n'
-        #     output += '\n'.join(traceback.format_tb(test_data['exc_info'].tb))
+        output = self.store.get_test_output(test_id)
 
         result_window = TestResultWindow(
             test_id,
@@ -637,44 +1347,54 @@ class TestRunnerUI(object):
     def popup_close(self):
         self.main_loop.widget = self._popup_original
 
-    def get_list_item(self, test_id, position):
-        test_data = self.store.test_data[test_id]
-        test_data.update({
-            'widget': None,
-            'lw_widget': None,
-            'position': position,
-            'id': test_id,
-        })
-        test_line = TestLine(test_data)
-        test_data['widget'] = test_line
-        # logger.debug('widget set for %s: %s', test_id, test_line)
+    def get_list_item(self, test_id):
+        test_line = TestLine(self.store.test_data[test_id])
         urwid.connect_signal(test_line, 'click', self.show_test_detail, test_id)
-        test_line_attr = urwid.AttrMap(test_line, None, focus_map='reversed')
-        test_data['lw_widget'] = test_line_attr
-        return test_line_attr
+        return urwid.AttrMap(test_line, None, focus_map='reversed')
 
     def test_listbox(self, test_list):
-        list_items = []
-        for position, test_id in enumerate(test_list):
-            test_line_attr = self.get_list_item(test_id, position)
-            list_items.append(test_line_attr)
-        return urwid.ListBox(urwid.SimpleFocusListWalker(list_items))
+        return TestListBox(TestListWalker(test_list, self.get_list_item))
+
+    def update_test_listbox(self):
+        """ Update the list after tests were added or removed, keep the focused test. """
+        walker = self.w_test_listbox.body
+        focus_widget, _position = walker.get_focus()
+        focus_id = focus_widget.original_widget.test_data['id'] if focus_widget else None
+        self.store.pop_added()
+        walker.set_test_ids(list(self.store.current_test_list), focus_id)
+        self.w_status_line.original_widget._invalidate()
+
+    def show_added_tests(self):
+        """ Append the tests added to the end of the test list, which pass the filters. """
+        added = self.store.pop_added()
+        if not added:
+            return
+
+        self.w_test_listbox.body.extend([
+            test_id for test_id in added if self.store.is_test_shown(test_id)
+        ])
+        self.w_status_line.original_widget._invalidate()
 
     def focus_failed_sibling(self, direction):
         next_id = self.store.get_failed_sibling(self.w_test_listbox.focus_position, direction)
-        if next_id is not None:
-            next_pos = self.store.get_test_position(next_id)
+        next_pos = self.w_test_listbox.body.get_position(next_id)
+        if next_pos is not None:
             self.w_test_listbox.set_focus(next_pos, 'above' if direction == 1 else 'below')
             self.w_test_listbox._invalidate()
 
     def set_listbox_focus(self, test_data):
-        # set listbox focus if not already focused on first failed
-        if not self._first_failed_focused:
-            try:
-                self.w_test_listbox.set_focus(test_data['position'], 'above')
-                self.w_test_listbox._invalidate()
-            except IndexError:
-                pass
+        """
+            Follow the running test, unless the first failed is focused. The list
+            scrolls only when the test is out of the view, to show it on the top.
+        """
+        if not self.follow or self._first_failed_focused:
+            return
+        walker = self.w_test_listbox.body
+        position = walker.get_position(test_data['id'])
+        if position is None or walker.is_visible(position):
+            return
+        self.w_test_listbox.set_focus(position)
+        self.w_test_listbox.set_focus_valign('top')
 
     def get_selected_testline(self):
         focus_widget, idx = self.w_test_listbox.get_focus()
@@ -682,10 +1402,14 @@ class TestRunnerUI(object):
         return test_line
 
     def quit(self):
-        self.pipe_semaphore.set()
-        if self.runner_process and self.runner_process.is_alive():
-            self.runner_process.terminate()
-        logger.log(DEBUG_B, 'releasing semaphore')
+        for channel in self.channels:
+            channel.close()
+        if self.watcher is not None:
+            self.watcher.close()
+        if self.main_loop is not None:
+            self.main_loop.log_stats()
+        self.blobs.close()
+        shutil.rmtree(self.blob_dir, ignore_errors=True)
         raise urwid.ExitMainLoop()
 
     def unhandled_keypress(self, key):
@@ -710,6 +1434,18 @@ class TestRunnerUI(object):
         elif key == 'r' or key == 'f5':
             self.run_tests(True)
 
+        # collect the changed test files
+        elif key == 'c':
+            self.recollect_tests()
+
+        # run the tests impacted by the changes
+        elif key == 'i':
+            self.run_impacted_tests()
+
+        # run the tests affected by the files changed since the git revision
+        elif key == 'g':
+            self.run_changed_tests()
+
         # move cursor down
         elif key == 'meta down':
             self.focus_failed_sibling(1)
@@ -728,6 +1464,10 @@ class TestRunnerUI(object):
                 select_tests=[test_id]
             )
 
+        # toggle following the running tests
+        elif key == 'f':
+            self.follow = not self.follow
+
         # toggle to show only failed test
         elif key == 'f4':
             self.store.show_failed_only = not self.store.show_failed_only
@@ -738,13 +1478,40 @@ class TestRunnerUI(object):
     'allow_extra_args': True,
 })
 @click.option('--debug/--no-debug', default=False, show_default=True, help='Enable debug logging')
+@click.option('--codec', type=click.Choice(list(CODECS)), default=DEFAULT_CODEC,
+              show_default=True, help='Runner messages encoding, json is human readable')
+@click.option('--transport', type=click.Choice(list(TRANSPORTS)), default=DEFAULT_TRANSPORT,
+              show_default=True, help='Runner to ui transport, pipe or shared memory ring buffer')
+@click.option('--runner', type=click.Choice(list(RUNNERS)), default=DEFAULT_RUNNER,
+              show_default=True,
+              help='Keep a warm runner worker, fork every run from a warm zygote, '
+                   'or start a new runner process for every run')
+@click.option('-n', '--workers', type=click.IntRange(min=1), default=1, show_default=True,
+              help='Number of runner processes running the tests in parallel')
+@click.option('--auto-collect/--no-auto-collect', default=False, show_default=True,
+              help='Collect the test files again, when they change')
+@click.option('--watch/--no-watch', default=False, show_default=True,
+              help='Run the tests affected by the changed files, on every change')
+@click.option('--coverage/--no-coverage', default=False, show_default=True,
+              help='Record the lines run by every test, to run the tests impacted by changes')
+@click.option('--changed-since', metavar='REV',
+              help='Run the tests affected by the files changed since the git revision, '
+                   'after the collection')
+@click.option('--fps', type=click.IntRange(min=1), default=DEFAULT_FPS, show_default=True,
+              help='Maximum screen redraws per second while the tests run, '
+                   'the input is drawn immediately')
+@click.option('--follow/--no-follow', default=True, show_default=True,
+              help='Scroll the test list to the running tests')
 @click.pass_context
-def main(ctx, debug):
+def main(ctx, debug, codec, transport, runner, workers, auto_collect, watch, coverage,
+         changed_since, fps, follow):
     logging_tools.configure('pytui-ui.log', debug)
     logger = get_logger('ui')
     logger.info('Configured logging')
 
-    ui = TestRunnerUI(PytestRunner, debug, ctx.args)
+    ui = TestRunnerUI(PytestRunner, debug, ctx.args, codec, transport, runner, workers,
+                      auto_collect, watch, coverage, changed_since, fps,
+                      follow)
     ui.run()
 
 
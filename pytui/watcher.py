@@ -0,0 +1,196 @@
+"""
+Watchers of the source files changes.
+
+InotifyWatcher watches the directory tree with inotify (linux), the ui reads
+its file descriptor in the main loop. PollingWatcher compares modification
+times of the files periodically, where inotify is not available.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+from builtins import object
+
+import os
+import errno
+import struct
+import ctypes
+import ctypes.util
+from collections import OrderedDict
+
+from logging_tools import get_logger
+from transport import read_available
+
+
+logger = get_logger('watcher')
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = (
+    IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+)
+# wd, mask, cookie, length of the name
+EVENT_HEADER = struct.Struct('iIII')
+
+# changes of other files than python sources don't affect the tests
+WATCHED_EXTENSIONS = ('.py',)
+WATCHED_NAMES = ('pytest.ini', 'tox.ini', 'setup.cfg', 'pyproject.toml')
+IGNORED_DIRECTORIES = ('__pycache__', 'node_modules')
+# how often PollingWatcher checks the files (seconds)
+POLL_INTERVAL = 1.0
+
+
+def is_watched_file(name):
+    return name.endswith(WATCHED_EXTENSIONS) or name in WATCHED_NAMES
+
+
+def is_ignored_directory(path):
+    name = os.path.basename(path)
+    return (
+        name.startswith('.') or
+        name in IGNORED_DIRECTORIES or
+        # virtualenv
+        os.path.exists(os.path.join(path, 'pyvenv.cfg'))
+    )
+
+
+def walk(root):
+    """ Yield the directories and files of the tree, skipping the ignored directories. """
+    for directory, directories, files in os.walk(root):
+        directories[:] = [
+            name for name in directories
+            if not is_ignored_directory(os.path.join(directory, name))
+        ]
+        yield directory, files
+
+
+class InotifyWatcher(object):
+    """
+    Watches all the directories of the tree, new directories are added as they appear.
+    """
+    poll_interval = None
+
+    def __init__(self, root):
+        self.root = root
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+
+        self.directories = {}
+        try:
+            for directory, _files in walk(root):
+                self.add_watch(directory)
+        except OSError:
+            self.close()
+            raise
+
+    def fileno(self):
+        return self.fd
+
+    def add_watch(self, directory):
+        wd = self.libc.inotify_add_watch(self.fd, directory.encode('utf-8'), WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            if error == errno.ENOENT:
+                # removed in the meantime
+                return
+            raise OSError(error, 'inotify_add_watch {} failed'.format(directory))
+        self.directories[wd] = directory
+
+    def read(self):
+        """ Return list of the watched paths changed since the last read. """
+        data = read_available(self.fd)
+        changed = OrderedDict()
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0').decode('utf-8', 'replace')
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                logger.warning('Inotify queue overflow, the whole tree changed')
+                changed[self.root] = None
+                continue
+            if mask & IN_IGNORED:
+                self.directories.pop(wd, None)
+                continue
+
+            directory = self.directories.get(wd)
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory, name)
+
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO) and not is_ignored_directory(path):
+                    # files could be created before the watch was added
+                    for new_directory, files in walk(path):
+                        self.add_watch(new_directory)
+                        changed.update(
+                            (os.path.join(new_directory, file_name), None)
+                            for file_name in files if is_watched_file(file_name)
+                        )
+                elif mask & IN_MOVED_FROM:
+                    changed[path] = None
+            elif is_watched_file(name):
+                changed[path] = None
+
+        return list(changed)
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher(object):
+    """
+    Compares the modification times of the watched files on every read.
+    """
+    poll_interval = POLL_INTERVAL
+
+    def __init__(self, root):
+        self.root = root
+        self.stamps = self.get_stamps()
+
+    def fileno(self):
+        return None
+
+    def get_stamps(self):
+        stamps = {}
+        for directory, files in walk(self.root):
+            for name in files:
+                if is_watched_file(name):
+                    path = os.path.join(directory, name)
+                    try:
+                        stamps[path] = os.stat(path).st_mtime
+                    except OSError:
+                        pass
+        return stamps
+
+    def read(self):
+        stamps = self.get_stamps()
+        changed = [
+            path for path in set(stamps) | set(self.stamps)
+            if stamps.get(path) != self.stamps.get(path)
+        ]
+        self.stamps = stamps
+        return sorted(changed)
+
+    def close(self):
+        pass
+
+
+def get_watcher(root):
+    """ Return inotify watcher of the tree, polling watcher if inotify isn't available. """
+    try:
+        return InotifyWatcher(root)
+    except (OSError, AttributeError) as e:
+        logger.info('Inotify not available (%s), polling for changes', e)
+        return PollingWatcher(root)
@@ -0,0 +1,500 @@
+"""
+Runner processes as seen from the ui.
+
+RunnerProcess starts a fresh process for every command. RunnerWorker keeps
+a single long-lived process with the interpreter, pytest and the imported test
+modules warm, and sends it the commands over a control channel. RunnerZygote
+forks every test run from such a warm process.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+from builtins import object
+
+import os
+import sys
+import time
+import errno
+import signal
+import multiprocessing
+from collections import OrderedDict
+
+from logging_tools import get_logger
+from common import is_project_file, CANCEL_SIGNAL
+
+
+logger = get_logger('worker')
+# maximum time the ui waits for the worker to accept a command (seconds)
+WORKER_REPLY_TIMEOUT = 10
+WORKER_STARTED = 'started'
+WORKER_QUEUED = 'queued'
+WORKER_RECYCLE = 'recycle'
+
+
+class WorkerError(Exception):
+    pass
+
+
+class ModuleTracker(object):
+    """
+    Watches modification times of the source files of all imported modules.
+
+    Changed project modules (under the project directory, outside site-packages)
+    can be purged from sys.modules, pytest imports them again on the next run.
+    Any other changed module makes the worker stale as a whole.
+    """
+    def __init__(self, project_dir):
+        self.project_dir = os.path.realpath(project_dir)
+        self._stamps = {}
+
+    def is_project_module(self, filename):
+        return is_project_file(filename, self.project_dir)
+
+    def _get_stamp(self, filename):
+        try:
+            return os.stat(filename).st_mtime
+        except OSError:
+            return None
+
+    def _module_files(self):
+        for name, module in list(sys.modules.items()):
+            filename = getattr(module, '__file__', None)
+            if filename:
+                yield name, os.path.realpath(filename)
+
+    def update(self, started=None):
+        """
+            Remember the stamps of the modules imported since the last update.
+            Files modified after the start of the command, which imported them,
+            may have changed after the import, they are reported as changed.
+        """
+        for name, filename in self._module_files():
+            if name not in self._stamps:
+                stamp = self._get_stamp(filename)
+                if started is not None and stamp is not None and stamp >= started:
+                    stamp = -1
+                self._stamps[name] = (filename, stamp)
+
+    def get_changed(self):
+        """ Return names and files of the modules changed since the last update. """
+        return [
+            (name, filename)
+            for name, (filename, stamp) in list(self._stamps.items())
+            if self._get_stamp(filename) != stamp
+        ]
+
+    def purge_project_modules(self):
+        """ Remove all the project modules from sys.modules. """
+        for name, filename in list(self._module_files()):
+            if self.is_project_module(filename):
+                del sys.modules[name]
+                self._stamps.pop(name, None)
+
+    def refresh(self):
+        """
+            Drop the changed modules, return False when they can't be dropped
+            and the process has to be recycled instead.
+        """
+        changed = self.get_changed()
+        if not changed:
+            return True
+
+        logger.info('Changed modules: %s', ', '.join(name for name, _filename in changed))
+        if not all(self.is_project_module(filename) for _name, filename in changed):
+            return False
+
+        # the unchanged project modules may hold references to the changed ones
+        self.purge_project_modules()
+        return True
+
+
+def worker_main(connection, ui_connection, runner_class, writer, debug, codec, blob_dir):
+    """ Worker process entrypoint, executes runner commands until the ui goes away. """
+    ui_connection.close()
+    runner_class.configure_process(debug)
+    runner = runner_class(writer=writer, codec=codec, blob_dir=blob_dir)
+    modules = ModuleTracker(os.getcwd())
+    logger.info('Worker started')
+
+    while True:
+        try:
+            command, kwargs = connection.recv()
+        except EOFError:
+            break
+
+        if not modules.refresh():
+            logger.info('Worker is stale, recycling')
+            connection.send((WORKER_RECYCLE, None))
+            break
+
+        connection.send((WORKER_STARTED, os.getpid()))
+        logger.info('Worker command %s', command)
+        started = time.time()
+        getattr(runner, command)(**kwargs)
+        modules.update(started)
+
+    runner.flush()
+    logger.info('Worker finished')
+
+
+def zygote_main(connection, ui_connection, runner_class, writer, debug, codec, blob_dir,
+                warm_up_args=None):
+    """
+        Zygote process entrypoint. Collects the tests to import all the test modules,
+        then forks a new process from this warm state for every test run.
+        A zygote collecting only a shard of the tests imports the rest before the next command.
+    """
+    ui_connection.close()
+    runner_class.configure_process(debug)
+    # forked runs are reaped by the kernel
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    runner = runner_class(writer=writer, codec=codec, blob_dir=blob_dir)
+    modules = ModuleTracker(os.getcwd())
+    modules.update(time.time())
+    logger.info('Zygote started')
+
+    while True:
+        try:
+            command, kwargs = connection.recv()
+        except EOFError:
+            break
+
+        if modules.get_changed():
+            logger.info('Zygote is stale, rebuilding')
+            connection.send((WORKER_RECYCLE, None))
+            break
+
+        if warm_up_args is not None:
+            # the ui doesn't wait for the warm up, the command is started after it
+            connection.send((WORKER_QUEUED, None))
+            started = time.time()
+            runner.warm_up_command(warm_up_args)
+            modules.update(started)
+            warm_up_args = None
+
+        if command != 'run_tests_command':
+            connection.send((WORKER_STARTED, os.getpid()))
+            # the forked runs have reset the strings of the ui decoder
+            runner.new_session()
+            started = time.time()
+            getattr(runner, command)(**kwargs)
+            modules.update(started)
+            if kwargs.get('collect_shard') is not None:
+                # the shard imported only a part of the test modules, but the runs
+                # are scheduled to any zygote, all the modules are imported before the next one
+                warm_up_args = kwargs['pytest_args']
+            continue
+
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            connection.close()
+            try:
+                # new runner starts a new encoder session, the ui forgets strings
+                # sent by the previous runs
+                run_runner = runner_class(writer=writer, codec=codec, blob_dir=blob_dir)
+                run_runner.run_tests_command(**kwargs)
+            finally:
+                os._exit(0)
+
+        logger.info('Zygote forked run %s', pid)
+        connection.send((WORKER_STARTED, pid))
+
+    logger.info('Zygote finished')
+
+
+def is_pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+
+class RunnerProcess(object):
+    """
+    Starts a new runner process for every command.
+    """
+    # collect only files changed since the last collection
+    use_collection_cache = True
+
+    def __init__(self, runner_class, transport, debug, codec, blob_dir, track_imports=False,
+                 record_coverage=False):
+        self.runner_class = runner_class
+        self.transport = transport
+        self.debug = debug
+        self.codec = codec
+        self.blob_dir = blob_dir
+        # the collections record the import graph into the collection cache
+        self.track_imports = track_imports
+        # the test runs record the lines run by every test
+        self.record_coverage = record_coverage
+        self.process = None
+
+    def is_running(self):
+        return self.process is not None and self.process.is_alive()
+
+    def get_command_pid(self):
+        return self.process.pid
+
+    def cancel(self):
+        """ Stop the running tests after the current test, the run finishes as usual. """
+        if self.is_running():
+            os.kill(self.get_command_pid(), CANCEL_SIGNAL)
+
+    def command_finished(self):
+        pass
+
+    def receive_reply(self):
+        pass
+
+    def _start(self, target, args, kwargs):
+        kwargs.update({
+            'codec': self.codec,
+            'blob_dir': self.blob_dir,
+        })
+        self.process = multiprocessing.Process(
+            target=target,
+            name='pytui-runner',
+            args=args,
+            kwargs=kwargs
+        )
+        self.process.start()
+
+    def init_tests(self, pytest_args, collect_shard=None):
+        self._start(
+            self.runner_class.process_init_tests,
+            (self.transport.get_writer(), self.debug),
+            {
+                'pytest_args': pytest_args,
+                'use_cache': self.use_collection_cache,
+                'collect_shard': collect_shard,
+                'track_imports': self.track_imports,
+            }
+        )
+
+    def recollect_tests(self, pytest_args):
+        self._start(
+            self.runner_class.process_recollect_tests,
+            (self.transport.get_writer(), self.debug),
+            {
+                'pytest_args': pytest_args,
+                'track_imports': self.track_imports,
+            }
+        )
+
+    def run_tests(self, failed_only, filtered, filter_value, pytest_args, select_tests,
+                  collect_files=None):
+        self._start(
+            self.runner_class.process_run_tests,
+            (failed_only, filtered, self.transport.get_writer(), filter_value, self.debug),
+            {
+                'pytest_args': pytest_args,
+                'select_tests': select_tests,
+                'collect_files': collect_files,
+                'record_coverage': self.record_coverage,
+            }
+        )
+
+    def terminate(self):
+        if self.is_running():
+            self.process.terminate()
+
+
+class RunnerWorker(RunnerProcess):
+    """
+    Keeps a warm runner process, which executes the commands one by one.
+    The worker is recycled when a module it can't reload has changed.
+    """
+    def __init__(self, *args, **kwargs):
+        super(RunnerWorker, self).__init__(*args, **kwargs)
+        self.connection = None
+        self.command_pid = None
+        self._running = False
+        # the command was accepted, but it was not started yet
+        self._queued = False
+        self._cancel_queued = False
+
+    def is_running(self):
+        return self._running and super(RunnerWorker, self).is_running()
+
+    def get_command_pid(self):
+        self.receive_reply()
+        return self.command_pid
+
+    def cancel(self):
+        if self.is_running() and self.get_command_pid() is None:
+            logger.info('Command not started yet, cancelled when it starts')
+            self._cancel_queued = True
+            return
+        super(RunnerWorker, self).cancel()
+
+    def command_finished(self):
+        self._cancel_queued = False
+        if self._queued:
+            # the worker replies before the command reports its end
+            self.connection.poll(WORKER_REPLY_TIMEOUT)
+            self.receive_reply()
+        self._running = False
+        self._queued = False
+
+    def receive_reply(self):
+        """ Receive the reply to the queued command, once the worker has started it. """
+        if not self._queued or not self.connection.poll():
+            return
+        self._queued = False
+        try:
+            status, self.command_pid = self.connection.recv()
+        except EOFError:
+            status = None
+        if status != WORKER_STARTED:
+            logger.error('Worker %s failed to start the queued command (%s)',
+                         self.process.pid, status)
+            self._running = False
+            return
+
+        if self._cancel_queued:
+            self._cancel_queued = False
+            if is_pid_alive(self.command_pid):
+                os.kill(self.command_pid, CANCEL_SIGNAL)
+
+    def start(self, restart=False):
+        self.connection, worker_connection = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(
+            target=worker_main,
+            name='pytui-worker',
+            args=(worker_connection, self.connection, self.runner_class,
+                  self.transport.get_writer(), self.debug, self.codec, self.blob_dir)
+        )
+        self.process.start()
+        worker_connection.close()
+        logger.info('Worker %s started', self.process.pid)
+
+    def stop(self):
+        self._queued = False
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+        if self.process is not None:
+            self.process.join(WORKER_REPLY_TIMEOUT)
+            self.terminate()
+            self.process = None
+
+    def _send(self, command, kwargs):
+        """ Send the command, return the reply of the worker. """
+        self.connection.send((command, kwargs))
+        if self.connection.poll(WORKER_REPLY_TIMEOUT):
+            return self.connection.recv()
+        return None, None
+
+    def _command(self, command, **kwargs):
+        """ Start the command, raise WorkerError when the worker doesn't accept it. """
+        if self.process is None or not self.process.is_alive():
+            self.stop()
+            self.start(restart=self.process is not None)
+
+        self._running = True
+        self._cancel_queued = False
+        status, self.command_pid = self._send(command, kwargs)
+        if status not in (WORKER_STARTED, WORKER_QUEUED):
+            logger.info('Worker %s rejected command %s (%s), restarting',
+                        self.process.pid, command, status)
+            self.stop()
+            self.start(restart=True)
+            status, self.command_pid = self._send(command, kwargs)
+
+        if status not in (WORKER_STARTED, WORKER_QUEUED):
+            self._running = False
+            raise WorkerError('Runner worker did not start the command {} ({})'.format(
+                command, status or 'no reply in {}s'.format(WORKER_REPLY_TIMEOUT)
+            ))
+        self._queued = status == WORKER_QUEUED
+
+    def init_tests(self, pytest_args, collect_shard=None):
+        self._command('init_tests_command', pytest_args=pytest_args,
+                      use_cache=self.use_collection_cache, collect_shard=collect_shard,
+                      track_imports=self.track_imports)
+
+    def recollect_tests(self, pytest_args):
+        self._command('recollect_tests_command', pytest_args=pytest_args,
+                      track_imports=self.track_imports)
+
+    def run_tests(self, failed_only, filtered, filter_value, pytest_args, select_tests,
+                  collect_files=None):
+        self._command(
+            'run_tests_command',
+            failed_only=failed_only,
+            filtered=filtered,
+            filter_value=filter_value,
+            pytest_args=pytest_args,
+            select_tests=select_tests,
+            collect_files=collect_files,
+            record_coverage=self.record_coverage
+        )
+
+    def terminate(self):
+        if self.process is not None and self.process.is_alive():
+            self.process.terminate()
+
+
+class RunnerZygote(RunnerWorker):
+    """
+    Keeps a zygote process with all the test modules imported, every test run
+    is executed in a new process forked from it. The runs start warm and can't
+    leak state into each other. The zygote is rebuilt when any module has changed.
+    """
+    # the collection has to import all the test modules into the zygote
+    use_collection_cache = False
+
+    def __init__(self, *args, **kwargs):
+        super(RunnerZygote, self).__init__(*args, **kwargs)
+        self.pytest_args = None
+
+    def is_running(self):
+        if self._running and self._queued:
+            self.receive_reply()
+        if self._queued:
+            # the zygote is warming up
+            return self._running
+        return self._running and self.command_pid is not None and is_pid_alive(self.command_pid)
+
+    def start(self, restart=False):
+        self.connection, zygote_connection = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(
+            target=zygote_main,
+            name='pytui-zygote',
+            args=(zygote_connection, self.connection, self.runner_class,
+                  self.transport.get_writer(), self.debug, self.codec, self.blob_dir),
+            kwargs={
+                # rebuilt zygote imports the test modules without reporting them
+                'warm_up_args': self.pytest_args if restart else None,
+            }
+        )
+        self.process.start()
+        zygote_connection.close()
+        logger.info('Zygote %s started', self.process.pid)
+
+    def init_tests(self, pytest_args, collect_shard=None):
+        self.pytest_args = pytest_args
+        super(RunnerZygote, self).init_tests(pytest_args, collect_shard)
+
+    def terminate(self):
+        if (
+            self.command_pid is not None and
+            self.process is not None and
+            self.command_pid != self.process.pid and
+            is_pid_alive(self.command_pid)
+        ):
+            os.kill(self.command_pid, signal.SIGTERM)
+        super(RunnerZygote, self).terminate()
+
+
+RUNNERS = OrderedDict([
+    ('worker', RunnerWorker),
+    ('zygote', RunnerZygote),
+    ('process', RunnerProcess),
+])
+DEFAULT_RUNNER = 'worker'
+
+
+def get_runner(name, *args, **kwargs):
+    return RUNNERS[name](*args, **kwargs)
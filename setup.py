@@ -21,7 +21,6 @@ setup(
     install_requires=[
         'future',
         'pytest',
-        'tblib',
         'urwid',
         'click',
     ],
@@ -0,0 +1,36 @@
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import shutil
+import tempfile
+from unittest import TestCase
+
+from pytui.blobstore import BlobWriter, BlobReader
+
+
+class BlobStoreTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.writer = BlobWriter(self.directory)
+        self.reader = BlobReader(self.directory)
+
+    def tearDown(self):
+        self.writer.close()
+        self.reader.close()
+        shutil.rmtree(self.directory)
+
+    def test_empty_text_has_no_handle(self):
+        assert self.writer.write('') is None
+
+    def test_read_written_texts(self):
+        first = self.writer.write('first output\n')
+        second = self.writer.write('druhý výstup\n')
+        assert self.reader.read(second) == 'druhý výstup\n'
+        assert self.reader.read(first) == 'first output\n'
+
+    def test_read_after_file_grows(self):
+        first = self.writer.write('a' * 10)
+        assert self.reader.read(first) == 'a' * 10
+
+        second = self.writer.write('b' * 100000)
+        assert self.reader.read(second) == 'b' * 100000
@@ -0,0 +1,82 @@
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import pytest
+
+from pytui.codec import get_encoder, get_decoder, CODECS, BinaryEncoder
+
+MESSAGES = [
+    ('item_collected', {'item_id': 'tests/test_a.py::test_č'}),
+    ('set_test_state', {'test_id': 'tests/test_a.py::test_č', 'state': 'setup'}),
+    ('set_test_result', {
+        'test_id': 'tests/test_a.py::test_č',
+        'output': 'captured\noutput',
+        'output_blob': ['output-1.blob', 2 ** 40, 100],
+        'result_state': 'failed',
+        'when': 'call',
+        'outcome': 'failed',
+        'last_failed_exempt': True,
+        'duration': 0.25,
+    }),
+    ('set_exception_info', {
+        'test_id': 'tests/test_a.py::test_č',
+        'exc_type': "<class 'AssertionError'>",
+        'exc_value': 'AssertionError: 1 != 2\n',
+        'formatted_traceback': '  File "tests/test_a.py", line 5, in test_č\n',
+        'traceback_blob': None,
+        'result_state': 'failed',
+        'when': 'call',
+    }),
+    ('set_pytest_error', {'exitcode': 2, 'description': None}),
+    ('set_test_fixtures', {
+        'test_id': 'tests/test_a.py::test_č',
+        'fixtures': ['db@tests/test_a.py', 'app@tests'],
+    }),
+    ('set_fixture_duration', {'fixture': 'db@tests/test_a.py', 'duration': 1.5}),
+    ('recollect_finished', {'files': ['tests/test_a.py']}),
+    ('unknown_method', {'anything': [1, 2], 'nested': {'key': None}}),
+    ('run_finished', {}),
+]
+
+
+def roundtrip(encoder, decoder, messages):
+    records = [encoder.encode(method, params) for method, params in messages]
+    return decoder.decode(memoryview(encoder.join(records)))
+
+
+def without_none(params):
+    return dict((key, value) for key, value in params.items() if value is not None)
+
+
+@pytest.mark.parametrize('codec', list(CODECS))
+def test_roundtrip(codec):
+    decoded = roundtrip(get_encoder(codec), get_decoder(codec), MESSAGES)
+    # optional fields missing in the message are decoded as None by the binary codec
+    assert [(method, without_none(params)) for method, params in decoded] == \
+        [(method, without_none(params)) for method, params in MESSAGES]
+
+
+def test_binary_strings_sent_once():
+    encoder = BinaryEncoder()
+    test_id = 'tests/test_module.py::TestClass::test_with_long_name'
+    first = encoder.encode('set_test_state', {'test_id': test_id, 'state': 'setup'})
+    second = encoder.encode('set_test_state', {'test_id': test_id, 'state': 'setup'})
+    assert test_id.encode('utf-8') in first
+    assert test_id.encode('utf-8') not in second
+    assert len(second) < 10
+
+
+def test_binary_new_session_resets_strings():
+    decoder = get_decoder('binary')
+    for _session in range(2):
+        decoded = roundtrip(BinaryEncoder(), decoder, MESSAGES[:2])
+        assert decoded[1] == MESSAGES[1]
+
+
+def test_binary_empty_and_none_strings():
+    messages = [
+        ('set_pytest_error', {'exitcode': 0, 'description': ''}),
+        ('set_pytest_error', {'exitcode': 1, 'description': None}),
+        ('set_test_fixtures', {'test_id': 'tests/test_a.py::test_a', 'fixtures': []}),
+    ]
+    assert roundtrip(BinaryEncoder(), get_decoder('binary'), messages) == messages
@@ -0,0 +1,70 @@
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+
+from unittest import TestCase
+
+from pytui.collection_cache import CollectionCache, LOCK_FILE
+
+
+class CollectionCacheTests(TestCase):
+    def setUp(self):
+        self.rootdir = tempfile.mkdtemp()
+        self.test_file = os.path.join(self.rootdir, 'test_a.py')
+        with open(self.test_file, 'w') as test_file:
+            test_file.write('def test_a():\n    pass\n')
+        self.path = os.path.join(self.rootdir, '.pytui_cache', 'collection.json')
+
+        cache = CollectionCache(self.path)
+        cache.update(self.rootdir, [('test_a.py::test_a', ['db@test_a.py'])], set(), ['test_a.py'])
+        cache.save()
+
+    def tearDown(self):
+        shutil.rmtree(self.rootdir)
+
+    def load(self):
+        cache = CollectionCache(self.path)
+        test_ids = cache.load()
+        cache.validate(self.rootdir)
+        return cache, test_ids
+
+    def test_fresh(self):
+        cache, test_ids = self.load()
+        assert test_ids == ['test_a.py::test_a']
+        entry = cache.get_fresh(self.test_file)
+        assert entry['tests'] == ['test_a.py::test_a']
+        assert entry['fixtures'] == {'test_a.py::test_a': ['db@test_a.py']}
+
+    def test_changed(self):
+        with open(self.test_file, 'a') as test_file:
+            test_file.write('def test_b():\n    pass\n')
+
+        cache, _test_ids = self.load()
+        assert cache.get_fresh(self.test_file) is None
+
+    def test_touched(self):
+        stat = os.stat(self.test_file)
+        os.utime(self.test_file, (stat.st_atime, stat.st_mtime + 10))
+
+        cache, _test_ids = self.load()
+        assert cache.get_fresh(self.test_file) is not None
+
+    def test_conftest_added(self):
+        with open(os.path.join(self.rootdir, 'conftest.py'), 'w') as conftest:
+            conftest.write('\n')
+
+        cache, _test_ids = self.load()
+        assert not cache.valid
+        assert cache.get_fresh(self.test_file) is None
+
+    def test_single_lock_file(self):
+        cache = CollectionCache(os.path.join(self.rootdir, '.pytui_cache', 'collection-b.json'))
+        cache.update(self.rootdir, [('test_a.py::test_a', [])], set(), ['test_a.py'])
+        cache.save()
+
+        assert sorted(os.listdir(os.path.join(self.rootdir, '.pytui_cache'))) == [
+            'collection-b.json', 'collection.json', LOCK_FILE
+        ]
@@ -0,0 +1,112 @@
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import os
+import sys
+import shutil
+import tempfile
+
+from unittest import TestCase
+
+from pytui.coverage_map import CoverageMap, LineTracer, get_changed_lines
+from pytui.import_graph import ImportGraph
+
+
+SOURCE = '''\
+def double(value):
+    return value * 2
+
+
+def half(value):
+    return value / 2
+'''
+
+
+class CoverageMapTests(TestCase):
+    def setUp(self):
+        self.rootdir = tempfile.mkdtemp()
+        self.write(SOURCE)
+        self.coverage_map = CoverageMap(os.path.join(self.rootdir, 'coverage.sqlite'))
+        self.coverage_map.record(self.rootdir, {
+            'test_a.py::test_double': {'calc.py': set([1, 2]), 'test_a.py': set([1, 2])},
+            'test_a.py::test_half': {'calc.py': set([5, 6]), 'test_a.py': set([4, 5])},
+        })
+        self.test_ids = ['test_a.py::test_double', 'test_a.py::test_half', 'test_a.py::test_new']
+
+    def tearDown(self):
+        shutil.rmtree(self.rootdir)
+
+    def write(self, source):
+        with open(os.path.join(self.rootdir, 'calc.py'), 'w') as source_file:
+            source_file.write(source)
+
+    def test_unchanged(self):
+        assert self.coverage_map.get_impacted(self.test_ids) == ['test_a.py::test_new']
+
+    def test_line_changed(self):
+        self.write(SOURCE.replace('value / 2', 'value / 2.0'))
+        assert self.coverage_map.get_impacted(self.test_ids) == [
+            'test_a.py::test_half', 'test_a.py::test_new'
+        ]
+
+    def test_uncovered_line_added(self):
+        self.write(SOURCE.replace('\n\n\n', '\n\nLIMIT = 10\n\n'))
+        assert self.coverage_map.get_impacted(self.test_ids) == self.test_ids
+
+    def test_file_removed(self):
+        os.remove(os.path.join(self.rootdir, 'calc.py'))
+        assert self.coverage_map.get_impacted(self.test_ids) == self.test_ids
+
+    def test_imported_file_changed(self):
+        """ Change of a file run only at import time affects the tests importing it. """
+        consts_path = os.path.join(self.rootdir, 'consts.py')
+        with open(consts_path, 'w') as consts_file:
+            consts_file.write('VALUE = 1\n')
+        self.coverage_map.record(self.rootdir, {
+            'test_a.py::test_double': {'calc.py': set([1, 2])},
+            'test_b.py::test_half': {'calc.py': set([5, 6])},
+        }, [consts_path, os.path.join(self.rootdir, 'calc.py')])
+        test_ids = ['test_a.py::test_double', 'test_b.py::test_half']
+        import_graph = ImportGraph({'test_a.py': ['consts.py']})
+        assert self.coverage_map.get_impacted(test_ids, import_graph) == []
+
+        with open(consts_path, 'w') as consts_file:
+            consts_file.write('VALUE = 5\n')
+        assert self.coverage_map.get_impacted(test_ids, import_graph) == [
+            'test_a.py::test_double'
+        ]
+        # without the import graph, all the tests which imported it are affected
+        assert self.coverage_map.get_impacted(test_ids) == test_ids
+
+    def test_changed_lines(self):
+        assert get_changed_lines([1, 2, 3], [1, 4, 3]) == [set([2])]
+        assert get_changed_lines([1, 2, 3], [1, 2, 5, 3]) == [set([2, 3])]
+        assert get_changed_lines([1, 2, 3], [1, 3]) == [set([2])]
+
+
+class LineTracerTests(TestCase):
+    def setUp(self):
+        self.rootdir = tempfile.mkdtemp()
+        with open(os.path.join(self.rootdir, 'traced_calc.py'), 'w') as source_file:
+            source_file.write(SOURCE)
+        sys.path.insert(0, self.rootdir)
+        self.addCleanup(sys.path.remove, self.rootdir)
+        self.addCleanup(sys.modules.pop, 'traced_calc', None)
+
+    def tearDown(self):
+        shutil.rmtree(self.rootdir)
+
+    def test_lines(self):
+        import traced_calc
+
+        tracer = LineTracer(self.rootdir)
+        tracer.start()
+        traced_calc.double(1)
+        tracer.push()
+        traced_calc.half(1)
+        nested = tracer.pop()
+        lines = tracer.stop()
+        tracer.close()
+
+        assert nested == {'traced_calc.py': set([5, 6])}
+        assert lines == {'traced_calc.py': set([1, 2, 5, 6])}
@@ -0,0 +1,58 @@
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+import subprocess
+
+import pytest
+
+from pytui.git_changes import GitError, get_changed_files
+
+
+def git(repo, *args):
+    command = ['git', '-c', 'user.name=test', '-c', 'user.email=test@example.com']
+    subprocess.check_call(command + list(args), cwd=repo, stdout=subprocess.PIPE)
+
+
+def write(repo, name, content):
+    path = os.path.join(repo, name)
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as changed_file:
+        changed_file.write(content)
+
+
+@pytest.fixture
+def repo():
+    repo = os.path.realpath(tempfile.mkdtemp())
+    try:
+        git(repo, 'init', '-q')
+    except (OSError, subprocess.CalledProcessError):
+        shutil.rmtree(repo)
+        pytest.skip('git not available')
+    for name in ['app/models.py', 'app/views.py', 'tests/test_models.py']:
+        write(repo, name, '')
+    git(repo, 'add', '.')
+    git(repo, 'commit', '-q', '-m', 'base')
+    yield repo
+    shutil.rmtree(repo)
+
+
+def test_changed_files(repo):
+    write(repo, 'app/models.py', 'VALUE = 1\n')
+    write(repo, 'tests/test_views.py', '')
+    write(repo, 'app/staged.py', '')
+    git(repo, 'add', 'app/staged.py')
+    os.remove(os.path.join(repo, 'app/views.py'))
+
+    assert get_changed_files('HEAD', os.path.join(repo, 'tests')) == [
+        os.path.join(repo, name)
+        for name in ['app/models.py', 'app/staged.py', 'app/views.py', 'tests/test_views.py']
+    ]
+
+
+def test_unknown_revision(repo):
+    with pytest.raises(GitError):
+        get_changed_files('no-such-revision', repo)
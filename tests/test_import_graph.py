@@ -0,0 +1,48 @@
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+
+from unittest import TestCase
+
+from pytui.import_graph import ImportGraph, get_imported_names
+
+
+class ImportGraphTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_imported_names(self):
+        path = os.path.join(self.directory, 'test_module.py')
+        with open(path, 'w') as module_file:
+            module_file.write(
+                'import os.path\n'
+                'from . import helpers\n'
+                'from ..common import VALUE\n'
+                'def test_a():\n'
+                '    from package.lazy import value\n'
+            )
+
+        names = get_imported_names(path, 'package.tests.test_module')
+        assert names >= set([
+            'os', 'os.path',
+            'package', 'package.tests', 'package.tests.helpers',
+            'package.common', 'package.common.VALUE',
+            'package.lazy', 'package.lazy.value',
+        ])
+
+    def test_affected(self):
+        graph = ImportGraph({
+            'tests/test_a.py': ['tests/helpers.py'],
+            'tests/test_b.py': ['app/models.py'],
+            'tests/helpers.py': ['app/utils.py'],
+        })
+        assert graph.get_affected(['app/utils.py']) == set([
+            'app/utils.py', 'tests/helpers.py', 'tests/test_a.py'
+        ])
+        assert graph.get_affected(['tests/test_b.py']) == set(['tests/test_b.py'])
@@ -0,0 +1,44 @@
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from unittest import TestCase
+
+import urwid
+
+from pytui.render import RenderLoop
+
+
+@mock.patch.object(urwid.MainLoop, 'draw_screen')
+class RenderLoopTests(TestCase):
+    def setUp(self):
+        self.time = 100.0
+        patcher = mock.patch('pytui.render.time.time', side_effect=lambda: self.time)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.loop = RenderLoop(urwid.SolidFill(), screen=mock.Mock(started=True), fps=10)
+
+    def test_frame_rate_limited(self, draw_screen_mock):
+        self.loop.entering_idle()
+        self.time += 0.01
+        self.loop.entering_idle()
+        self.loop.entering_idle()
+        assert draw_screen_mock.call_count == 1
+        assert self.loop.stats.skipped == 2
+        assert self.loop._draw_alarm is not None
+
+        self.time += 0.1
+        self.loop.entering_idle()
+        assert draw_screen_mock.call_count == 2
+        assert self.loop._draw_alarm is None
+
+    def test_input_drawn_immediately(self, draw_screen_mock):
+        self.loop.entering_idle()
+        self.time += 0.01
+        self.loop.process_input(['x'])
+        self.loop.entering_idle()
+        assert draw_screen_mock.call_count == 2
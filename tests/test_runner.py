@@ -5,12 +5,21 @@ try:
     from unittest import mock
 except ImportError:
     import mock
+import os
+import sys
+import shutil
 import logging
 import tempfile
+import threading
 
 from unittest import TestCase
 
 from pytui.runner import PytestRunner, Runner
+from pytui.transport import FrameWriter, FrameDecoder, FRAME_HEADER
+from pytui.codec import get_decoder
+from pytui.collection_cache import CollectionCache
+from pytui.import_graph import ImportGraph
+from pytui.coverage_map import CoverageMap
 
 
 logging.basicConfig()
@@ -21,16 +30,32 @@ logger.setLevel('DEBUG')
 class PytestRunnerTests(TestCase):
     def setUp(self):
         self.pipe_mock = tempfile.TemporaryFile()
-        self.pipe_size_mock = mock.Mock()
-        self.pipe_semaphore_mock = mock.Mock()
+        self.writer = FrameWriter(self.pipe_mock.fileno())
+
+    def make_project(self, files):
+        """
+            Write the files (source by name) into a new project directory and keep
+            its collection cache there. Return the pytest args and the cache path.
+        """
+        project_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, project_dir)
+        for name, source in files.items():
+            with open(os.path.join(project_dir, name), 'w') as project_file:
+                project_file.write(source)
+
+        cache_path = os.path.join(project_dir, 'collection.json')
+        cache_patch = mock.patch('pytui.runner.get_cache_path', return_value=cache_path)
+        cache_patch.start()
+        self.addCleanup(cache_patch.stop)
+        return ['-p', 'no:cacheprovider', '--rootdir', project_dir, project_dir], cache_path
 
     def test_skipping(self):
-        runner = PytestRunner(
-            self.pipe_mock.fileno(),
-            self.pipe_size_mock,
-            self.pipe_semaphore_mock
-        )
-        with mock.patch.object(PytestRunner, 'pipe_send') as pipe_send_mock:
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        runner = PytestRunner(self.writer)
+        with mock.patch.object(PytestRunner, 'pipe_send') as pipe_send_mock, \
+                mock.patch('pytui.runner.get_cache_path',
+                           return_value=os.path.join(cache_dir, 'collection.json')):
             logger.debug('------ runner init ------')
             exitcode, _description = runner.init_tests(['test_projects/test_module_a/'])
             assert exitcode == 0
@@ -48,9 +73,7 @@ class PytestRunnerTests(TestCase):
         Test whether set_pytest_error(exitcode=1) is sent to ui from runner throught the pipe.
         """
         PytestRunner.process_init_tests(
-            self.pipe_mock.fileno(),
-            self.pipe_size_mock,
-            self.pipe_semaphore_mock,
+            self.writer,
             True,
             ['test_projects/test_module_a/'],
         )
@@ -59,3 +82,267 @@ class PytestRunnerTests(TestCase):
             mock.call('set_pytest_error', exitcode=1, description=None),
             mock.call('init_finished')
         ]
+
+    @mock.patch('pytui.runner.BATCH_INTERVAL', 10)
+    def test_pipe_send_batching(self):
+        """
+        Test whether messages sent in a quick succession are written as a single frame.
+        """
+        runner = Runner(self.writer)
+        runner.pipe_send('set_test_state', test_id='test_a', state='setup')
+        runner.pipe_send('set_test_state', test_id='test_a', state='call')
+        runner.flush()
+
+        self.pipe_mock.seek(0)
+        data = self.pipe_mock.read()
+        (frame_size,) = FRAME_HEADER.unpack_from(data)
+        assert len(data) == FRAME_HEADER.size + frame_size
+        assert get_decoder('binary').decode(memoryview(data)[FRAME_HEADER.size:]) == [
+            ('set_test_state', {'test_id': 'test_a', 'state': 'setup'}),
+            ('set_test_state', {'test_id': 'test_a', 'state': 'call'}),
+        ]
+
+    def test_pipe_send_threads(self):
+        """
+        Test whether messages sent by several threads reference the strings they sent.
+        """
+        runner = Runner(self.writer)
+
+        def send(thread_index):
+            for index in range(2000):
+                item_id = 'test_{}_{}'.format(thread_index, index)
+                runner.pipe_send('item_collected', item_id=item_id)
+
+        threads = [threading.Thread(target=send, args=(index,)) for index in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        runner.flush()
+
+        self.pipe_mock.seek(0)
+        decoder = get_decoder('binary')
+        item_ids = [
+            params['item_id']
+            for frame in FrameDecoder().feed(self.pipe_mock.read())
+            for _method, params in decoder.decode(frame)
+        ]
+        assert sorted(item_ids) == sorted(
+            'test_{}_{}'.format(thread_index, index)
+            for thread_index in range(4) for index in range(2000)
+        )
+
+    @mock.patch.object(Runner, 'pipe_send')
+    def test_output_sent_per_phase(self, pipe_send_mock):
+        """
+        Test whether only the output captured in the current phase is sent to ui.
+        """
+        runner = PytestRunner(self.writer)
+        sections = [
+            ('Captured stdout setup', 'setup out\n'),
+            ('Captured log call', 'log record\n'),
+            ('Captured stdout call', 'call out\n'),
+            ('Captured stderr call', 'call err\n'),
+            ('Captured stdout teardown', 'teardown out\n'),
+        ]
+        for when, section_count in (('setup', 1), ('call', 4), ('teardown', 5)):
+            report = mock.Mock(when=when, outcome='passed', sections=sections[:section_count])
+            runner.set_test_result('test_a', report)
+
+        assert [call[1]['output'] for call in pipe_send_mock.call_args_list] == [
+            'setup out\n',
+            'call out\ncall err\n',
+            'teardown out\n',
+        ]
+
+    @mock.patch.object(Runner, 'pipe_send')
+    def test_shared_fixtures_sent(self, pipe_send_mock):
+        """
+        Test whether module scoped fixtures of the tests and their setup durations are sent.
+        """
+        pytest_args, _cache_path = self.make_project({
+            'test_fixtures.py': (
+                'import pytest\n'
+                '@pytest.fixture(scope="module")\n'
+                'def db():\n'
+                '    return 1\n'
+                'def test_a(db):\n'
+                '    pass\n'
+            ),
+        })
+        runner = PytestRunner(self.writer)
+        runner.init_tests(pytest_args)
+        calls = [
+            call[1] for call in pipe_send_mock.call_args_list
+            if call[0] == ('set_test_fixtures',)
+        ]
+        assert calls == [
+            {'test_id': 'test_fixtures.py::test_a', 'fixtures': ['db@test_fixtures.py']}
+        ]
+
+        runner.run_tests(False, None, pytest_args)
+        calls = [
+            call[1]['fixture'] for call in pipe_send_mock.call_args_list
+            if call[0] == ('set_fixture_duration',)
+        ]
+        assert calls == ['db@test_fixtures.py']
+
+    @mock.patch.object(Runner, 'pipe_send')
+    def test_collection_narrowed(self, pipe_send_mock):
+        """
+        Test whether only the files given by collect_files are collected.
+        """
+        runner = PytestRunner(self.writer)
+        test_file = 'test_projects/test_module_a/test_feat_1.py'
+        # the whole tree contains modules failing to import
+        exitcode, _description = runner.run_tests(False, None, ['test_projects/'],
+                                                  collect_files=[test_file])
+        assert exitcode == 1
+        collected = [
+            call[1]['item_id'] for call in pipe_send_mock.call_args_list
+            if call[0] == ('item_collected',)
+        ]
+        assert collected
+        assert all(item_id.startswith(test_file + '::') for item_id in collected)
+
+    @mock.patch.object(Runner, 'pipe_send')
+    def test_collection_cache(self, pipe_send_mock):
+        """
+        Test whether tests of unchanged files are reported from the collection cache.
+        """
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        cache_path = os.path.join(cache_dir, 'collection.json')
+
+        collected = []
+        with mock.patch('pytui.runner.get_cache_path', return_value=cache_path):
+            for _run in range(2):
+                pipe_send_mock.reset_mock()
+                runner = PytestRunner(self.writer)
+                exitcode, _description = runner.init_tests(['test_projects/test_module_a/'],
+                                                           use_cache=True)
+                assert exitcode == 0
+                collected.append([
+                    call[1]['item_id'] for call in pipe_send_mock.call_args_list
+                    if call[0] == ('item_collected',)
+                ])
+
+        assert len(collected[0]) == 11
+        assert collected[1] == collected[0]
+
+    @mock.patch.object(Runner, 'pipe_send')
+    def test_recollect_changed(self, pipe_send_mock):
+        """
+        Test whether only tests of the changed files are reported by the recollection.
+        """
+        pytest_args, _cache_path = self.make_project({
+            'test_a.py': 'def test_one():\n    pass\n',
+            'test_b.py': 'def test_one():\n    pass\n',
+        })
+        project_dir = pytest_args[-1]
+        runner = PytestRunner(self.writer)
+        runner.init_tests(pytest_args)
+
+        with open(os.path.join(project_dir, 'test_b.py'), 'a') as test_file:
+            test_file.write('def test_two():\n    pass\n')
+        os.remove(os.path.join(project_dir, 'test_a.py'))
+        # the runner worker drops the changed modules the same way
+        sys.modules.pop('test_b', None)
+        pipe_send_mock.reset_mock()
+        exitcode, _description, files = runner.recollect_tests(pytest_args)
+
+        assert exitcode == 0
+        assert files == ['test_a.py', 'test_b.py']
+        assert [
+            call[1]['item_id'] for call in pipe_send_mock.call_args_list
+            if call[0] == ('item_collected',)
+        ] == ['test_b.py::test_one', 'test_b.py::test_two']
+
+    @mock.patch.object(Runner, 'pipe_send')
+    def test_sharded_collection(self, pipe_send_mock):
+        """
+        Test whether runners collecting shards of the files report each test once
+        and save the whole collection into the cache together.
+        """
+        names = ['test_shard_{}.py'.format(index) for index in range(6)]
+        pytest_args, cache_path = self.make_project(
+            dict((name, 'def test_one():\n    pass\n') for name in names)
+        )
+
+        collected = []
+        for shard in range(2):
+            pipe_send_mock.reset_mock()
+            runner = PytestRunner(self.writer)
+            exitcode, _description = runner.init_tests(
+                pytest_args, collect_shard=(shard, 2, {'test_shard_0.py': 1})
+            )
+            assert exitcode == 0
+            collected.append([
+                call[1]['item_id'] for call in pipe_send_mock.call_args_list
+                if call[0] == ('item_collected',)
+            ])
+
+        assert 'test_shard_0.py::test_one' in collected[1]
+        assert sorted(collected[0] + collected[1]) == [name + '::test_one' for name in names]
+
+        cache = CollectionCache(cache_path)
+        assert cache.load() == [name + '::test_one' for name in names]
+
+    @mock.patch.object(Runner, 'pipe_send')
+    def test_imports_tracked(self, pipe_send_mock):
+        """
+        Test whether the project modules imported by the test files are recorded.
+        """
+        pytest_args, cache_path = self.make_project({
+            'tracked_helpers.py': 'VALUE = 1\n',
+            'test_tracked.py': (
+                'from tracked_helpers import VALUE\n'
+                'def test_one():\n'
+                '    assert VALUE\n'
+            ),
+        })
+        runner = PytestRunner(self.writer)
+        exitcode, _description = runner.init_tests(pytest_args, track_imports=True)
+        assert exitcode == 0
+
+        cache = CollectionCache(cache_path)
+        cache.load()
+        graph = ImportGraph(cache.get_import_graph())
+        assert 'test_tracked.py' in graph.get_affected(['tracked_helpers.py'])
+
+    @mock.patch.object(Runner, 'pipe_send')
+    def test_coverage_recorded(self, pipe_send_mock):
+        """
+        Test whether the lines run by every test, its shared fixtures included, are recorded.
+        """
+        pytest_args, _cache_path = self.make_project({
+            'test_covered.py': (
+                'import pytest\n'
+                '@pytest.fixture(scope="module")\n'
+                'def db():\n'
+                '    return 1\n'
+                'def test_a(db):\n'
+                '    assert db\n'
+                'def test_b(db):\n'
+                '    assert db\n'
+                'def test_c():\n'
+                '    pass\n'
+            ),
+        })
+        project_dir = pytest_args[-1]
+        coverage_path = os.path.join(project_dir, 'coverage.sqlite')
+        test_ids = ['test_covered.py::test_' + name for name in 'abc']
+
+        with mock.patch('pytui.runner.get_coverage_path', return_value=coverage_path):
+            runner = PytestRunner(self.writer)
+            exitcode, _description = runner.run_tests(False, None, pytest_args,
+                                                      record_coverage=True)
+        assert exitcode == 0
+
+        coverage_map = CoverageMap(coverage_path)
+        assert coverage_map.get_impacted(test_ids) == []
+        with open(os.path.join(project_dir, 'test_covered.py')) as test_file:
+            source = test_file.read()
+        with open(os.path.join(project_dir, 'test_covered.py'), 'w') as test_file:
+            test_file.write(source.replace('return 1', 'return 2'))
+        assert coverage_map.get_impacted(test_ids) == test_ids[:2]
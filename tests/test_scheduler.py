@@ -0,0 +1,75 @@
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+
+from unittest import TestCase
+
+from pytui.scheduler import Durations, schedule, split_tests
+
+
+class DurationsTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'cache', 'durations.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_save_load(self):
+        durations = Durations(self.path)
+        durations.load()
+        assert len(durations) == 0
+
+        durations.set('test_a', 1.5)
+        durations.save()
+
+        loaded = Durations(self.path)
+        loaded.load()
+        assert loaded.get('test_a') == 1.5
+
+
+class ScheduleTests(TestCase):
+    def test_split(self):
+        assert split_tests(['a', 'b', 'c', 'd', 'e'], 2) == [['a', 'b', 'c'], ['d', 'e']]
+        assert split_tests(['a'], 3) == [['a'], [], []]
+
+    def test_without_durations(self):
+        durations = Durations(None)
+        assert schedule(['a', 'b', 'c', 'd'], durations, 2) == [['a', 'b'], ['c', 'd']]
+
+    def test_longest_first(self):
+        durations = Durations(None)
+        for test_id, duration in [('a', 1), ('b', 1), ('c', 1), ('d', 1), ('e', 4)]:
+            durations.set(test_id, duration)
+
+        shards = schedule(['a', 'b', 'c', 'd', 'e'], durations, 2)
+        assert sorted(shards) == [['a', 'b', 'c', 'd'], ['e']]
+
+    def test_shared_fixture_grouping(self):
+        durations = Durations(None)
+        fixture_durations = Durations(None)
+        for test_id in ['a', 'b', 'c', 'd']:
+            durations.set(test_id, 1)
+        fixture_durations.set('db@test_db.py', 0.5)
+        fixtures = {'a': ['db@test_db.py'], 'b': ['db@test_db.py']}
+
+        # without the fixtures, a and b would be split between the workers
+        assert schedule(['a', 'c', 'd', 'b'], durations, 2) == [['a', 'd'], ['c', 'b']]
+        assert schedule(['a', 'c', 'd', 'b'], durations, 2, fixtures, fixture_durations) == [
+            ['a', 'b'], ['c', 'd']
+        ]
+
+    def test_grouping_within_fair_share(self):
+        durations = Durations(None)
+        fixture_durations = Durations(None)
+        for test_id in ['a', 'b', 'c', 'd']:
+            durations.set(test_id, 1)
+        fixture_durations.set('app@tests', 0.5)
+        fixtures = dict((test_id, ['app@tests']) for test_id in ['a', 'b', 'c', 'd'])
+
+        # a single unit would leave the second worker idle
+        shards = schedule(['a', 'b', 'c', 'd'], durations, 2, fixtures, fixture_durations)
+        assert [len(shard) for shard in shards] == [2, 2]
@@ -0,0 +1,85 @@
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from unittest import TestCase
+
+from pytui.runner import PytestRunner
+from pytui.ui import Store
+
+
+class StoreTests(TestCase):
+    def setUp(self):
+        ui = mock.Mock(runner_class=PytestRunner)
+        with mock.patch('pytui.ui.Durations'):
+            self.store = Store(ui)
+        self.store.items_cached(['test_a.py::test_{}'.format(index) for index in range(4)])
+
+    def set_result(self, test_id, result_state):
+        self.store.set_test_result(test_id, result_state, '', 'call', result_state)
+
+    def assert_stats(self):
+        """ Counters agree with the test list recomputed from the scratch. """
+        tests = self.store.current_test_list
+        stats = self.store.get_test_stats()
+        assert stats['total'] == len(self.store.test_data)
+        assert stats['filtered'] == len(tests)
+        assert stats['failed'] == len([
+            test for test in tests.values() if self.store.is_test_failed(test)
+        ])
+        return stats
+
+    def test_counters(self):
+        self.set_result('test_a.py::test_0', 'ok')
+        self.set_result('test_a.py::test_1', 'failed')
+        self.set_result('test_a.py::test_new', 'error')
+        assert self.assert_stats()['failed'] == 4
+
+        self.store.set_filter('test_1')
+        assert self.assert_stats()['filtered'] == 1
+
+        self.store.set_filter('')
+        self.store._show_collected = False
+        assert self.assert_stats()['filtered'] == 3
+
+        self.store._show_failed_only = True
+        assert self.assert_stats()['filtered'] == 2
+
+        self.store.clear_test_result('test_a.py::test_1')
+        assert self.assert_stats()['failed'] == 1
+
+    def test_eta(self):
+        self.store.durations.get_default.return_value = 1.0
+        self.store.durations.get.side_effect = lambda test_id, default: default
+        self.store.start_run({
+            1: ['test_a.py::test_0', 'test_a.py::test_1'],
+            2: ['test_a.py::test_2'],
+        })
+        assert self.store.get_eta() == 2.0
+
+        self.set_result('test_a.py::test_0', 'ok')
+        assert self.store.get_eta() == 1.0
+        self.store.finish_run(1)
+        self.store.finish_run(2)
+        assert self.store.get_eta() is None
+
+    def test_added_tests(self):
+        self.store.ui.reset_mock()
+        self.store.item_collected('test_a.py::test_0')
+        self.store.item_collected('test_b.py::test_0')
+        self.set_result('test_b.py::test_1', 'ok')
+        assert self.store.pop_added() == ['test_b.py::test_0', 'test_b.py::test_1']
+        assert self.store.pop_added() == []
+        assert not self.store.ui.init_test_listbox.called
+
+    def test_collection_order(self):
+        self.store.start_collection()
+        for index in [3, 1, 'new', 0, 2]:
+            self.store.item_collected('test_a.py::test_{}'.format(index))
+        test_order = ['test_a.py::test_{}'.format(index) for index in [0, 1, 'new', 2, 3]]
+        assert self.store.finish_collection(test_order)
+        assert list(self.store.test_data) == test_order
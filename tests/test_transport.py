@@ -0,0 +1,110 @@
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import random
+import select
+import threading
+
+import pytest
+
+from pytui.transport import FrameDecoder, FRAME_HEADER, SharedMemoryTransport, shared_memory
+
+
+def encode_frame(payload):
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+
+def feed_chunks(decoder, data, chunk_sizes):
+    frames = []
+    offset = 0
+    for size in chunk_sizes:
+        frames += [bytes(frame) for frame in decoder.feed(data[offset:offset + size])]
+        offset += size
+    frames += [bytes(frame) for frame in decoder.feed(data[offset:])]
+    return frames
+
+
+def test_decode_multiple_frames_in_single_chunk():
+    decoder = FrameDecoder()
+    frames = decoder.feed(encode_frame(b'first') + encode_frame(b'') + encode_frame(b'third'))
+    assert [bytes(frame) for frame in frames] == [b'first', b'', b'third']
+    assert len(decoder) == 0
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 5, 7, 4096])
+def test_decode_split_frames(chunk_size):
+    payloads = [b'a' * 10, b'b' * 1000, b'c', b'd' * 9000]
+    data = b''.join(encode_frame(payload) for payload in payloads)
+
+    decoder = FrameDecoder()
+    frames = feed_chunks(decoder, data, [chunk_size] * (len(data) // chunk_size))
+
+    assert frames == payloads
+    assert len(decoder) == 0
+
+
+def test_decode_large_payloads_random_chunks():
+    rnd = random.Random(42)
+    payloads = [bytes(bytearray(rnd.getrandbits(8) for _ in range(size)))
+                for size in (0, 1, 70000, 300000, 5)]
+    data = b''.join(encode_frame(payload) for payload in payloads)
+
+    decoder = FrameDecoder()
+    frames = feed_chunks(decoder, data, [rnd.randint(1, 20000) for _ in range(30)])
+
+    assert frames == payloads
+
+
+def test_frames_released_on_next_feed():
+    decoder = FrameDecoder()
+    frame = decoder.feed(encode_frame(b'payload'))[0]
+    assert bytes(frame) == b'payload'
+
+    decoder.feed(b'')
+    with pytest.raises(ValueError):
+        bytes(frame)
+
+
+def test_incomplete_frame_waits_for_data():
+    decoder = FrameDecoder()
+    data = encode_frame(b'x' * 100)
+    assert decoder.feed(data[:50]) == []
+    assert len(decoder) == 50
+    assert [bytes(frame) for frame in decoder.feed(data[50:])] == [b'x' * 100]
+
+
+@pytest.mark.skipif(shared_memory is None, reason='requires multiprocessing.shared_memory')
+def test_shared_memory_ring_wraps_around():
+    transport = SharedMemoryTransport(capacity=64)
+    try:
+        writer = transport.get_writer()
+        decoder = FrameDecoder()
+        received = []
+        for index in range(20):
+            payload = ('message %d' % index).encode('utf-8') * (index % 4 + 1)
+            writer.send(payload)
+            received += [bytes(frame) for frame in decoder.feed(transport.read())]
+            assert received[-1] == payload
+        assert len(received) == 20
+    finally:
+        transport.close()
+
+
+@pytest.mark.skipif(shared_memory is None, reason='requires multiprocessing.shared_memory')
+def test_shared_memory_ring_payload_larger_than_capacity():
+    transport = SharedMemoryTransport(capacity=1024)
+    payload = bytes(bytearray(range(256))) * 100
+    try:
+        writer = threading.Thread(target=transport.get_writer().send, args=(payload,))
+        writer.start()
+
+        decoder = FrameDecoder()
+        frames = []
+        while not frames:
+            select.select([transport.fileno()], [], [], 0.1)
+            frames = [bytes(frame) for frame in decoder.feed(transport.read())]
+        writer.join()
+
+        assert frames == [payload]
+    finally:
+        transport.close()
@@ -0,0 +1,99 @@
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+from unittest import TestCase
+
+import urwid
+
+from pytui.ui import TestListWalker, TestListBox, LINE_CACHE_SIZE
+
+
+class StateLine(urwid.Widget):
+    """ Line showing the current state of the test, like the test lines do. """
+    _sizing = frozenset(['flow'])
+
+    def __init__(self, test_id, states):
+        self.test_id = test_id
+        self.states = states
+
+    def rows(self, size, focus=False):
+        return 1
+
+    def render(self, size, focus=False):
+        (maxcol,) = size
+        text = '{} {}'.format(self.test_id, self.states.get(self.test_id, ''))
+        return urwid.TextCanvas([text.ljust(maxcol)[:maxcol].encode('utf-8')], maxcol=maxcol)
+
+
+class TestListWalkerTests(TestCase):
+    def setUp(self):
+        self.created = []
+        self.walker = TestListWalker(
+            ['test_{}'.format(index) for index in range(100000)],
+            self.make_line
+        )
+        self.listbox = TestListBox(self.walker)
+        self.states = {}
+
+    def make_line(self, test_id):
+        self.created.append(test_id)
+        return urwid.AttrMap(StateLine(test_id, self.states), None, focus_map='reversed')
+
+    def render_text(self):
+        canvas = self.listbox.render((40, 20), focus=True)
+        return [line.decode('utf-8').rstrip() for line in canvas.text]
+
+    def test_lines_created_for_viewport(self):
+        self.listbox.render((40, 20), focus=True)
+        assert len(self.created) <= 21
+        assert 'test_0' in self.created
+
+        for _page in range(100):
+            self.listbox.keypress((40, 20), 'page down')
+            self.listbox.render((40, 20), focus=True)
+        assert len(self.walker._lines) <= LINE_CACHE_SIZE
+        assert 'test_0' not in self.walker._lines
+        assert self.walker.get_focus()[1] > 1000
+
+    def test_set_test_ids(self):
+        self.walker.set_focus(50)
+        self.walker.set_test_ids(['test_{}'.format(index) for index in range(40, 60)], 'test_50')
+        assert self.walker.get_focus()[1] == 10
+
+        self.walker.set_test_ids(['test_1', 'test_2'], 'test_50')
+        assert self.walker.get_focus()[1] == 0
+
+    def test_extend(self):
+        assert self.walker.get_position('test_99999') == 99999
+        self.walker.extend(['test_new', 'test_newer'])
+        assert self.walker.get_position('test_newer') == 100001
+        assert self.walker.get_next(99999)[1] == 100000
+        assert self.walker.get_next(100001) == (None, None)
+
+    def test_visible_range(self):
+        self.listbox.render((40, 20), focus=True)
+        assert self.walker.visible_range == (0, 20)
+
+        self.listbox.keypress((40, 20), 'page down')
+        self.listbox.keypress((40, 20), 'page down')
+        self.listbox.render((40, 20), focus=True)
+        first, last = self.walker.visible_range
+        assert first > 0
+        assert last - first == 20
+
+    def test_line_out_of_view_redrawn_when_shown(self):
+        self.render_text()
+        self.states['test_5'] = 'passed'
+        self.walker.invalidate('test_5')
+        assert 'test_5 passed' in self.render_text()
+
+        self.listbox.set_focus(500)
+        self.listbox.set_focus_valign('top')
+        self.render_text()
+        self.states['test_5'] = 'failed'
+        self.walker.invalidate('test_5')
+        assert self.walker._stale == set(['test_5'])
+
+        self.listbox.set_focus(0)
+        assert 'test_5 failed' in self.render_text()
+        assert not self.walker._stale
@@ -0,0 +1,56 @@
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import os
+import time
+import shutil
+import tempfile
+
+import pytest
+
+from pytui.watcher import InotifyWatcher, PollingWatcher
+
+
+@pytest.fixture
+def tree():
+    root = tempfile.mkdtemp()
+    os.makedirs(os.path.join(root, 'tests', '__pycache__'))
+    with open(os.path.join(root, 'tests', 'test_a.py'), 'w') as test_file:
+        test_file.write('')
+    yield root
+    shutil.rmtree(root)
+
+
+def change_files(root):
+    # ignored changes
+    with open(os.path.join(root, 'tests', '__pycache__', 'test_a.pyc'), 'w') as pyc_file:
+        pyc_file.write('')
+    with open(os.path.join(root, 'tests', 'notes.txt'), 'w') as text_file:
+        text_file.write('')
+
+    with open(os.path.join(root, 'tests', 'test_a.py'), 'w') as test_file:
+        test_file.write('def test_a():\n    pass\n')
+    os.makedirs(os.path.join(root, 'tests', 'sub'))
+    with open(os.path.join(root, 'tests', 'sub', 'test_b.py'), 'w') as test_file:
+        test_file.write('')
+
+
+@pytest.mark.parametrize('watcher_class', [InotifyWatcher, PollingWatcher])
+def test_changes(tree, watcher_class):
+    try:
+        watcher = watcher_class(tree)
+    except OSError:
+        pytest.skip('inotify not available')
+
+    # polled modification times have to differ
+    time.sleep(0.01)
+    change_files(tree)
+    os.utime(os.path.join(tree, 'tests', 'test_a.py'), (time.time() + 1, time.time() + 1))
+    time.sleep(0.05)
+
+    assert sorted(watcher.read()) == [
+        os.path.join(tree, 'tests', 'sub', 'test_b.py'),
+        os.path.join(tree, 'tests', 'test_a.py'),
+    ]
+    assert watcher.read() == []
+    watcher.close()
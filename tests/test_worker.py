@@ -0,0 +1,238 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+import os
+import sys
+import time
+import select
+import shutil
+import tempfile
+
+from unittest import TestCase
+
+from pytui.worker import ModuleTracker, RunnerWorker, RunnerZygote, WorkerError
+from pytui.runner import PytestRunner
+from pytui.transport import PipeTransport, FrameDecoder
+from pytui.codec import get_decoder
+
+
+class ModuleTrackerTests(TestCase):
+    def setUp(self):
+        self.project_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.project_dir, 'pytui_tracked_module.py')
+        with open(self.filename, 'w') as module_file:
+            module_file.write('VALUE = 1\n')
+        sys.path.insert(0, self.project_dir)
+        import pytui_tracked_module  # noqa: F401
+        self.tracker = ModuleTracker(self.project_dir)
+        self.tracker.update()
+
+    def tearDown(self):
+        sys.path.remove(self.project_dir)
+        sys.modules.pop('pytui_tracked_module', None)
+        shutil.rmtree(self.project_dir)
+
+    def test_unchanged(self):
+        assert self.tracker.get_changed() == []
+        assert self.tracker.refresh()
+        assert 'pytui_tracked_module' in sys.modules
+
+    def test_changed_project_module_purged(self):
+        stat = os.stat(self.filename)
+        os.utime(self.filename, (stat.st_atime, stat.st_mtime + 10))
+
+        assert [name for name, _filename in self.tracker.get_changed()] == [
+            'pytui_tracked_module'
+        ]
+        assert self.tracker.refresh()
+        assert 'pytui_tracked_module' not in sys.modules
+        assert self.tracker.get_changed() == []
+
+    def test_changed_other_module(self):
+        stat = os.stat(self.filename)
+        os.utime(self.filename, (stat.st_atime, stat.st_mtime + 10))
+        self.tracker.project_dir = os.path.join(self.project_dir, 'elsewhere')
+
+        assert not self.tracker.refresh()
+
+
+SLOW_WARM_UP = 2
+
+
+def slow_warm_up(runner, pytest_args):
+    time.sleep(SLOW_WARM_UP)
+
+
+class RunnerWorkerTests(TestCase):
+    runner_class = RunnerWorker
+    test_module = 'test_projects/test_module_a/test_feat_1.py'
+    select_tests = [test_module + '::TestOutputCapturing::test_feat_1_case_1']
+
+    def setUp(self):
+        self.transport = PipeTransport()
+        self.frame_decoder = FrameDecoder()
+        self.message_decoder = get_decoder('binary')
+        self.blob_dir = tempfile.mkdtemp()
+        # the forked processes inherit the patch
+        cache_patch = mock.patch('pytui.runner.get_cache_path',
+                                 return_value=os.path.join(self.blob_dir, 'collection.json'))
+        cache_patch.start()
+        self.addCleanup(cache_patch.stop)
+        self.worker = self.runner_class(PytestRunner, self.transport, False, 'binary',
+                                        self.blob_dir)
+
+    def tearDown(self):
+        self.worker.stop()
+        self.transport.close()
+        shutil.rmtree(self.blob_dir)
+
+    def receive_until(self, last_method):
+        self.messages = []
+        methods = []
+        while last_method not in methods:
+            select.select([self.transport.fileno()], [], [], 10)
+            for frame in self.frame_decoder.feed(self.transport.read()):
+                messages = self.message_decoder.decode(frame)
+                self.messages += messages
+                methods += [method for method, _params in messages]
+        self.worker.command_finished()
+        return methods
+
+    def test_commands_run_in_single_process(self):
+        """
+        Test whether the collection and successive runs are executed by the same worker.
+        """
+        self.worker.init_tests(['test_projects/test_module_a/'])
+        assert self.worker.is_running()
+        methods = self.receive_until('init_finished')
+        assert 'item_collected' in methods
+        pid = self.worker.process.pid
+
+        for _run in range(2):
+            self.worker.run_tests(False, None, None, ['test_projects/test_module_a/'],
+                                  self.select_tests)
+            methods = self.receive_until('run_finished')
+            assert 'set_test_result' in methods
+            assert self.worker.process.pid == pid
+            assert self.worker.command_pid == pid
+
+    def test_recollect_after_run(self):
+        """
+        Test whether tests collected after a run are reported with their ids.
+        """
+        # the runner tests import their test_a and test_b here, the workers inherit them
+        project_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, project_dir)
+        with open(os.path.join(project_dir, 'test_recollected_a.py'), 'w') as test_file:
+            test_file.write('def test_one():\n    pass\n')
+        pytest_args = ['-p', 'no:cacheprovider', '--rootdir', project_dir, project_dir]
+
+        self.worker.init_tests(pytest_args)
+        self.receive_until('init_finished')
+        self.worker.run_tests(False, None, None, pytest_args, ['test_recollected_a.py::test_one'])
+        assert 'set_test_result' in self.receive_until('run_finished')
+
+        with open(os.path.join(project_dir, 'test_recollected_b.py'), 'w') as test_file:
+            test_file.write('def test_new():\n    pass\n')
+        self.worker.recollect_tests(pytest_args)
+        self.receive_until('recollect_finished')
+        assert [
+            params['item_id'] for method, params in self.messages if method == 'item_collected'
+        ] == ['test_recollected_b.py::test_new']
+
+    def test_rejected_command_fails(self):
+        """
+        Test whether a command rejected by the restarted worker fails.
+        """
+        with mock.patch.object(RunnerWorker, '_send', return_value=(None, None)):
+            with self.assertRaises(WorkerError):
+                self.worker.run_tests(False, None, None, ['test_projects/test_module_a/'],
+                                      self.select_tests)
+        assert not self.worker.is_running()
+
+
+class RunnerZygoteTests(RunnerWorkerTests):
+    runner_class = RunnerZygote
+
+    def test_commands_run_in_single_process(self):
+        """
+        Test whether every run is executed in a new process forked from the zygote.
+        """
+        self.worker.init_tests(['test_projects/test_module_a/'])
+        self.receive_until('init_finished')
+        zygote_pid = self.worker.process.pid
+
+        run_pids = set()
+        for _run in range(2):
+            self.worker.run_tests(False, None, None, ['test_projects/test_module_a/'],
+                                  self.select_tests)
+            assert 'set_test_result' in self.receive_until('run_finished')
+            assert self.worker.process.pid == zygote_pid
+            run_pids.add(self.worker.command_pid)
+
+        assert len(run_pids) == 2
+        assert zygote_pid not in run_pids
+
+    def test_rebuild_on_change(self):
+        """
+        Test whether the zygote is rebuilt when a test module changes.
+        """
+        self.worker.init_tests(['test_projects/test_module_a/'])
+        self.receive_until('init_finished')
+        zygote_pid = self.worker.process.pid
+
+        stat = os.stat(self.test_module)
+        # the zygote may record the stamps after init_finished, a change after the start
+        # of the command is detected
+        os.utime(self.test_module, None)
+        try:
+            self.worker.run_tests(False, None, None, ['test_projects/test_module_a/'],
+                                  self.select_tests)
+            assert 'set_test_result' in self.receive_until('run_finished')
+        finally:
+            os.utime(self.test_module, (stat.st_atime, stat.st_mtime))
+
+        assert self.worker.process.pid != zygote_pid
+
+    def test_rebuild_not_waited_for(self):
+        """
+        Test whether the run is queued by the rebuilt zygote, before its warm up.
+        """
+        self.worker.init_tests(['test_projects/test_module_a/'])
+        self.receive_until('init_finished')
+
+        stat = os.stat(self.test_module)
+        # the zygote may record the stamps after init_finished, a change after the start
+        # of the command is detected
+        os.utime(self.test_module, None)
+        try:
+            with mock.patch.object(PytestRunner, 'warm_up_command', slow_warm_up):
+                started = time.time()
+                self.worker.run_tests(False, None, None, ['test_projects/test_module_a/'],
+                                      self.select_tests)
+                assert time.time() - started < SLOW_WARM_UP
+                assert self.worker.is_running()
+                assert self.worker.get_command_pid() is None
+                assert 'set_test_result' in self.receive_until('run_finished')
+        finally:
+            os.utime(self.test_module, (stat.st_atime, stat.st_mtime))
+
+        assert self.worker.command_pid not in (None, self.worker.process.pid)
+
+    def test_shard_warmed_up(self):
+        """
+        Test whether the zygote collecting a shard imports all the tests before the next run.
+        """
+        with mock.patch.object(PytestRunner, 'warm_up_command', slow_warm_up):
+            # the test files unknown to the ui are split between the runners by their path
+            self.worker.init_tests(['test_projects/test_module_a/'], (1, 2, {}))
+            self.receive_until('init_finished')
+
+            self.worker.run_tests(False, None, None, ['test_projects/test_module_a/'],
+                                  self.select_tests)
+            assert self.worker.get_command_pid() is None
+            assert 'set_test_result' in self.receive_until('run_finished')